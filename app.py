@@ -1,26 +1,110 @@
 # app.py
+import importlib.util
 import sqlite3
-import pandas as pd
+import sys
+
+
+def lazy_module(name):
+    """
+    Returns module `name`, deferring its import until an attribute is first used (importlib's LazyLoader).
+    Workers and CLI commands that never touch it (e.g. /api/districts) don't pay its import time or memory.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+pd = lazy_module("pandas") # ~0.3s to import; only aggregates, forecasts and SQL-backed price history need it
 import numpy as np
 from datetime import datetime, timedelta, date as date_type
+from concurrent.futures import ProcessPoolExecutor
 from dateutil.relativedelta import relativedelta
-from flask import Flask, jsonify, request, render_template
-from flask_caching import Cache
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from flask import Flask, Response, g, has_app_context, has_request_context, jsonify, request, render_template
+from flask.json.provider import DefaultJSONProvider
+from flask_caching import Cache, cache_memoize_hit, cache_memoize_miss
+from werkzeug.utils import secure_filename
+import atexit
+import bisect
+import click
+import contextlib
+import csv
+import functools
+import hmac
+import io
+import itertools
+import json
 import logging
+import threading
+import time
 import warnings
 import pytz
 import os
+import shutil
+import subprocess
+import gc
+import gzip
+import hashlib
+import re
+import unicodedata
+
+try:
+    import brotli # Optional: without it compressed responses are offered as gzip only
+except ImportError:
+    brotli = None
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 warnings.filterwarnings("ignore", category=UserWarning, module='statsmodels')
 
 # --- Configuration ---
 CONFIG = {
-    "CACHE_TYPE": "SimpleCache",
+    # "FileSystemCache" (in CACHE_DIR) is shared by all gunicorn workers on the machine, so each entry is computed
+    # once and single-flight holds across workers; "RedisCache" (with CACHE_REDIS_URL) shares it across machines.
+    # "size_aware_cache.SizeAwareLRUCache" is an opt-in per-process cache bounded by CACHE_MAX_BYTES: faster hits,
+    # but every worker fills its own copy (memory x workers) and single-flight only holds within a worker.
+    "CACHE_TYPE": "FileSystemCache",
+    "CACHE_DIR": "flask_cache", # Only used by FileSystemCache
+    "CACHE_THRESHOLD": 20000, # Max FileSystemCache entries before old ones are pruned
+    "CACHE_MAX_BYTES": 256 * 1024 * 1024, # Per-worker memory budget of SizeAwareLRUCache; LRU entries are evicted past it
+    "CACHE_FLOAT32_DECIMALS": 2, # SizeAwareLRUCache keeps float64 data as float32 when it round-trips at this precision
     "CACHE_DEFAULT_TIMEOUT": 3600, # Cache results for 1 hour
+    "CACHE_ENABLE_SIGNALS": True, # Emit memoize hit/miss signals, counted in /metrics
+    "CACHE_LOCK_TIMEOUT": 120, # Max seconds a single-flight compute lock is held before it expires
+    "CACHE_LOCK_WAIT_TIMEOUT": 30, # Max seconds a caller waits for another caller's compute before computing itself
+    "CACHE_REFRESH_AHEAD_FRACTION": 0.1, # Hits in the last 10% of an entry's lifetime trigger a background refresh
     "NECC_PRICES_DB": "necc_prices.db", # Contains DailyPrices table
     "NEAREST_NECC_DB": "nearest_necc.db", # Contains district_necc_map, necc_top_districts, necc_city_coordinates
+    "FORECAST_STORE_DB": "forecast_store.db", # Precomputed forecasts, filled by `flask build-forecasts`
+    # Read connections are opened with mode=ro and pooled per worker process
+    "SQLITE_POOL_SIZE": 8, # Max idle connections kept per database
+    "SQLITE_MMAP_SIZE": 256 * 1024 * 1024, # PRAGMA mmap_size in bytes
+    "SQLITE_CACHE_SIZE_KB": 16 * 1024, # PRAGMA cache_size per connection
+    "SQLITE_IMMUTABLE_DBS": [], # DB keys opened with immutable=1; only for files nothing writes to while the app runs
+    "DATA_VERSION_CHECK_INTERVAL": 2, # Seconds a worker reuses the per-city data versions before re-reading them
+    "INGEST_BATCH_SIZE": 5000, # Rows per executemany batch in `flask ingest-prices` / POST /api/ingest
+    "INGEST_API_TOKEN": None, # Bearer token required by POST /api/ingest; None disables the endpoint
+    "NEAREST_MAX_K": 20, # Max NECC cities returned per point by /api/nearest
+    "NEAREST_BATCH_MAX_POINTS": 10000, # Max points per POST /api/nearest/batch request
+    "CHART_MAX_POINTS_LIMIT": 10000, # Largest ?max_points= accepted by /api/prices (downsampled chart series)
+    "COMPARE_MAX_CITIES": 100, # Max cities listed in one /api/compare request (?cities=all is always accepted)
+    "BATCH_PREDICT_MAX_CITIES": 100, # Max cities listed in one /api/predict/batch request ("all" is always accepted)
+    "SEARCH_DEFAULT_LIMIT": 10, # Results returned by /api/search without ?limit=
+    "SEARCH_MAX_LIMIT": 50, # Largest ?limit= accepted by /api/search
+    "SEARCH_MIN_SIMILARITY": 0.3, # Trigram similarity (0-1) a misspelled /api/search query needs to match a name
+    "LOCATION_RESOLVE_MIN_SIMILARITY": 0.5, # ...and a misspelled name in the predict/prices/averages routes
+    "SCHEMA_CHECK_ON_STARTUP": True, # Log EXPLAIN QUERY PLAN of the app's queries when started via `python app.py`
+    "HTTP_CACHE_ENABLED": True, # ETag/Last-Modified, 304s and cached (precompressed) bodies for the read endpoints
+    "HTTP_CACHE_MAX_AGE": 0, # Cache-Control max-age in seconds; 0 makes browsers/CDNs revalidate every time
+    "HTTP_COMPRESS_MIN_BYTES": 1024, # Smaller response bodies are sent uncompressed
+    "HTTP_GZIP_LEVEL": 9, # Bodies are compressed once per data version and coding, then served from the cache
+    "HTTP_BROTLI_QUALITY": 9, # 11 is ~20% smaller but ~20x slower, which the first request after an ingest pays
+    "PRICE_STORE_ENABLED": False, # Serve daily price history from the memory-mapped columnar store instead of SQL
+    "PRICE_STORE_DIR": "price_store", # Directory for the store's .npy files (one subdirectory per DB version)
+    "PRICE_STORE_DECIMALS": 2, # Prices are stored as float32 when they round-trip exactly at this precision
     "TIMEZONE": "Asia/Kolkata",
     "DATE_FORMAT": "%Y-%m-%d",
     # Min months of *monthly aggregated* data required for a stable monthly HW model
@@ -30,6 +114,17 @@ CONFIG = {
     "HW_TREND": "add",
     "HW_SEASONAL_MONTHLY": "mul", # Use multiplicative seasonality for monthly data
     "HW_SEASONAL_PERIODS_MONTHLY": 12, # Yearly seasonality for monthly data
+    # "statsmodels": one optimized ExponentialSmoothing fit per city. "numpy": all cities fitted together by
+    # a vectorized Holt-Winters grid search (much faster; compare with `flask compare-forecast-engines`).
+    "FORECAST_ENGINE": "statsmodels",
+    "NUMPY_HW_GRID_POINTS": 7, # Coarse grid points per smoothing parameter for the numpy engine (at least 2)
+    "NUMPY_HW_REFINE_ROUNDS": 4, # Rounds of local 3x3x3 grid refinement around each city's best parameters
+    "BATCH_FORECAST_MAX_WORKERS": None, # Per-worker process pool size for batch forecast fits (None = CPUs per web worker)
+    "BATCH_FORECAST_INLINE_MAX_CITIES": 4, # Fits of up to this many cities run in the calling process, not the pool
+    "BACKTEST_MAX_WORKERS": None, # Process pool size for `flask backtest` (None = os.cpu_count())
+    "PROFILING_ENABLED": False, # Allow ?profile=1 / X-Profile: 1 to sample-profile individual requests
+    "PROFILE_SAMPLE_INTERVAL": 0.005, # Seconds between stack samples
+    "PROFILE_DIR": "profiles", # Collapsed-stack (.folded) output of profiled requests
 }
 
 # --- Flask App Setup ---
@@ -39,21 +134,523 @@ cache = Cache(app)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# --- Instrumentation ---
+# timed_span() measures a hot-path stage (DB connect, SQL read, HW fit, dynamic averages, JSON encoding).
+# Each request reports its stages in a Server-Timing header, and every stage, request and memoized cache
+# lookup is aggregated into per-worker histograms/counters served at /metrics in Prometheus text format.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_LOCK = threading.Lock()
+_histograms = {} # (metric name, labels tuple) -> LatencyHistogram
+_counters = {} # (metric name, labels tuple) -> count
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram in the Prometheus style (bucket counts are made cumulative on export)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1) # Last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def observe_latency(metric_name, seconds, **labels):
+    key = (metric_name, tuple(sorted(labels.items())))
+    with METRICS_LOCK:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = LatencyHistogram()
+        histogram.observe(seconds)
+
+
+def increment_counter(metric_name, **labels):
+    key = (metric_name, tuple(sorted(labels.items())))
+    with METRICS_LOCK:
+        _counters[key] = _counters.get(key, 0) + 1
+
+
+@contextlib.contextmanager
+def timed_span(stage):
+    """Times a hot-path stage; usable as a context manager or a decorator."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe_latency("egg_stage_duration_seconds", elapsed, stage=stage)
+        if has_request_context():
+            spans = g.setdefault("timing_spans", {})
+            total, count = spans.get(stage, (0.0, 0))
+            spans[stage] = (total + elapsed, count + 1)
+
+
+def record_cache_lookup(function_name, result):
+    """Counts a memoized cache lookup ('hit' or 'miss') for /metrics and the request's Server-Timing."""
+    increment_counter("egg_cache_requests_total", function=function_name, result=result)
+    if has_request_context():
+        lookups = g.setdefault("cache_lookups", {"hit": 0, "miss": 0})
+        lookups[result] = lookups.get(result, 0) + 1
+
+
+@cache_memoize_hit.connect
+def _on_cache_memoize_hit(sender, f=None, **extra):
+    record_cache_lookup(getattr(f, "__name__", "unknown"), "hit")
+
+
+@cache_memoize_miss.connect
+def _on_cache_memoize_miss(sender, f=None, **extra):
+    record_cache_lookup(getattr(f, "__name__", "unknown"), "miss")
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Default JSON provider whose response() (used by jsonify) is recorded as the 'jsonify' stage."""
+
+    def response(self, *args, **kwargs):
+        with timed_span("jsonify"):
+            return super().response(*args, **kwargs)
+
+
+app.json = TimedJSONProvider(app)
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's stack every `interval` seconds from a background thread and counts
+    collapsed stacks ('outer;...;inner' -> samples), the input format of flame graph tools.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+@app.before_request
+def _start_request_instrumentation():
+    g.request_start_time = time.perf_counter()
+    profile_requested = request.args.get("profile") == "1" or request.headers.get("X-Profile") == "1"
+    if CONFIG["PROFILING_ENABLED"] and profile_requested:
+        g.profiler = SamplingProfiler(threading.get_ident(), CONFIG["PROFILE_SAMPLE_INTERVAL"]).start()
+
+
+@app.after_request
+def _finish_request_instrumentation(response):
+    start_time = g.pop("request_start_time", None)
+    if start_time is None:
+        return response
+    elapsed = time.perf_counter() - start_time
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    observe_latency("egg_http_request_duration_seconds", elapsed,
+                    route=route, method=request.method, status=str(response.status_code))
+
+    timings = [f"{stage};dur={total * 1000:.2f}" + (f';desc="{count} calls"' if count > 1 else "")
+               for stage, (total, count) in g.get("timing_spans", {}).items()]
+    lookups = g.get("cache_lookups")
+    if lookups:
+        timings.append(f'cache;desc="hit {lookups.get("hit", 0)}, miss {lookups.get("miss", 0)}"')
+    timings.append(f"total;dur={elapsed * 1000:.2f}")
+    response.headers["Server-Timing"] = ", ".join(timings)
+
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        stacks = profiler.stop()
+        os.makedirs(CONFIG["PROFILE_DIR"], exist_ok=True)
+        profile_path = os.path.join(
+            CONFIG["PROFILE_DIR"], f"{int(time.time() * 1000)}-{os.getpid()}-{request.endpoint or 'unmatched'}.folded")
+        with open(profile_path, "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+        response.headers["X-Profile-File"] = profile_path
+    return response
+
+
+def _format_labels(labels, **extra):
+    items = list(labels) + sorted(extra.items())
+    if not items:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in items]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus text exposition of this worker's latency histograms and cache counters."""
+    help_text = {
+        "egg_http_request_duration_seconds": "Request latency by route",
+        "egg_stage_duration_seconds": "Latency of instrumented hot-path stages",
+        "egg_cache_requests_total": "Memoized cache lookups by function and result",
+        "egg_cache_evictions_total": "Entries evicted from this worker's cache to stay within CACHE_MAX_BYTES",
+        "egg_cache_bytes": "Bytes held by this worker's cache",
+        "egg_cache_entries": "Entries held by this worker's cache",
+        "egg_cache_max_bytes": "Memory budget of this worker's cache (CACHE_MAX_BYTES)",
+    }
+    with METRICS_LOCK:
+        histograms = {key: (list(h.bucket_counts), h.total, h.count, h.buckets) for key, h in _histograms.items()}
+        counters = dict(_counters)
+    occupancy = get_cache_occupancy()
+    gauges = {}
+    if occupancy is not None:
+        counters[("egg_cache_evictions_total", ())] = occupancy["evictions"]
+        gauges = {"egg_cache_bytes": occupancy["bytes"], "egg_cache_entries": occupancy["entries"],
+                  "egg_cache_max_bytes": occupancy["max_bytes"]}
+
+    lines = []
+    for metric_name in sorted({name for name, _ in histograms}):
+        lines.append(f"# HELP {metric_name} {help_text.get(metric_name, metric_name)}")
+        lines.append(f"# TYPE {metric_name} histogram")
+        for (name, labels), (bucket_counts, total, count, buckets) in sorted(histograms.items()):
+            if name != metric_name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    for metric_name in sorted({name for name, _ in counters}):
+        lines.append(f"# HELP {metric_name} {help_text.get(metric_name, metric_name)}")
+        lines.append(f"# TYPE {metric_name} counter")
+        for (name, labels), value in sorted(counters.items()):
+            if name == metric_name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    for name, value in sorted(gauges.items()):
+        lines.append(f"# HELP {name} {help_text.get(name, name)}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+# --- Single-Flight Memoization ---
+# Wraps cache.memoize so that when an entry is missing only one caller (across threads, and across
+# workers when the cache backend is shared) computes it while the others wait for the result.
+# Entries that are hit close to expiry are recomputed in a background thread before they expire.
+# The cross-worker compute lock is a cache.add of a lock key, which is atomic on Redis/Memcached and,
+# for the in-memory backends, within the one process sharing the cache. FileSystemCache's add is a
+# check-then-set, so with it the lock is an O_EXCL lock file next to CACHE_DIR instead. Other shared
+# backends need an atomic add for single-flight to hold across workers.
+
+CACHE_STATS_LOCK = threading.Lock()
+CACHE_STATS = {"hits": 0, "misses": 0, "waits": 0, "wait_timeouts": 0, "background_refreshes": 0}
+_local_key_locks = {} # {cache_key: [lock, callers using it]}; entries are dropped by their last caller
+_local_key_locks_guard = threading.Lock()
+
+
+def _record_cache_stat(name):
+    with CACHE_STATS_LOCK:
+        CACHE_STATS[name] += 1
+
+
+@contextlib.contextmanager
+def _local_key_lock(cache_key):
+    """Holds this worker's lock for cache_key. Keys come from request arguments, so unused entries are removed."""
+    with _local_key_locks_guard:
+        entry = _local_key_locks.setdefault(cache_key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _local_key_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _local_key_locks[cache_key]
+
+
+def _lock_file_path(lock_key):
+    """Lock file of lock_key when the backend is FileSystemCache (whose add is not atomic), else None."""
+    if app.config["CACHE_TYPE"].rsplit(".", 1)[-1] != "FileSystemCache":
+        return None
+    # Beside CACHE_DIR, not in it: FileSystemCache treats every file in its directory as an entry
+    return os.path.join(app.config["CACHE_DIR"].rstrip("/\\") + "-locks", hashlib.sha1(lock_key.encode()).hexdigest())
+
+
+def _lock_file_is_stale(path):
+    try:
+        return time.time() - os.path.getmtime(path) > CONFIG["CACHE_LOCK_TIMEOUT"]
+    except OSError:
+        return False # Released meanwhile
+
+
+def acquire_compute_lock(lock_key):
+    """Takes the cross-worker lock for lock_key; False if another caller holds it. Expires after CACHE_LOCK_TIMEOUT."""
+    path = _lock_file_path(lock_key)
+    if path is None:
+        return cache.add(lock_key, os.getpid(), timeout=CONFIG["CACHE_LOCK_TIMEOUT"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for _ in range(2):
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            if not _lock_file_is_stale(path):
+                return False
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path) # Left by a holder that died; retry once
+    return False
+
+
+def compute_lock_held(lock_key):
+    path = _lock_file_path(lock_key)
+    if path is None:
+        return cache.has(lock_key)
+    return os.path.exists(path) and not _lock_file_is_stale(path)
+
+
+def release_compute_lock(lock_key):
+    path = _lock_file_path(lock_key)
+    if path is None:
+        cache.delete(lock_key)
+    else:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+def memoize_single_flight(timeout, version_func=None):
+    """
+    Drop-in replacement for @cache.memoize(timeout=...) with stampede protection and refresh-ahead.
+    version_func(*args, **kwargs), if given, is appended to the key: when it returns a new value
+    (e.g. the city's data version after an ingest) the old entry is simply never read again.
+    Without version_func the value is stored under the key memoize would use, so delete_memoized works
+    unchanged; otherwise delete the entry with cache.delete(f.versioned_cache_key(*args)).
+    """
+    def decorator(f):
+        memoized = cache.memoize(timeout=timeout)(f)
+
+        def make_versioned_cache_key(args, kwargs):
+            cache_key = memoized.make_cache_key(f, *args, **kwargs)
+            if version_func is not None:
+                cache_key += f":v{version_func(*args, **kwargs)}"
+            return cache_key
+
+        def compute_and_store(cache_key, args, kwargs):
+            value = f(*args, **kwargs)
+            cache.set(cache_key, value, timeout=timeout)
+            refresh_after = time.time() + timeout * (1 - CONFIG["CACHE_REFRESH_AHEAD_FRACTION"])
+            cache.set(f"{cache_key}:refresh_after", refresh_after, timeout=timeout)
+            return value
+
+        def refresh_in_background(cache_key, args, kwargs):
+            lock_key = f"{cache_key}:lock"
+            if not acquire_compute_lock(lock_key):
+                return # Another caller is already refreshing this entry
+            _record_cache_stat("background_refreshes")
+
+            def run():
+                try:
+                    with app.app_context():
+                        compute_and_store(cache_key, args, kwargs)
+                except Exception as e:
+                    logger.error(f"Background refresh of {f.__name__} failed: {e}")
+                finally:
+                    release_compute_lock(lock_key)
+
+            threading.Thread(target=run, name=f"cache-refresh-{f.__name__}", daemon=True).start()
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            cache_key = make_versioned_cache_key(args, kwargs)
+            value = cache.get(cache_key)
+            if value is not None:
+                _record_cache_stat("hits")
+                record_cache_lookup(f.__name__, "hit")
+                refresh_after = cache.get(f"{cache_key}:refresh_after")
+                if refresh_after is not None and time.time() >= refresh_after:
+                    refresh_in_background(cache_key, args, kwargs)
+                return value
+
+            _record_cache_stat("misses")
+            record_cache_lookup(f.__name__, "miss")
+            lock_key = f"{cache_key}:lock"
+            # The local lock serialises threads in this worker; cache.add serialises workers sharing the backend
+            with _local_key_lock(cache_key):
+                value = cache.get(cache_key)
+                if value is not None:
+                    _record_cache_stat("waits")
+                    return value
+                if acquire_compute_lock(lock_key):
+                    try:
+                        return compute_and_store(cache_key, args, kwargs)
+                    finally:
+                        release_compute_lock(lock_key)
+
+                # Another worker holds the lock: wait for its result instead of recomputing
+                _record_cache_stat("waits")
+                deadline = time.time() + CONFIG["CACHE_LOCK_WAIT_TIMEOUT"]
+                while time.time() < deadline:
+                    time.sleep(0.05)
+                    value = cache.get(cache_key)
+                    if value is not None:
+                        return value
+                    if not compute_lock_held(lock_key):
+                        break # Holder finished without storing a value (or died); compute ourselves
+                _record_cache_stat("wait_timeouts")
+                return compute_and_store(cache_key, args, kwargs)
+
+        wrapper.uncached = f
+        wrapper.make_cache_key = memoized.make_cache_key
+        wrapper.versioned_cache_key = lambda *args, **kwargs: make_versioned_cache_key(args, kwargs)
+        wrapper.memoized = memoized
+        return wrapper
+    return decorator
+
+
+def get_cache_occupancy():
+    """Size/eviction stats of the cache backend when it tracks them (SizeAwareLRUCache), else None."""
+    backend = cache.cache
+    return backend.occupancy() if hasattr(backend, "occupancy") else None
+
+
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    """Single-flight cache counters and backend occupancy for this worker process."""
+    with CACHE_STATS_LOCK:
+        stats = dict(CACHE_STATS)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else None
+    stats["cache_type"] = app.config["CACHE_TYPE"]
+    stats["occupancy"] = get_cache_occupancy()
+    stats["pid"] = os.getpid()
+    return jsonify(stats)
+
 # --- Database Helper Functions ---
-def get_db_connection(db_name_key):
+# Connections are opened read-only and pooled per worker process: close() hands the connection back
+# to the pool instead of closing it, so the existing get/close call pattern stays unchanged. Connections
+# an app context leaves open (e.g. when a query raised) are returned when the context tears down.
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() returns it to its pool (still a sqlite3.Connection for pandas)."""
+
+    pool_key = None
+    checked_out = False # Handed out by get_db_connection and not yet closed
+
+    def close(self):
+        if not self.checked_out:
+            return # Already back in its pool (or closed); closing twice must not close a pooled connection
+        self.checked_out = False
+        if self.in_transaction:
+            self.rollback()
+        if not _release_pooled_connection(self):
+            self.close_for_real()
+
+    def close_for_real(self):
+        super().close()
+
+
+_connection_pools = {} # db_name_key -> list of idle PooledConnection
+_connection_pools_lock = threading.Lock()
+_connection_pools_pid = os.getpid()
+
+
+def _open_read_only_connection(db_name_key):
     db_path = app.config[db_name_key]
-    if not os.path.exists(db_path):
-        logger.critical(f"Database file not found: {db_path}")
-        # Depending on deployment, you might want to raise an exception or handle this differently
-        raise FileNotFoundError(f"Database file not found: {db_path}")
-    conn = sqlite3.connect(db_path)
+    uri = f"file:{os.path.abspath(db_path)}?mode=ro"
+    if db_name_key in CONFIG["SQLITE_IMMUTABLE_DBS"]:
+        uri += "&immutable=1"
+    try:
+        conn = sqlite3.connect(uri, uri=True, factory=PooledConnection, check_same_thread=False)
+    except sqlite3.OperationalError:
+        if not os.path.exists(db_path):
+            logger.critical(f"Database file not found: {db_path}")
+            # Depending on deployment, you might want to raise an exception or handle this differently
+            raise FileNotFoundError(f"Database file not found: {db_path}")
+        raise
     conn.row_factory = sqlite3.Row
+    conn.pool_key = db_name_key
+    if db_name_key == "NECC_PRICES_DB":
+        register_price_functions(conn)
+    conn.execute(f"PRAGMA mmap_size = {int(CONFIG['SQLITE_MMAP_SIZE'])}")
+    conn.execute(f"PRAGMA cache_size = -{int(CONFIG['SQLITE_CACHE_SIZE_KB'])}")
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def _release_pooled_connection(conn):
+    """Puts conn back into its idle pool. Returns False if the pool is full and conn should be closed."""
+    with _connection_pools_lock:
+        if conn.pool_key is None or _connection_pools_pid != os.getpid():
+            return False
+        idle = _connection_pools.setdefault(conn.pool_key, [])
+        if len(idle) >= CONFIG["SQLITE_POOL_SIZE"] or conn in idle:
+            return False
+        idle.append(conn)
+        return True
+
+
+@timed_span("db_connect")
+def get_db_connection(db_name_key):
+    global _connection_pools_pid
+    with _connection_pools_lock:
+        if _connection_pools_pid != os.getpid():
+            # Forked worker: never share the parent's SQLite handles, just forget them
+            _connection_pools.clear()
+            _connection_pools_pid = os.getpid()
+        idle = _connection_pools.get(db_name_key)
+        conn = idle.pop() if idle else None
+    if conn is None:
+        conn = _open_read_only_connection(db_name_key)
+    conn.checked_out = True
+    if has_app_context():
+        # Remembered so release_db_connections can return it if the request never closes it
+        g.setdefault("db_connections", []).append(conn)
     return conn
 
+
+def close_db_connections():
+    """Closes every idle pooled connection (app shutdown, or after a database file has been replaced)."""
+    with _connection_pools_lock:
+        pools = list(_connection_pools.values()) if _connection_pools_pid == os.getpid() else []
+        _connection_pools.clear()
+    for idle in pools:
+        for conn in idle:
+            try:
+                conn.close_for_real()
+            except Exception as e:
+                logger.error(f"Error closing pooled database connection: {e}")
+
+
+@app.teardown_appcontext
+def release_db_connections(exception=None):
+    """Returns the connections this app context took from the pool and did not close (e.g. after an error)."""
+    for conn in g.pop("db_connections", ()):
+        conn.close() # No-op for connections the code already closed
+
+
+atexit.register(close_db_connections) # Final close of the idle connections when the process exits
+
 def get_associated_necc_city(district_name):
     """Fetches the NECC city associated with a given district."""
     if not district_name:
         return None, None
+    index = get_location_search_index() # Holds the whole district_necc_map; the query below is its fallback
+    if index is not None:
+        return index.associated_necc_city(district_name)
     try:
         conn = get_db_connection("NEAREST_NECC_DB")
         cursor = conn.cursor()
@@ -86,10 +683,592 @@ def get_city_coordinates_db(city_name):
         logger.error(f"Database error fetching coordinates for {city_name}: {e}")
         return None
 
+def get_necc_city_names():
+    """Every NECC city in necc_city_coordinates, sorted. Raises on database errors."""
+    conn = get_db_connection("NEAREST_NECC_DB")
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT city FROM necc_city_coordinates ORDER BY city")
+        return [row['city'] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+# --- Per-City Data Versions ---
+# CityDataVersion in necc_prices.db holds a counter per city that the ingest pipeline bumps whenever the
+# city's rows change. Cached entries that depend on a city carry its version in their key, so every worker
+# (whatever the cache backend) stops serving them as soon as it re-reads the versions. Rows written outside
+# the pipeline (e.g. by an external loader) are caught by a fingerprint of each city's rows, recomputed
+# whenever the signature of necc_prices.db changes, which is also part of the version. DerivedTableVersion
+# counts the full rebuilds of the tables `flask build-rollups` / `build-latest-prices` refresh in place.
+
+CITY_DATA_VERSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS CityDataVersion (
+    City TEXT PRIMARY KEY,
+    Version INTEGER NOT NULL,
+    UpdatedAt TEXT NOT NULL
+)
+"""
+
+DERIVED_TABLE_VERSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS DerivedTableVersion (
+    Name TEXT PRIMARY KEY,
+    Version INTEGER NOT NULL,
+    UpdatedAt TEXT NOT NULL
+)
+"""
+
+# Index-only over idx_dailyprices_city_date_price; a price correction changes the total
+CITY_PRICE_FINGERPRINTS_SQL = "SELECT City, COUNT(*) AS n, MAX(Date) AS last_date, TOTAL(Price) AS price_sum FROM DailyPrices GROUP BY City"
+
+_city_data_versions = {}
+_city_data_updated_at = {} # {city: UpdatedAt as an aware datetime}
+_city_price_fingerprints = {} # {city: short hash of its DailyPrices rows}
+_all_city_price_fingerprint = "0" # Short hash of every city's fingerprint
+_city_price_fingerprints_signature = None # get_prices_db_signature() the fingerprints were computed at
+_derived_table_versions = {} # {table name: rebuild count}
+_city_data_versions_checked_at = 0.0
+_city_data_versions_lock = threading.Lock()
+
+
+def get_city_data_versions(force=False):
+    """
+    Returns {city: version}, re-read at most every DATA_VERSION_CHECK_INTERVAL seconds. {} before any ingest.
+    Refreshes the per-city row fingerprints too when necc_prices.db has been written since they were computed.
+    """
+    global _city_data_versions, _city_data_updated_at, _city_data_versions_checked_at
+    global _city_price_fingerprints, _all_city_price_fingerprint, _city_price_fingerprints_signature
+    global _derived_table_versions
+    if not force and time.time() - _city_data_versions_checked_at < CONFIG["DATA_VERSION_CHECK_INTERVAL"]:
+        return _city_data_versions
+    with _city_data_versions_lock:
+        if not force and time.time() - _city_data_versions_checked_at < CONFIG["DATA_VERSION_CHECK_INTERVAL"]:
+            return _city_data_versions
+        try:
+            conn = get_db_connection("NECC_PRICES_DB")
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                               "AND name IN ('CityDataVersion', 'DerivedTableVersion')")
+                tables = {row['name'] for row in cursor.fetchall()}
+                rows = []
+                if 'CityDataVersion' in tables:
+                    cursor.execute("SELECT City, Version, UpdatedAt FROM CityDataVersion")
+                    rows = cursor.fetchall()
+                derived_versions = {}
+                if 'DerivedTableVersion' in tables:
+                    cursor.execute("SELECT Name, Version FROM DerivedTableVersion")
+                    derived_versions = {row['Name']: row['Version'] for row in cursor.fetchall()}
+                # Stat before reading: a write in between only means one more recomputation next time
+                prices_db_signature = get_prices_db_signature()[0]
+                if prices_db_signature != _city_price_fingerprints_signature:
+                    cursor.execute(CITY_PRICE_FINGERPRINTS_SQL)
+                    _city_price_fingerprints = {
+                        row['City']: hashlib.sha1(f"{row['n']}|{row['last_date']}|{row['price_sum']!r}".encode()).hexdigest()[:8]
+                        for row in cursor.fetchall()}
+                    _all_city_price_fingerprint = hashlib.sha1(
+                        json.dumps(_city_price_fingerprints, sort_keys=True).encode()).hexdigest()[:8]
+                    _city_price_fingerprints_signature = prices_db_signature
+            finally:
+                conn.close()
+            _city_data_updated_at = {row['City']: datetime.fromisoformat(row['UpdatedAt']) for row in rows}
+            _city_data_versions = {row['City']: row['Version'] for row in rows}
+            _derived_table_versions = derived_versions
+        except Exception as e:
+            logger.error(f"Error reading city data versions: {e}")
+        _city_data_versions_checked_at = time.time()
+        return _city_data_versions
+
+
+def city_data_version(city_name, *args, **kwargs):
+    """memoize_single_flight version_func for functions whose first argument is an NECC city."""
+    versions = get_city_data_versions()
+    return f"{versions.get(city_name, 0)}-{_city_price_fingerprints.get(city_name, 0)}"
+
+
+def location_data_version(type, location_name, *args, **kwargs):
+    """
+    version_func for the (type, location_name) endpoints: a district follows its NECC city and the district
+    map. Includes derived_tables_version, as these endpoints read LatestPrices and MonthlyPriceRollup.
+    """
+    if type == 'district':
+        necc_city, _ = get_associated_necc_city(location_name)
+        return f"{mapping_data_version()}-{city_derived_data_version(necc_city or location_name)}"
+    return city_derived_data_version(location_name)
+
+
+def mapping_data_version(*args, **kwargs):
+    """version_func for entries built from nearest_necc.db (district map, city coordinates)."""
+    return get_mapping_data_signature()[0]
+
+
+def derived_tables_version(*args, **kwargs):
+    """
+    How often `flask build-rollups` / `build-latest-prices` have rebuilt MonthlyPriceRollup and LatestPrices.
+    The ingest pipeline refreshes the rows of the cities it changes, which their own versions cover.
+    """
+    get_city_data_versions()
+    return sum(_derived_table_versions.values())
+
+
+def city_derived_data_version(city_name, *args, **kwargs):
+    """version_func for a city's entries read from LatestPrices or MonthlyPriceRollup."""
+    return f"{city_data_version(city_name)}-{derived_tables_version()}"
+
+
+def bump_derived_table_version(conn, table_name):
+    """Records a rebuild of table_name on a writable necc_prices.db connection (see derived_tables_version)."""
+    conn.execute(DERIVED_TABLE_VERSION_SCHEMA)
+    updated_at = datetime.now(pytz.timezone(CONFIG['TIMEZONE'])).isoformat(timespec='seconds')
+    with conn:
+        conn.execute("INSERT INTO DerivedTableVersion (Name, Version, UpdatedAt) VALUES (?, 1, ?) "
+                     "ON CONFLICT(Name) DO UPDATE SET Version = Version + 1, UpdatedAt = excluded.UpdatedAt",
+                     (table_name, updated_at))
+
+
+def cities_data_version(city_names, *args, **kwargs):
+    """version_func for functions whose first argument is a sequence of NECC cities."""
+    versions = get_city_data_versions()
+    return ",".join(f"{versions.get(city_name, 0)}-{_city_price_fingerprints.get(city_name, 0)}" for city_name in city_names)
+
+
+def global_data_version(*args, **kwargs):
+    """version_func for entries covering every city; changes whenever any city's version does."""
+    return f"{sum(get_city_data_versions().values())}-{_all_city_price_fingerprint}"
+
+
+def all_cities_derived_data_version(*args, **kwargs):
+    """version_func for entries covering every city's row of LatestPrices or MonthlyPriceRollup."""
+    return f"{global_data_version()}-{derived_tables_version()}"
+
+
+def all_locations_data_version(*args, **kwargs):
+    """version_func for entries covering every city's coordinates and latest price."""
+    return f"{mapping_data_version()}-{all_cities_derived_data_version()}"
+
+
+def city_data_updated_at(city_name=None):
+    """
+    When the city's rows (any city's, if None) last changed through the ingest pipeline; None if never.
+    Writes from outside the pipeline are not dated here (see get_response_validators).
+    """
+    get_city_data_versions()
+    if city_name is None:
+        return max(_city_data_updated_at.values(), default=None)
+    return _city_data_updated_at.get(city_name)
+
+# --- HTTP Conditional Responses ---
+# GET responses of the read endpoints below carry an ETag computed from the data versions they are built
+# from, so a client or CDN revalidating with If-None-Match (or If-Modified-Since) gets a 304 before the view
+# runs. Each 200 body is also cached under its ETag once per content coding (br, gzip or identity): repeat
+# requests from other clients are answered from that entry without running the view or compressing again.
+# Data versions follow DailyPrices whoever writes it; the district map is covered by the signature of
+# nearest_necc.db and the tables CLI commands rebuild in place by derived_tables_version, like the memoized
+# entries keyed on them.
+
+HTTP_CACHED_ENDPOINTS = {
+    # endpoint -> what its response depends on
+    "get_all_predictions": "forecast",
+    "get_prices": "location",
+    "get_averages": "location",
+    "get_necc_cities": "mapping",
+    "get_districts": "mapping",
+    "get_nearby_districts": "mapping",
+    "get_necc_cities_locations_prices": "all_cities",
+    "get_comparison": "compare",
+}
+# Endpoints that also read tables rebuilt in place by CLI commands (see derived_tables_version)
+DERIVED_TABLE_ENDPOINTS = {"get_all_predictions", "get_averages", "get_necc_cities_locations_prices"}
+
+
+def get_mapping_data_signature():
+    """(signature, modified datetime) of nearest_necc.db, the district map and city coordinates."""
+    stat = os.stat(CONFIG["NEAREST_NECC_DB"])
+    return f"{stat.st_size}-{stat.st_mtime_ns}", datetime.fromtimestamp(stat.st_mtime, pytz.utc)
+
+
+def get_response_validators(endpoint, view_args):
+    """
+    (ETag, Last-Modified) for a GET of a HTTP_CACHED_ENDPOINTS endpoint. The ETag also covers the path and
+    query string; Last-Modified is None unless every input has a known modification time.
+    """
+    dependency = HTTP_CACHED_ENDPOINTS[endpoint]
+    parts = [endpoint, sorted(view_args.items()), sorted(request.args.items(multi=True))]
+    modified = []
+    location_type = view_args.get("type")
+    compares_all = dependency == "compare" and request.args.get("cities", "").strip().lower() == "all"
+    if dependency == "mapping" or dependency == "all_cities" or location_type == "district" or compares_all:
+        mapping_signature, mapping_modified = get_mapping_data_signature()
+        parts.append(mapping_signature)
+        modified.append(mapping_modified)
+    if dependency != "mapping":
+        # Rows an external loader writes move the data versions but not their UpdatedAt; the file's
+        # modification time bounds every change to necc_prices.db
+        modified.append(get_prices_db_signature()[1])
+    if dependency == "all_cities":
+        parts.append(global_data_version())
+        modified.append(city_data_updated_at())
+    elif dependency in ("location", "forecast"):
+        city_name = view_args.get("location_name")
+        if location_type == "district":
+            city_name = get_associated_necc_city(city_name)[0] or city_name
+        parts.append(city_data_version(city_name))
+        modified.append(city_data_updated_at(city_name))
+    elif dependency == "compare":
+        try:
+            city_names = get_compare_city_names()
+        except ValueError:
+            city_names = [] # The view answers 400, which is never cached
+        parts.append(cities_data_version(city_names))
+        modified.extend(city_data_updated_at(city_name) for city_name in city_names)
+    if endpoint in DERIVED_TABLE_ENDPOINTS:
+        parts.append(derived_tables_version())
+    if dependency in ("forecast", "compare"):
+        # Forecasts are trained up to the end of the previous year and indexed from the current date
+        current_system_date = datetime.now(pytz.timezone(CONFIG['TIMEZONE'])).date()
+        parts.extend([current_system_date.isoformat(), get_forecast_model_config_key()])
+        modified.append(pytz.timezone(CONFIG['TIMEZONE']).localize(
+            datetime.combine(current_system_date, datetime.min.time())))
+    etag = hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:20]
+    last_modified = max(modified) if modified and all(m is not None for m in modified) else None
+    return etag, last_modified
+
+
+def choose_content_coding():
+    """The client's preferred coding among those offered for cached bodies ('br', 'gzip' or 'identity')."""
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return request.accept_encodings.best_match(offered, default="identity")
+
+
+def compress_body(body, coding):
+    if coding == "br":
+        return brotli.compress(body, quality=CONFIG["HTTP_BROTLI_QUALITY"])
+    if coding == "gzip":
+        return gzip.compress(body, compresslevel=CONFIG["HTTP_GZIP_LEVEL"], mtime=0)
+    return body
+
+
+def representation_etag(etag, coding):
+    # One ETag per representation: the compressed and identity bodies are different byte sequences
+    return etag if coding == "identity" else f"{etag}-{coding}"
+
+
+def set_cache_headers(response, etag, last_modified, coding):
+    response.set_etag(representation_etag(etag, coding))
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = CONFIG["HTTP_CACHE_MAX_AGE"]
+    response.vary.add("Accept-Encoding")
+
+
+def is_not_modified(etag, last_modified):
+    """Coding of the representation the client already holds, or None if it has to be sent."""
+    if request.if_none_match:
+        # Weak comparison, as for any If-None-Match: a CDN may have weakened the tag while recompressing
+        return next((coding for coding in ("identity", "br", "gzip")
+                     if request.if_none_match.contains_weak(representation_etag(etag, coding))), None)
+    if request.if_modified_since and last_modified is not None:
+        if last_modified.replace(microsecond=0) <= request.if_modified_since:
+            return choose_content_coding()
+    return None
+
+
+@app.before_request
+def _answer_conditional_request():
+    """Answers with a 304 or a cached body when possible; otherwise lets the view run and remembers the ETag."""
+    if (not CONFIG["HTTP_CACHE_ENABLED"] or request.method not in ("GET", "HEAD")
+            or request.endpoint not in HTTP_CACHED_ENDPOINTS or "profiler" in g):
+        return None
+    try:
+        etag, last_modified = get_response_validators(request.endpoint, request.view_args or {})
+    except Exception as e:
+        logger.error(f"Could not compute ETag for {request.path}: {e}")
+        return None
+
+    held_coding = is_not_modified(etag, last_modified)
+    if held_coding is not None:
+        response = Response(status=304)
+        set_cache_headers(response, etag, last_modified, held_coding)
+        return response
+
+    coding = choose_content_coding()
+    cached = cache.get(f"http_body:{etag}:{coding}")
+    record_cache_lookup("http_body", "miss" if cached is None else "hit")
+    if cached is not None:
+        body, mimetype, body_coding = cached
+        response = Response(body, mimetype=mimetype)
+        if body_coding != "identity":
+            response.headers["Content-Encoding"] = body_coding
+        set_cache_headers(response, etag, last_modified, body_coding)
+        return response
+    g.http_cache = (etag, last_modified, coding)
+    return None
+
+
+@app.after_request
+def _store_cacheable_response(response):
+    """Compresses and caches the body of a view that _answer_conditional_request let run."""
+    http_cache = g.pop("http_cache", None)
+    if http_cache is None or response.status_code != 200 or response.is_streamed:
+        return response
+    if "Content-Encoding" in response.headers:
+        return response
+    etag, last_modified, requested_coding = http_cache
+    body = response.get_data()
+    coding = requested_coding if len(body) >= CONFIG["HTTP_COMPRESS_MIN_BYTES"] else "identity"
+    if coding != "identity":
+        body = compress_body(body, coding)
+        response.set_data(body)
+        response.headers["Content-Encoding"] = coding
+    # Stored under the requested coding, so clients asking for it find small identity bodies too
+    cache.set(f"http_body:{etag}:{requested_coding}", (body, response.mimetype, coding),
+              timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"])
+    set_cache_headers(response, etag, last_modified, coding)
+    return response
+
+
+# --- Columnar Price Store (optional) ---
+# When PRICE_STORE_ENABLED is set, all of DailyPrices is loaded once into compact NumPy arrays
+# (int32 day ordinals since 1970-01-01, float32 prices, per-city offsets) saved as .npy files and
+# opened with mmap_mode='r', so every worker on the machine shares the same pages.
+# Range lookups are a binary search over one city's slice, with no SQL or date parsing.
+
+class PriceStore:
+    """Read-only columnar copy of DailyPrices, sorted by city then date."""
+
+    def __init__(self, cities, offsets, days, prices, decimals=None):
+        self.cities = list(cities)
+        self.offsets = offsets
+        self.days = days
+        self.prices = prices
+        self.decimals = decimals
+        self.city_index = {city: i for i, city in enumerate(self.cities)}
+
+    def __len__(self):
+        return len(self.days)
+
+    @classmethod
+    def from_db(cls, db_path):
+        """Builds the arrays from DailyPrices with one ordered scan."""
+        conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+        try:
+            df = pd.read_sql_query("SELECT City, Date, Price FROM DailyPrices ORDER BY City ASC, Date ASC", conn)
+        finally:
+            conn.close()
+        # Same cleaning as get_historical_daily_prices_df: day precision, numeric prices only
+        df['Date'] = pd.to_datetime(df['Date'], errors='coerce').dt.normalize()
+        df['Price'] = pd.to_numeric(df['Price'], errors='coerce')
+        df.dropna(subset=['Date', 'Price'], inplace=True)
+        df.sort_values(['City', 'Date'], kind='stable', inplace=True)
+
+        city_codes, cities = pd.factorize(df['City'], sort=True)
+        offsets = np.zeros(len(cities) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(city_codes, minlength=len(cities)), out=offsets[1:])
+        days = df['Date'].values.astype('datetime64[D]').astype(np.int32)
+
+        # float32 halves the footprint; only use it when prices survive the round trip at PRICE_STORE_DECIMALS
+        prices64 = df['Price'].to_numpy(dtype=np.float64)
+        decimals = CONFIG["PRICE_STORE_DECIMALS"]
+        prices32 = prices64.astype(np.float32)
+        if np.array_equal(np.round(prices32.astype(np.float64), decimals), prices64):
+            return cls(cities, offsets, days, prices32, decimals)
+        logger.warning("Prices have more precision than PRICE_STORE_DECIMALS; price store keeps float64.")
+        return cls(cities, offsets, days, prices64)
+
+    def save(self, path):
+        """Writes the store to directory path atomically (a concurrent writer of the same path wins)."""
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        np.save(os.path.join(tmp_path, "offsets.npy"), self.offsets)
+        np.save(os.path.join(tmp_path, "days.npy"), self.days)
+        np.save(os.path.join(tmp_path, "prices.npy"), self.prices)
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"cities": self.cities, "decimals": self.decimals}, f)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        return cls(meta["cities"],
+                   np.load(os.path.join(path, "offsets.npy")),
+                   np.load(os.path.join(path, "days.npy"), mmap_mode='r'),
+                   np.load(os.path.join(path, "prices.npy"), mmap_mode='r'),
+                   meta["decimals"])
+
+    def city_slice(self, city_name, start_day=None, end_day=None):
+        """Returns (days, prices) views for city_name with start_day <= day <= end_day (ordinals, inclusive)."""
+        i = self.city_index.get(city_name)
+        if i is None:
+            return self.days[:0], self.prices[:0]
+        lo, hi = int(self.offsets[i]), int(self.offsets[i + 1])
+        city_days = self.days[lo:hi]
+        start = 0 if start_day is None else int(np.searchsorted(city_days, start_day, side='left'))
+        end = len(city_days) if end_day is None else int(np.searchsorted(city_days, end_day, side='right'))
+        return city_days[start:end], self.prices[lo + start:lo + end]
+
+    def city_prices(self, city_name, start_day=None, end_day=None):
+        """Like city_slice, but with prices as float64 restored to their stored precision."""
+        days, prices = self.city_slice(city_name, start_day, end_day)
+        prices = np.asarray(prices, dtype=np.float64)
+        if self.decimals is not None:
+            prices = np.round(prices, self.decimals)
+        return days, prices
+
+    def city_frame(self, city_name, start_day=None, end_day=None):
+        """DataFrame shaped like get_historical_daily_prices_df's result (DatetimeIndex 'Date', column 'Price')."""
+        return price_history_frame(*self.city_prices(city_name, start_day, end_day))
+
+
+_price_store = None
+_price_store_signature = None # get_price_store_signature() of the database the loaded store was built from
+_price_store_lock = threading.Lock()
+
+
+def date_str_to_day_ordinal(date_str):
+    """'YYYY-MM-DD' -> days since 1970-01-01 (the PriceStore day ordinal). Raises ValueError if malformed."""
+    return (date_type.fromisoformat(date_str[:10]) - date_type(1970, 1, 1)).days
+
+
+def get_prices_db_signature():
+    """(signature, modified datetime) of necc_prices.db and its WAL; any committed write changes the signature."""
+    stat = os.stat(CONFIG["NECC_PRICES_DB"])
+    wal_path = CONFIG["NECC_PRICES_DB"] + "-wal"
+    wal_stat = os.stat(wal_path) if os.path.exists(wal_path) else None
+    signature = f"{stat.st_size}-{stat.st_mtime_ns}"
+    mtime = stat.st_mtime
+    if wal_stat:
+        signature += f"-{wal_stat.st_size}-{wal_stat.st_mtime_ns}"
+        mtime = max(mtime, wal_stat.st_mtime)
+    return signature, datetime.fromtimestamp(mtime, pytz.utc)
+
+
+def get_price_store_signature():
+    """Identifies the current necc_prices.db contents; a new signature means the store must be rebuilt."""
+    return get_prices_db_signature()[0]
+
+
+def get_price_store(rebuild=False):
+    """
+    Returns the shared PriceStore, or None when PRICE_STORE_ENABLED is off or it cannot be loaded.
+    The arrays are loaded from PRICE_STORE_DIR if they match the database, otherwise rebuilt.
+    The database signature (two stat calls) is checked on every call, so rows written by an ingest
+    are never served from a store built before it.
+    """
+    global _price_store, _price_store_signature
+    if not CONFIG["PRICE_STORE_ENABLED"]:
+        return None
+    try:
+        signature = get_price_store_signature()
+    except OSError as e:
+        logger.error(f"Could not stat {CONFIG['NECC_PRICES_DB']} for the price store: {e}")
+        return None
+    if _price_store is not None and not rebuild and _price_store_signature == signature:
+        return _price_store
+    with _price_store_lock:
+        if _price_store is not None and not rebuild and _price_store_signature == signature:
+            return _price_store
+        _price_store_signature = signature
+        try:
+            store_path = os.path.join(CONFIG["PRICE_STORE_DIR"], signature)
+            if rebuild or not os.path.exists(os.path.join(store_path, "meta.json")):
+                logger.info(f"Building columnar price store at {store_path}.")
+                os.makedirs(CONFIG["PRICE_STORE_DIR"], exist_ok=True)
+                PriceStore.from_db(CONFIG["NECC_PRICES_DB"]).save(store_path)
+                # Drop stores built from older DB versions (workers still mapping them keep their pages)
+                for entry in os.listdir(CONFIG["PRICE_STORE_DIR"]):
+                    old_path = os.path.join(CONFIG["PRICE_STORE_DIR"], entry)
+                    if old_path != store_path and ".tmp-" not in entry:
+                        shutil.rmtree(old_path, ignore_errors=True)
+            _price_store = PriceStore.load(store_path)
+            logger.info(f"Price store loaded: {len(_price_store)} rows for {len(_price_store.cities)} cities.")
+        except Exception as e:
+            logger.error(f"Could not load columnar price store, falling back to SQL: {e}")
+            _price_store = None
+        return _price_store
+
+
+@app.cli.command("build-price-store")
+def build_price_store_command():
+    """Build the memory-mapped columnar price store from DailyPrices."""
+    CONFIG["PRICE_STORE_ENABLED"] = True
+    store = get_price_store(rebuild=True)
+    if store is None:
+        raise click.ClickException("Price store build failed, see log.")
+    click.echo(f"Price store built: {len(store)} rows for {len(store.cities)} cities.")
+
+
 # --- Core Data Fetching & Processing (with Caching) ---
+# Daily prices are cached once per city as the full sorted history (day ordinals + prices). Any date range
+# is answered by binary-searching that history, so ranges never add cache entries or hit the database.
+
+def price_history_frame(days, prices):
+    """DataFrame shaped like get_historical_daily_prices_df's result (DatetimeIndex 'Date', column 'Price')."""
+    if len(days) == 0:
+        return pd.DataFrame(columns=['Date', 'Price'])
+    index = pd.DatetimeIndex(np.asarray(days).astype('datetime64[D]').astype('datetime64[ns]'), name='Date')
+    return pd.DataFrame({'Price': prices}, index=index)
+
+
+def slice_price_history(history, start_day=None, end_day=None):
+    """(days, prices) of history with start_day <= day <= end_day (inclusive ordinals), by binary search."""
+    days, prices = history
+    start = 0 if start_day is None else int(np.searchsorted(days, start_day, side='left'))
+    end = len(days) if end_day is None else int(np.searchsorted(days, end_day, side='right'))
+    return days[start:end], prices[start:end]
+
+
+@memoize_single_flight(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"], version_func=city_data_version)
+def get_city_price_history(city_name):
+    """
+    Full daily price history of a city as (int32 day ordinals, float64 prices), sorted by date.
+    Rows whose price is not numeric are dropped. Empty arrays if the city has no data.
+    """
+    store = get_price_store()
+    if store is not None:
+        days, prices = store.city_prices(city_name)
+        return np.array(days, dtype=np.int32), prices
+
+    logger.info(f"Fetching full DAILY price history for {city_name} from DB.")
+    conn = get_db_connection("NECC_PRICES_DB")
+    try:
+        with timed_span("sql_read"):
+            df = pd.read_sql_query("SELECT Date, Price FROM DailyPrices WHERE City = ? ORDER BY Date ASC",
+                                   conn, params=[city_name])
+    finally:
+        conn.close()
+    df['Date'] = pd.to_datetime(df['Date']).dt.normalize()
+    df['Price'] = pd.to_numeric(df['Price'], errors='coerce')
+    df.dropna(subset=['Price'], inplace=True)
+    days = df['Date'].to_numpy(dtype='datetime64[D]').astype(np.int32)
+    return days, df['Price'].to_numpy(dtype=np.float64)
+
+
+def get_city_price_range(city_name, start_date_str=None, end_date_str=None):
+    """
+    (days, prices) of a city between two 'YYYY-MM-DD' dates (inclusive, either may be None), sliced
+    from the cached history. Raises ValueError for malformed dates.
+    """
+    start_day = date_str_to_day_ordinal(start_date_str) if start_date_str else None
+    end_day = date_str_to_day_ordinal(end_date_str) if end_date_str else None
+    return slice_price_history(get_city_price_history(city_name), start_day, end_day)
+
 
-@cache.memoize(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"])
 def get_historical_daily_prices_df(city_name, start_date_str=None, end_date_str=None):
+    try:
+        days, prices = get_city_price_range(city_name, start_date_str, end_date_str)
+        if len(days) == 0:
+            logger.warning(f"No historical daily prices found for {city_name} for dates {start_date_str} to {end_date_str}.")
+        return price_history_frame(days, prices)
+    except ValueError:
+        pass # Malformed date strings: let SQL compare them as before
+    except Exception as e:
+        logger.error(f"Database error fetching daily prices for {city_name}: {e}")
+        return pd.DataFrame(columns=['Date', 'Price'])
+
     logger.info(f"Fetching historical DAILY prices for {city_name} from DB. Dates: {start_date_str} to {end_date_str}")
     try:
         conn = get_db_connection("NECC_PRICES_DB")
@@ -103,7 +1282,8 @@ def get_historical_daily_prices_df(city_name, start_date_str=None, end_date_str=
             params.append(end_date_str)
         query += " ORDER BY Date ASC"
 
-        df = pd.read_sql_query(query, conn, params=params)
+        with timed_span("sql_read"):
+            df = pd.read_sql_query(query, conn, params=params)
         conn.close()
 
         if df.empty:
@@ -127,7 +1307,7 @@ def get_historical_daily_prices_df(city_name, start_date_str=None, end_date_str=
 
 
 # Helper to get historical monthly averages up to a specific date
-@cache.memoize(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"])
+@memoize_single_flight(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"], version_func=city_data_version)
 def get_historical_monthly_avg_up_to_date_df(city_name, end_date):
     """
     Calculates historical MONTHLY averages for a city up to a given end date.
@@ -142,196 +1322,2309 @@ def get_historical_monthly_avg_up_to_date_df(city_name, end_date):
         logger.warning(f"No daily data available to calculate monthly averages for {city_name}.")
         return pd.Series(name="Price", dtype=float)
 
-    # Filter daily data up to the end date (inclusive of the entire end_date's day)
-    # Convert end_date to Timestamp if it's a date object, and ensure it's end of day for filtering
-    if isinstance(end_date, date_type):
-         end_date_ts = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-    else: # Assume it's already a Timestamp, ensure it's end of day
-         end_date_ts = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    # Filter daily data up to the end date (inclusive of the entire end_date's day)
+    # Convert end_date to Timestamp if it's a date object, and ensure it's end of day for filtering
+    if isinstance(end_date, date_type):
+         end_date_ts = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    else: # Assume it's already a Timestamp, ensure it's end of day
+         end_date_ts = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+
+
+    daily_df_filtered = daily_df[daily_df.index <= end_date_ts]
+
+
+    if daily_df_filtered.empty:
+         logger.warning(f"No daily data found up to {end_date} after filtering for {city_name}.")
+         return pd.Series(name="Price", dtype=float)
+
+    # Resample to monthly start and calculate mean
+    # Use .mean() method which handles NaNs correctly
+    monthly_avg = daily_df_filtered['Price'].resample('MS').mean().dropna()
+
+    return monthly_avg
+
+
+# --- Chart Downsampling ---
+# /api/prices?max_points=N returns at most N points for the trend charts instead of every daily price:
+# Largest-Triangle-Three-Buckets by default (keeps the visual shape, spikes included) or the lowest and
+# highest price of each bucket. ?resolution=weekly|monthly reads a per-city pyramid level of period means
+# precomputed from the cached history, and ?resolution=auto takes the finest level that fits in N points,
+# so zoomed-out charts need no downsampling work at all.
+
+PRICE_RESOLUTIONS = ("daily", "weekly", "monthly")
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+
+def lttb_indices(x, y, max_points):
+    """
+    Ascending indices of the points Largest-Triangle-Three-Buckets keeps, first and last included. The
+    bucket averages are computed for all buckets at once; only picking each bucket's point, which depends
+    on the point picked in the previous bucket, runs bucket by bucket.
+    """
+    n = len(x)
+    if max_points >= n or n <= 2:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1])
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.intp) # max_points - 2 buckets between the ends
+    # Average point of the bucket after each bucket (the last point, after the last bucket)
+    next_lo, next_hi = edges[1:], np.append(edges[2:], n)
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    mean_x = ((cum_x[next_hi] - cum_x[next_lo]) / (next_hi - next_lo)).tolist()
+    mean_y = ((cum_y[next_hi] - cum_y[next_lo]) / (next_hi - next_lo)).tolist()
+
+    kept = np.empty(max_points, dtype=np.intp)
+    kept[0], kept[-1] = 0, n - 1
+    selected = 0
+    bounds = edges.tolist()
+    for i in range(max_points - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        ax, ay = x[selected], y[selected]
+        # Twice the area of the triangle (selected point, candidate, next bucket's average)
+        areas = np.abs((ax - mean_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (mean_y[i] - ay))
+        selected = lo + int(areas.argmax())
+        kept[i + 1] = selected
+    return kept
+
+
+def minmax_indices(y, max_points):
+    """Ascending indices of the lowest and highest point of each bucket, plus the first and last point."""
+    n = len(y)
+    if max_points >= n or n <= 2:
+        return np.arange(n)
+    buckets = (max_points - 2) // 2
+    if buckets < 1:
+        return np.array([0, n - 1])
+    inner = np.asarray(y, dtype=np.float64)[1:-1]
+    bucket_of = np.arange(len(inner)) * buckets // len(inner)
+    order = np.lexsort((inner, bucket_of)) # By bucket, then by price
+    ends = np.cumsum(np.bincount(bucket_of, minlength=buckets))
+    starts = ends - np.bincount(bucket_of, minlength=buckets)
+    return np.unique(np.concatenate(([0], order[starts] + 1, order[ends - 1] + 1, [n - 1])))
+
+
+def price_pyramid_level(days, prices, resolution):
+    """
+    (period start days, period end days, mean prices) of the 'weekly' (Monday to Sunday) or 'monthly'
+    periods that have prices; days are sorted day ordinals. Means are rounded to paise.
+    """
+    days = np.asarray(days, dtype=np.int64)
+    if len(days) == 0:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+    if resolution == "weekly":
+        period_starts = (days + 3) // 7 * 7 - 3 # Day 0 (1970-01-01) was a Thursday; Mondays are 7k - 3
+        period_ends = period_starts + 6
+    else:
+        months = days.astype('datetime64[D]').astype('datetime64[M]')
+        period_starts = months.astype('datetime64[D]').astype(np.int64)
+        period_ends = (months + 1).astype('datetime64[D]').astype(np.int64) - 1
+    group_starts = np.concatenate(([0], np.flatnonzero(np.diff(period_starts)) + 1))
+    counts = np.diff(np.append(group_starts, len(days)))
+    means = np.round(np.add.reduceat(np.asarray(prices, dtype=np.float64), group_starts) / counts, 2)
+    return period_starts[group_starts].astype(np.int32), period_ends[group_starts].astype(np.int32), means
+
+
+@memoize_single_flight(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"], version_func=city_data_version)
+def get_city_price_pyramid_level(city_name, resolution):
+    """price_pyramid_level of a city's full history: 'weekly' or 'monthly' (period starts, ends, means)."""
+    days, prices = get_city_price_history(city_name)
+    return price_pyramid_level(days, prices, resolution)
+
+
+def slice_price_level(city_name, resolution, start_day=None, end_day=None):
+    """(days, prices) of the periods of a resolution overlapping start_day..end_day, dated by period start."""
+    if resolution == "daily":
+        return slice_price_history(get_city_price_history(city_name), start_day, end_day)
+    starts, ends, prices = get_city_price_pyramid_level(city_name, resolution)
+    first = 0 if start_day is None else int(np.searchsorted(ends, start_day, side='left'))
+    last = len(starts) if end_day is None else int(np.searchsorted(starts, end_day, side='right'))
+    return starts[first:last], prices[first:last]
+
+
+@memoize_single_flight(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"], version_func=city_data_version)
+def get_chart_price_series(city_name, start_date_str=None, end_date_str=None, max_points=None,
+                           resolution="daily", method="lttb"):
+    """
+    (days, prices, resolution used, points before downsampling) of a city's price chart between two
+    'YYYY-MM-DD' dates (inclusive, either may be None), reduced to at most max_points points with
+    `method` (None keeps every point). 'auto' resolution picks the finest level with at most max_points
+    points in range, or downsamples the monthly one. Raises ValueError for malformed dates.
+    """
+    start_day = date_str_to_day_ordinal(start_date_str) if start_date_str else None
+    end_day = date_str_to_day_ordinal(end_date_str) if end_date_str else None
+    if resolution == "auto":
+        for resolution in PRICE_RESOLUTIONS:
+            days, prices = slice_price_level(city_name, resolution, start_day, end_day)
+            if max_points is None or len(days) <= max_points:
+                break
+    else:
+        days, prices = slice_price_level(city_name, resolution, start_day, end_day)
+
+    source_points = len(days)
+    if max_points is not None and source_points > max_points:
+        with timed_span("downsample"):
+            if method == "minmax":
+                kept = minmax_indices(prices, max_points)
+            else:
+                kept = lttb_indices(days, prices, max_points)
+        days, prices = days[kept], prices[kept]
+    return np.array(days, dtype=np.int32), np.array(prices, dtype=np.float64), resolution, source_points
+
+
+# --- City Comparison Matrix ---
+# /api/compare aligns the prices of any number of cities on one date axis. Their rows are read with a single
+# `City IN (...)` query (or sliced from the columnar store) and pivoted with NumPy into a dates x cities
+# matrix, cached per city list, range and resolution. The response sends it column-wise: one shared date
+# list and one price array per city, instead of a {date, price} object per point per city.
+
+def read_cities_price_rows(city_names, start_day=None, end_day=None):
+    """
+    [(days, prices), ...] in city_names order, each sorted by date, between two day ordinals (inclusive,
+    either may be None): from the columnar store, or from one `City IN (...)` query over DailyPrices.
+    Same rows as get_city_price_range for each city.
+    """
+    store = get_price_store()
+    if store is not None:
+        return [store.city_prices(city_name, start_day, end_day) for city_name in city_names]
+
+    query = f"SELECT City, Date, Price FROM DailyPrices WHERE City IN ({','.join('?' for _ in city_names)})"
+    params = list(city_names)
+    if start_day is not None:
+        query += " AND Date >= ?"
+        params.append(str(np.datetime64(start_day, 'D')))
+    if end_day is not None:
+        # Compare against the next day so rows carrying a time component on end_day are kept
+        query += " AND Date < ?"
+        params.append(str(np.datetime64(end_day + 1, 'D')))
+    query += " ORDER BY City ASC, Date ASC"
+    logger.info(f"Fetching DAILY prices of {len(city_names)} cities in one query for comparison.")
+    conn = get_db_connection("NECC_PRICES_DB")
+    try:
+        with timed_span("sql_read"):
+            df = pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+    df['Date'] = pd.to_datetime(df['Date']).dt.normalize()
+    df['Price'] = pd.to_numeric(df['Price'], errors='coerce')
+    df.dropna(subset=['Price'], inplace=True)
+
+    codes = pd.Categorical(df['City'], categories=list(city_names)).codes
+    days = df['Date'].to_numpy(dtype='datetime64[D]').astype(np.int32)
+    prices = df['Price'].to_numpy(dtype=np.float64)
+    # Rows come grouped by city name; a stable sort regroups them in city_names order, dates still ascending
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(city_names) + 1)).tolist()
+    return [(days[order[lo:hi]], prices[order[lo:hi]]) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+def pivot_price_matrix(series):
+    """
+    Pivots [(days, prices), ...] (one pair per city) into (sorted day ordinals present in any series,
+    dates x cities float64 matrix), NaN where a city has no price that day.
+    """
+    days = np.concatenate([np.asarray(days, dtype=np.int32) for days, _ in series] or [np.empty(0, dtype=np.int32)])
+    prices = np.concatenate([np.asarray(prices, dtype=np.float64) for _, prices in series] or [np.empty(0)])
+    city_codes = np.repeat(np.arange(len(series)), [len(days) for days, _ in series])
+    axis, rows = np.unique(days, return_inverse=True)
+    matrix = np.full((len(axis), len(series)), np.nan)
+    matrix[rows, city_codes] = prices
+    return axis.astype(np.int32), matrix
+
+
+@memoize_single_flight(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"], version_func=cities_data_version)
+def get_price_matrix(city_names, start_date_str=None, end_date_str=None, resolution="daily"):
+    """
+    (day ordinals, dates x cities price matrix) of the cities in city_names (a tuple) between two 'YYYY-MM-DD'
+    dates (inclusive, either may be None). 'weekly' and 'monthly' pivot the period means of the rows in range,
+    dated by period start. Raises ValueError for malformed dates.
+    """
+    start_day = date_str_to_day_ordinal(start_date_str) if start_date_str else None
+    end_day = date_str_to_day_ordinal(end_date_str) if end_date_str else None
+    series = read_cities_price_rows(city_names, start_day, end_day)
+    with timed_span("pivot"):
+        if resolution != "daily":
+            series = [(period_starts, means) for period_starts, _, means in
+                      (price_pyramid_level(days, prices, resolution) for days, prices in series)]
+        return pivot_price_matrix(series)
+
+
+def align_forecasts(forecasts):
+    """
+    (["YYYY-MM", ...] spanning every non-empty forecast, months x forecasts float64 matrix) of a list of
+    MonthlyForecasts, NaN where a forecast has no price for the month.
+    """
+    present = [forecast for forecast in forecasts if len(forecast)]
+    if not present:
+        return [], np.empty((0, len(forecasts)))
+    first = min(forecast.start_month for forecast in present)
+    last = max(forecast.start_month + len(forecast) for forecast in present)
+    matrix = np.full((last - first, len(forecasts)), np.nan)
+    for column, forecast in enumerate(forecasts):
+        if len(forecast):
+            matrix[forecast.start_month - first:forecast.start_month - first + len(forecast), column] = forecast.prices
+    return [f"{month // 12:04d}-{month % 12 + 1:02d}" for month in range(first, last)], matrix
+
+
+def nan_to_none(values):
+    """Float array as a list for JSON, None (null) where NaN."""
+    return [value if value == value else None for value in values.tolist()] # NaN != NaN
+
+
+# --- Latest Price Snapshot ---
+# The latest price of every city comes from the materialized LatestPrices table in necc_prices.db
+# (kept current by `flask build-latest-prices` / ingest), or from one grouped query when the
+# table has not been built. Either way it is one statement for all cities, never one query per city.
+
+LATEST_PRICES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS LatestPrices (
+    City TEXT PRIMARY KEY,
+    Date TEXT,
+    Price REAL
+)
+"""
+
+# SQLite returns the bare columns (Price) from the row holding MAX(Date), so this is each city's latest
+# row from a single aggregate pass; several times faster than a ROW_NUMBER() window over the whole table.
+LATEST_PRICES_SQL = """
+    SELECT City, MAX(Date) AS Date, Price FROM {schema}DailyPrices{where} GROUP BY City
+"""
+
+
+def _latest_prices_source(cursor, schema=""):
+    """SQL (table name or subquery) yielding City, Date, Price of each city's latest row."""
+    cursor.execute(f"SELECT 1 FROM {schema}sqlite_master WHERE type = 'table' AND name = 'LatestPrices'")
+    if cursor.fetchone():
+        return f"{schema}LatestPrices"
+    return f"({LATEST_PRICES_SQL.format(schema=schema, where='')})"
+
+
+@memoize_single_flight(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"], version_func=all_cities_derived_data_version)
+def get_latest_prices_snapshot():
+    """Returns {city: {"date": date, "price": price}} for every city in DailyPrices."""
+    logger.info("Fetching latest price snapshot for all cities from DB.")
+    conn = get_db_connection("NECC_PRICES_DB")
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT City, Date, Price FROM {_latest_prices_source(cursor)}")
+        return {row['City']: {"date": row['Date'], "price": float(row['Price']) if row['Price'] is not None else None}
+                for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+
+@memoize_single_flight(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"], version_func=city_derived_data_version)
+def get_latest_price_info_db(city_name):
+    try:
+        return get_latest_prices_snapshot().get(city_name, {"date": None, "price": None})
+    except Exception as e:
+        logger.error(f"Database error fetching latest price for {city_name}: {e}")
+        return {"date": None, "price": None}
+
+
+def refresh_latest_prices(conn, city_names=None):
+    """Recomputes LatestPrices rows (all cities, or only city_names) on a writable necc_prices.db connection."""
+    conn.execute(LATEST_PRICES_SCHEMA)
+    where, params = "", []
+    if city_names:
+        where = f" WHERE City IN ({','.join('?' for _ in city_names)})"
+        params = list(city_names)
+    with conn:
+        if city_names:
+            conn.execute(f"DELETE FROM LatestPrices{where}", params)
+        else:
+            conn.execute("DELETE FROM LatestPrices")
+        conn.execute("INSERT INTO LatestPrices (City, Date, Price) "
+                     + LATEST_PRICES_SQL.format(schema="", where=where), params)
+
+
+@app.cli.command("build-latest-prices")
+def build_latest_prices_command():
+    """Create or refresh the materialized LatestPrices table in necc_prices.db."""
+    conn = sqlite3.connect(CONFIG["NECC_PRICES_DB"])
+    try:
+        refresh_latest_prices(conn)
+        count = conn.execute("SELECT COUNT(*) FROM LatestPrices").fetchone()[0]
+        bump_derived_table_version(conn, "LatestPrices")
+    finally:
+        conn.close()
+    click.echo(f"LatestPrices refreshed for {count} cities.")
+
+
+# --- Prediction Engine (Enhanced) ---
+
+def get_training_end_date(current_system_date):
+    """Training data for the forecast ends on Dec 31 of the year before current_system_date's year."""
+    return datetime(current_system_date.year - 1, 12, 31).date()
+
+
+class MonthlyForecast:
+    """
+    A monthly forecast as its first month plus a float64 price array (NaN where the model gave no price).
+    Prefix sums of the valid prices (in whole paise, so they are exact) are built once, so the average over
+    any run of months is O(1) and needs no pandas. This is what generate_24_month_forecast caches;
+    to_list() gives the API format.
+    """
+
+    __slots__ = ("start_month", "prices", "_sums", "_counts")
+
+    def __init__(self, start_month, prices):
+        self.start_month = start_month # Months since year 0, January = 0
+        self.prices = np.asarray(prices, dtype=np.float64)
+        valid = ~np.isnan(self.prices)
+        self._sums = np.concatenate(([0.0], np.cumsum(np.round(np.where(valid, self.prices, 0.0) * 100))))
+        self._counts = np.concatenate(([0], np.cumsum(valid)))
+
+    @classmethod
+    def from_list(cls, forecast_list):
+        """From the [{"month": "YYYY-MM", "price": price or None}, ...] format (consecutive months)."""
+        if not forecast_list:
+            return cls(0, [])
+        year, month = forecast_list[0]["month"].split("-")
+        return cls(int(year) * 12 + int(month) - 1,
+                   [np.nan if entry["price"] is None else entry["price"] for entry in forecast_list])
+
+    def __reduce__(self):
+        # Pickled (e.g. by the cache backend) as start month + prices; prefix sums are rebuilt on load
+        return MonthlyForecast, (self.start_month, self.prices)
+
+    def __len__(self):
+        return len(self.prices)
+
+    def offset(self, year, month):
+        """Position of a calendar month in the forecast (may be negative or past the end)."""
+        return year * 12 + month - 1 - self.start_month
+
+    def average(self, start, count):
+        """Mean of the valid prices among `count` months from position start, or None if there are none."""
+        end = min(max(start + count, 0), len(self.prices))
+        start = min(max(start, 0), end)
+        valid = self._counts[end] - self._counts[start]
+        return (self._sums[end] - self._sums[start]) / (valid * 100) if valid else None
+
+    def to_list(self, start=0, stop=None, skip_missing=False):
+        """Months [start, stop) as [{"month": "YYYY-MM", "price": price or None}, ...]."""
+        month_number = self.start_month + start
+        entries = []
+        for price in self.prices[start:stop].tolist():
+            if price == price or not skip_missing: # NaN != NaN
+                entries.append({"month": f"{month_number // 12:04d}-{month_number % 12 + 1:02d}",
+                                "price": price if price == price else None})
+            month_number += 1
+        return entries
+
+
+@timed_span("hw_fit")
+def fit_hw_model(historical_monthly_data, prior_fit=None, model_config=None):
+    """
+    Fits the configured monthly HW model. prior_fit is a model registry entry for the same city:
+    with "reuse" set its parameters are applied as-is (no optimization), otherwise they seed the optimizer.
+    model_config ({"trend", "seasonal", "seasonal_periods"}) overrides the HW_* settings, e.g. for backtests.
+    Returns (fitted results, fit_info) where fit_info holds params, sse, fit_seconds, iterations and fit_mode.
+    """
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing # Deferred: ~0.9s of imports incl. scipy.stats
+
+    model_config = model_config or {}
+    model_kwargs = {
+        "trend": model_config.get("trend", CONFIG["HW_TREND"]),
+        "seasonal": model_config.get("seasonal", CONFIG["HW_SEASONAL_MONTHLY"]), # Use monthly seasonal config
+        "seasonal_periods": model_config.get("seasonal_periods", CONFIG["HW_SEASONAL_PERIODS_MONTHLY"]), # Use monthly seasonal periods
+    }
+    has_trend = model_kwargs["trend"] is not None
+    has_seasonal = model_kwargs["seasonal"] is not None
+    start_time = time.perf_counter()
+    results = None
+    fit_mode = "cold"
+
+    if prior_fit:
+        params = prior_fit["params"]
+        try:
+            if prior_fit.get("reuse"):
+                # Same training data as the stored fit: its parameters are the optimum, skip optimization
+                results = ExponentialSmoothing(
+                    historical_monthly_data, initialization_method='known',
+                    initial_level=params["initial_level"],
+                    initial_trend=params["initial_trend"] if has_trend else None,
+                    initial_seasonal=params["initial_seasons"] if has_seasonal else None,
+                    **model_kwargs
+                ).fit(smoothing_level=params["smoothing_level"],
+                      smoothing_trend=params["smoothing_trend"] if has_trend else None,
+                      smoothing_seasonal=params["smoothing_seasonal"] if has_seasonal else None,
+                      optimized=False)
+                fit_mode = "reused"
+            else:
+                # Parameter order expected by statsmodels: alpha, beta, gamma, l0, b0, then seasonals
+                start_params = [params["smoothing_level"]]
+                start_params += [params["smoothing_trend"]] if has_trend else []
+                start_params += [params["smoothing_seasonal"]] if has_seasonal else []
+                start_params += [params["initial_level"]]
+                start_params += [params["initial_trend"]] if has_trend else []
+                start_params += list(params["initial_seasons"]) if has_seasonal else []
+                results = ExponentialSmoothing(
+                    historical_monthly_data, initialization_method='estimated', **model_kwargs
+                ).fit(start_params=start_params, use_brute=False)
+                fit_mode = "warm"
+        except Exception as e:
+            logger.warning(f"Could not start from stored HW parameters, fitting from scratch: {e}")
+            results = None
+            fit_mode = "cold"
+
+    if results is None:
+        # Fit the Holt-Winters model
+        results = ExponentialSmoothing(
+            historical_monthly_data, initialization_method='estimated', **model_kwargs
+        ).fit()
+
+    retvals = getattr(results, 'mle_retvals', None)
+    fitted_params = results.params
+    fit_info = {
+        "params": {
+            "smoothing_level": float(fitted_params["smoothing_level"]),
+            "smoothing_trend": float(fitted_params["smoothing_trend"]) if has_trend else None,
+            "smoothing_seasonal": float(fitted_params["smoothing_seasonal"]) if has_seasonal else None,
+            "initial_level": float(fitted_params["initial_level"]),
+            "initial_trend": float(fitted_params["initial_trend"]) if has_trend else None,
+            "initial_seasons": [float(v) for v in fitted_params["initial_seasons"]] if has_seasonal else [],
+        },
+        "sse": float(results.sse),
+        "fit_seconds": time.perf_counter() - start_time,
+        "iterations": int(retvals.get("nit", 0)) if fit_mode != "reused" and hasattr(retvals, "get") else 0,
+        "fit_mode": fit_mode,
+    }
+    return results, fit_info
+
+
+def fit_24_month_forecast(city_name, historical_monthly_data, training_end_date, prior_fit=None, return_fit_info=False):
+    """
+    Fits the monthly HW model on historical_monthly_data (a Month Start indexed Series)
+    and returns the 24-month forecast as a list of dicts: [{"month": "YYYY-MM", "price": price}].
+    Kept at module level (and free of cache/app state) so it can run inside a process pool.
+    Returns empty list if prediction is not possible due to insufficient data.
+    With return_fit_info, returns (forecast list, fit_info or None) instead.
+    """
+    # Check if sufficient data exists for robust HW model
+    # Need at least MIN_MONTHS_DATA_FOR_MONTHLY_HW months of data
+    if historical_monthly_data.empty or len(historical_monthly_data) < CONFIG["MIN_MONTHS_DATA_FOR_MONTHLY_HW"]:
+        logger.warning(f"Not enough historical monthly data ({len(historical_monthly_data)} months) "
+                       f"up to {training_end_date} for {city_name} to generate a 24-month forecast. "
+                       f"Minimum required: {CONFIG['MIN_MONTHS_DATA_FOR_MONTHLY_HW']} months.")
+        return ([], None) if return_fit_info else [] # Return empty list if insufficient data
+
+    try:
+        model, fit_info = fit_hw_model(historical_monthly_data, prior_fit)
+
+        # Forecast for next 24 months (periods)
+        forecast_steps = 24
+        future_predictions_series = model.forecast(forecast_steps) # This returns a pandas Series with DatetimeIndex
+
+        # Format predictions into list of dicts
+        predicted_data_list = []
+        # Iterate over the Series index (pandas Timestamps) and values
+        for date_index, price in future_predictions_series.items():
+             # Ensure date_index is treated as a Timestamp
+             date_ts = pd.Timestamp(date_index)
+             predicted_data_list.append({
+                 # Format date using strftime
+                 "month": date_ts.strftime('%Y-%m'),
+                 "price": round(price, 2) if pd.notna(price) else None
+             })
+
+        return (predicted_data_list, fit_info) if return_fit_info else predicted_data_list
+
+    except Exception as e:
+        logger.error(f"Error generating 24-month HW forecast for {city_name}: {e}")
+        return ([], None) if return_fit_info else [] # Return empty list on error
+
+
+# --- Forecast Engines ---
+# generate_24_month_forecast and the batch/store paths fit through the engine named by FORECAST_ENGINE.
+# An engine takes {city: monthly average Series} up to the training cutoff and returns
+# ({city: forecast list}, {city: fit_info}); cities that cannot be forecast map to [].
+
+def get_forecast_pool_size():
+    """
+    BATCH_FORECAST_MAX_WORKERS, or by default os.cpu_count() shared among the WEB_CONCURRENCY web workers
+    (set by gunicorn.conf.py), so all workers' pools together use about one process per CPU. 1 fits inline.
+    """
+    if CONFIG["BATCH_FORECAST_MAX_WORKERS"]:
+        return CONFIG["BATCH_FORECAST_MAX_WORKERS"]
+    try:
+        web_workers = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+    except ValueError:
+        web_workers = 1
+    return max(1, (os.cpu_count() or 1) // web_workers)
+
+
+_forecast_pool = None
+_forecast_pool_pid = None
+_forecast_pool_lock = threading.Lock()
+
+
+def get_forecast_process_pool():
+    """The worker's process pool for forecast fits, created on first use and reused by later requests."""
+    global _forecast_pool, _forecast_pool_pid
+    with _forecast_pool_lock:
+        if _forecast_pool is None or _forecast_pool_pid != os.getpid():
+            # A forked worker starts its own pool rather than using the parent's
+            _forecast_pool = ProcessPoolExecutor(max_workers=get_forecast_pool_size())
+            _forecast_pool_pid = os.getpid()
+        return _forecast_pool
+
+
+def shutdown_forecast_process_pool(wait=True):
+    """Shuts down this process's forecast pool (app shutdown, or after it broke); the next fit starts a new one."""
+    global _forecast_pool
+    with _forecast_pool_lock:
+        pool = _forecast_pool if _forecast_pool_pid == os.getpid() else None
+        _forecast_pool = None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+
+atexit.register(shutdown_forecast_process_pool)
+
+
+class ForecastEngine:
+    """Base class of the pluggable forecast engines (see FORECAST_ENGINES)."""
+
+    name = None
+
+    def fit_forecasts(self, monthly_by_city, training_end_date, priors=None):
+        raise NotImplementedError
+
+
+class StatsmodelsForecastEngine(ForecastEngine):
+    """
+    One statsmodels ExponentialSmoothing fit per city, seeded from priors. Small batches are fitted inline,
+    larger ones across the worker's process pool (see get_forecast_process_pool).
+    """
+
+    name = "statsmodels"
+
+    def fit_forecasts(self, monthly_by_city, training_end_date, priors=None):
+        priors = priors or {}
+        city_names = list(monthly_by_city)
+        fit_args = [(city_name, monthly_by_city[city_name], training_end_date, priors.get(city_name), True)
+                    for city_name in city_names]
+
+        # Only cities with enough data actually need a model fit; a few fits cost less than the pool round trip
+        fittable = sum(1 for args in fit_args if len(args[1]) >= CONFIG["MIN_MONTHS_DATA_FOR_MONTHLY_HW"])
+        max_workers = min(get_forecast_pool_size(), fittable)
+        use_pool = max_workers > 1 and fittable > CONFIG["BATCH_FORECAST_INLINE_MAX_CITIES"]
+        logger.info(f"Fitting {fittable} of {len(city_names)} forecasts {'in the process pool' if use_pool else 'inline'}, "
+                    f"{len(priors)} from stored parameters.")
+
+        fitted = None
+        if use_pool:
+            try:
+                fitted = list(get_forecast_process_pool().map(fit_24_month_forecast, *zip(*fit_args)))
+            except Exception as e:
+                logger.error(f"Process pool forecast fitting failed, falling back to serial fitting: {e}")
+                shutdown_forecast_process_pool(wait=False)
+                fitted = None
+        if fitted is None:
+            fitted = [fit_24_month_forecast(*args) for args in fit_args]
+
+        forecasts = {city_name: forecast_list for city_name, (forecast_list, _) in zip(city_names, fitted)}
+        fit_infos = {city_name: fit_info for city_name, (_, fit_info) in zip(city_names, fitted) if fit_info}
+        return forecasts, fit_infos
+
+
+class NumpyHoltWintersEngine(ForecastEngine):
+    """
+    Fits every city at once. The monthly series are stacked left-aligned into a (cities, months) array and the
+    Holt-Winters recursions (statsmodels' formulation, additive or no trend, additive/multiplicative/no
+    seasonality) run over it for a whole grid of smoothing parameters per city: a coarse grid over [0, 1],
+    then local refinement around each city's lowest SSE. Initial states use the classic two-season heuristic
+    instead of being optimized, so forecasts are close to, not identical with, statsmodels'.
+    No fit_info is returned: the model registry only seeds the statsmodels optimizer.
+    """
+
+    name = "numpy"
+
+    def fit_forecasts(self, monthly_by_city, training_end_date, priors=None):
+        trend = CONFIG["HW_TREND"]
+        seasonal = CONFIG["HW_SEASONAL_MONTHLY"]
+        period = CONFIG["HW_SEASONAL_PERIODS_MONTHLY"] if seasonal else 1
+        if trend not in ("add", None) or seasonal not in ("add", "mul", None):
+            logger.warning(f"numpy forecast engine does not support trend={trend}, seasonal={seasonal}; using statsmodels.")
+            return FORECAST_ENGINES["statsmodels"].fit_forecasts(monthly_by_city, training_end_date, priors)
+
+        start_time = time.perf_counter()
+        forecasts = {}
+        min_months = max(CONFIG["MIN_MONTHS_DATA_FOR_MONTHLY_HW"], 2 * period)
+        city_names = []
+        for city_name, series in monthly_by_city.items():
+            if len(series) < min_months:
+                logger.warning(f"Not enough historical monthly data ({len(series)} months) up to {training_end_date} "
+                               f"for {city_name} to generate a 24-month forecast. Minimum required: {min_months} months.")
+                forecasts[city_name] = []
+            else:
+                city_names.append(city_name)
+        if not city_names:
+            return forecasts, {}
+
+        lengths = np.array([len(monthly_by_city[city_name]) for city_name in city_names])
+        values = np.full((len(city_names), lengths.max()), np.nan)
+        for row, city_name in enumerate(city_names):
+            values[row, :lengths[row]] = monthly_by_city[city_name].to_numpy(dtype=np.float64)
+
+        # Initial states from the first two seasons
+        first_season = values[:, :period]
+        level0 = first_season.mean(axis=1)
+        slope0 = (values[:, period:2 * period].mean(axis=1) - level0) / period if trend else np.zeros(len(city_names))
+        if seasonal == "mul":
+            season0 = first_season / level0[:, None]
+        elif seasonal == "add":
+            season0 = first_season - level0[:, None]
+        else:
+            season0 = np.zeros((len(city_names), 1))
+        initial = (values, lengths, level0, slope0, season0)
+
+        # Coarse grid shared by all cities, then refine around each city's best point
+        grid = np.linspace(0.0, 1.0, max(2, int(CONFIG["NUMPY_HW_GRID_POINTS"]))) # Both ends of [0, 1], at least
+        axes = [grid, grid if trend else np.zeros(1), grid if seasonal else np.zeros(1)]
+        coarse = np.stack([axis.ravel() for axis in np.meshgrid(*axes, indexing='ij')])
+        params = np.broadcast_to(coarse[:, None, :], (3, len(city_names), coarse.shape[1]))
+        sse = self._recursions(initial, params, trend, seasonal, period)[0]
+        best = params[:, np.arange(len(city_names)), np.nanargmin(sse, axis=1)]
+
+        step = grid[1] - grid[0]
+        offsets = np.array([-1.0, 0.0, 1.0])
+        for _ in range(CONFIG["NUMPY_HW_REFINE_ROUNDS"]):
+            step /= 2
+            local_axes = [offsets * step, offsets * step if trend else np.zeros(1), offsets * step if seasonal else np.zeros(1)]
+            local = np.stack([axis.ravel() for axis in np.meshgrid(*local_axes, indexing='ij')])
+            params = np.clip(best[:, :, None] + local[:, None, :], 0.0, 1.0)
+            sse = self._recursions(initial, params, trend, seasonal, period)[0]
+            best = params[:, np.arange(len(city_names)), np.nanargmin(sse, axis=1)]
+
+        _, level, slope, season = self._recursions(initial, best[:, :, None], trend, seasonal, period)
+        horizon = np.arange(1, 25)
+        predicted = level[:, :1] + horizon[None, :] * slope[:, :1]
+        if seasonal:
+            slots = (lengths[:, None] - 1 + horizon[None, :]) % period
+            season_ahead = season[slots, np.arange(len(city_names))[:, None], 0]
+            predicted = predicted * season_ahead if seasonal == "mul" else predicted + season_ahead
+
+        for row, city_name in enumerate(city_names):
+            last_month = pd.Timestamp(monthly_by_city[city_name].index[-1])
+            month_number = last_month.year * 12 + last_month.month - 1 # Months since year 0, January = 0
+            forecasts[city_name] = [
+                {"month": f"{(month_number + h) // 12:04d}-{(month_number + h) % 12 + 1:02d}",
+                 "price": round(price, 2) if np.isfinite(price) else None}
+                for h, price in zip(horizon.tolist(), predicted[row].tolist())]
+        logger.info(f"numpy engine fitted {len(city_names)} forecasts in {time.perf_counter() - start_time:.3f}s.")
+        return forecasts, {}
+
+    @staticmethod
+    def _recursions(initial, params, trend, seasonal, period):
+        """
+        Runs the HW recursions for params (alpha, beta, gamma), each shaped (cities, candidates).
+        Returns (sse, level, slope, season) with season shaped (period, cities, candidates).
+        """
+        values, lengths, level0, slope0, season0 = initial
+        alpha, beta, gamma = params
+        shape = alpha.shape
+        level = np.broadcast_to(level0[:, None], shape).copy()
+        slope = np.broadcast_to(slope0[:, None], shape).copy()
+        season = np.broadcast_to(season0.T[:, :, None], (season0.shape[1],) + shape).copy()
+        sse = np.zeros(shape)
+        with np.errstate(all='ignore'):
+            for t in range(values.shape[1]):
+                y = values[:, t][:, None]
+                base = level + slope
+                season_prev = season[t % period]
+                if seasonal == "mul":
+                    fitted = base * season_prev
+                    new_level = alpha * (y / season_prev) + (1 - alpha) * base
+                    new_season = gamma * (y / base) + (1 - gamma) * season_prev
+                elif seasonal == "add":
+                    fitted = base + season_prev
+                    new_level = alpha * (y - season_prev) + (1 - alpha) * base
+                    new_season = gamma * (y - base) + (1 - gamma) * season_prev
+                else:
+                    fitted = base
+                    new_level = alpha * y + (1 - alpha) * base
+                    new_season = season_prev
+                new_slope = beta * (new_level - level) + (1 - beta) * slope if trend else slope
+                active = (t < lengths)[:, None]
+                if active.all():
+                    sse += (y - fitted) ** 2
+                    level, slope = new_level, new_slope
+                    season[t % period] = new_season
+                else:
+                    # Shorter series are finished: keep their final states
+                    sse += np.where(active, (y - fitted) ** 2, 0.0)
+                    level = np.where(active, new_level, level)
+                    slope = np.where(active, new_slope, slope)
+                    season[t % period] = np.where(active, new_season, season_prev)
+        sse[~np.isfinite(sse)] = np.inf
+        return sse, level, slope, season
+
+
+FORECAST_ENGINES = {engine.name: engine for engine in (StatsmodelsForecastEngine(), NumpyHoltWintersEngine())}
+
+
+def get_forecast_engine():
+    """The engine selected by FORECAST_ENGINE (statsmodels if the name is unknown)."""
+    engine = FORECAST_ENGINES.get(CONFIG["FORECAST_ENGINE"])
+    if engine is None:
+        logger.error(f"Unknown FORECAST_ENGINE {CONFIG['FORECAST_ENGINE']!r}, using statsmodels.")
+        engine = FORECAST_ENGINES["statsmodels"]
+    return engine
+
+
+@app.cli.command("compare-forecast-engines")
+@click.option("--date", "system_date", default=None, help="System date (YYYY-MM-DD) that determines the training cutoff.")
+@click.option("--city", "city_names", multiple=True, help="Only these cities (repeatable; default all).")
+def compare_forecast_engines_command(system_date, city_names):
+    """Fit every city with each forecast engine and report timings and differences from statsmodels."""
+    if system_date:
+        current_system_date = datetime.strptime(system_date, CONFIG['DATE_FORMAT']).date()
+    else:
+        current_system_date = datetime.now(pytz.timezone(CONFIG['TIMEZONE'])).date()
+    training_end_date = get_training_end_date(current_system_date)
+    if not city_names:
+        conn = get_db_connection("NECC_PRICES_DB")
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT City FROM DailyPrices ORDER BY City")
+        city_names = [row['City'] for row in cursor.fetchall()]
+        conn.close()
+    monthly_by_city = get_monthly_avgs_for_cities_df(list(city_names), training_end_date)
+
+    results = {}
+    for name, engine in FORECAST_ENGINES.items():
+        started = time.perf_counter()
+        results[name] = engine.fit_forecasts(monthly_by_city, training_end_date)[0]
+        click.echo(f"{name:<12} {len(monthly_by_city)} cities in {time.perf_counter() - started:.3f}s")
+
+    reference = results["statsmodels"]
+    for name, forecasts in results.items():
+        if name == "statsmodels":
+            continue
+        differences = {}
+        for city_name, reference_list in reference.items():
+            expected = np.array([p["price"] for p in reference_list], dtype=np.float64)
+            actual = np.array([p["price"] for p in forecasts.get(city_name, [])], dtype=np.float64)
+            if len(expected) and len(expected) == len(actual):
+                differences[city_name] = np.abs(actual - expected) / np.abs(expected) * 100
+        if not differences:
+            click.echo(f"{name}: no comparable forecasts.")
+            continue
+        all_differences = np.concatenate(list(differences.values()))
+        click.echo(f"{name} vs statsmodels (training cutoff {training_end_date}): mean abs diff "
+                   f"{np.nanmean(all_differences):.3f}%, max {np.nanmax(all_differences):.3f}% "
+                   f"over {len(differences)} cities")
+        for city_name in sorted(differences, key=lambda c: -np.nanmax(differences[c]))[:5]:
+            click.echo(f"  {city_name:<30} mean {np.nanmean(differences[city_name]):.3f}%  "
+                       f"max {np.nanmax(differences[city_name]):.3f}%")
+
+
+def forecast_data_version(city_name, *args, **kwargs):
+    """version_func for forecasts: the city's data version and the forecast model settings."""
+    model_config_hash = hashlib.sha1(get_forecast_model_config_key().encode()).hexdigest()[:12]
+    return f"{city_data_version(city_name)}-{model_config_hash}"
+
+
+@memoize_single_flight(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"], version_func=forecast_data_version)
+def generate_24_month_forecast(city_name, current_system_date):
+    """
+    Generates a 24-month forecast (monthly) using HW model trained on data
+    up to the end of the year preceding the current_system_date's year.
+    Forecast starts from the beginning of the current_system_date's year.
+    Reads the precomputed forecast store first and only fits the model if no entry exists.
+    Returns a MonthlyForecast (empty if prediction is not possible due to insufficient data).
+    """
+    logger.info(f"Generating 24-month forecast for {city_name}. Current system date: {current_system_date}")
+
+    # Determine the end date for training data: end of the year before the current year
+    training_end_date = get_training_end_date(current_system_date)
+
+    # Serve the precomputed forecast when `flask build-forecasts` has stored one for this cutoff
+    stored_forecasts = get_stored_forecasts([city_name], training_end_date)
+    if city_name in stored_forecasts:
+        return MonthlyForecast.from_list(stored_forecasts[city_name])
+    logger.warning(f"No stored forecast for {city_name} (cutoff {training_end_date}); fitting on request.")
+
+    training_end_timestamp = pd.Timestamp(training_end_date)
+
+    # Get historical monthly averages up to the training end date
+    historical_monthly_data = get_historical_monthly_avg_up_to_date_df(city_name, training_end_timestamp)
+
+    engine = get_forecast_engine()
+    priors = get_forecast_engine_priors(engine, [city_name], training_end_date)
+    forecasts, _ = engine.fit_forecasts({city_name: historical_monthly_data}, training_end_date, priors)
+    return MonthlyForecast.from_list(forecasts.get(city_name, []))
+
+
+def get_monthly_avgs_for_cities_df(city_names, end_date):
+    """
+    Loads the daily series of every city in city_names with a single query over DailyPrices
+    and returns {city: monthly average Series} up to end_date (inclusive), computed the same
+    way as get_historical_monthly_avg_up_to_date_df. Cities without data are omitted.
+    """
+    if not city_names:
+        return {}
+    store = get_price_store()
+    if store is not None:
+        end_day = (end_date - date_type(1970, 1, 1)).days
+        monthly_by_city = {}
+        for city_name in city_names:
+            city_df = store.city_frame(city_name, None, end_day)
+            if not city_df.empty:
+                monthly_by_city[city_name] = city_df['Price'].resample('MS').mean().dropna()
+        return monthly_by_city
+
+    logger.info(f"Fetching historical DAILY prices for {len(city_names)} cities in one pass, up to {end_date}.")
+    # Compare against the next day so rows carrying a time component on end_date are kept
+    end_exclusive_str = (end_date + timedelta(days=1)).strftime(CONFIG['DATE_FORMAT'])
+    placeholders = ",".join("?" for _ in city_names)
+    query = (f"SELECT City, Date, Price FROM DailyPrices WHERE City IN ({placeholders}) AND Date < ? "
+             f"ORDER BY City ASC, Date ASC")
+    try:
+        conn = get_db_connection("NECC_PRICES_DB")
+        with timed_span("sql_read"):
+            df = pd.read_sql_query(query, conn, params=list(city_names) + [end_exclusive_str])
+        conn.close()
+    except Exception as e:
+        logger.error(f"Database error fetching daily prices for batch of {len(city_names)} cities: {e}")
+        return {}
+
+    if df.empty:
+        return {}
+
+    df['Date'] = pd.to_datetime(df['Date']).dt.normalize()
+    df['Price'] = pd.to_numeric(df['Price'], errors='coerce')
+    df.dropna(subset=['Price'], inplace=True)
+
+    monthly_by_city = {}
+    for city_name, city_df in df.groupby('City', sort=False):
+        monthly_by_city[city_name] = city_df.set_index('Date')['Price'].resample('MS').mean().dropna()
+    return monthly_by_city
+
+
+def get_forecast_engine_priors(engine, city_names, training_end_date, signatures=None):
+    """HW model registry priors for engine's fits of city_names (statsmodels only; see get_hw_model_priors)."""
+    if engine.name != "statsmodels":
+        return {}
+    if signatures is None:
+        try:
+            signatures = get_training_data_signatures(training_end_date, city_names)
+        except Exception as e:
+            logger.error(f"Could not compute training data signatures: {e}")
+            signatures = {}
+    return get_hw_model_priors(city_names, training_end_date, signatures)
+
+
+def fit_24_month_forecasts(city_names, training_end_date, signatures=None, with_fit_info=False):
+    """
+    Loads the monthly series of every city in city_names in one pass and fits their
+    forecasts with the configured forecast engine (see get_forecast_engine).
+    statsmodels fits start from the HW model registry where possible (see get_hw_model_priors).
+    Returns {city: forecast list}, or ({city: forecast list}, {city: fit_info}) with with_fit_info.
+    """
+    monthly_by_city = get_monthly_avgs_for_cities_df(city_names, training_end_date)
+    engine = get_forecast_engine()
+    priors = get_forecast_engine_priors(engine, city_names, training_end_date, signatures)
+    empty_series = pd.Series(name="Price", dtype=float)
+    forecasts, fit_infos = engine.fit_forecasts(
+        {city_name: monthly_by_city.get(city_name, empty_series) for city_name in city_names}, training_end_date, priors)
+    if not with_fit_info:
+        return forecasts
+    return forecasts, fit_infos
+
+
+def generate_24_month_forecasts_batch(city_names, current_system_date):
+    """
+    Batch counterpart of generate_24_month_forecast. Cities already in the memoize cache or
+    the forecast store are served from there; the rest are loaded in one query and fitted
+    across a process pool. Results are written back to the generate_24_month_forecast cache entries.
+    Returns {city: MonthlyForecast}.
+    """
+    forecasts = {}
+    missing_cities = []
+    for city_name in city_names:
+        cache_key = generate_24_month_forecast.versioned_cache_key(city_name, current_system_date)
+        cached_forecast = cache.get(cache_key)
+        if cached_forecast is not None:
+            forecasts[city_name] = cached_forecast
+        else:
+            missing_cities.append(city_name)
+
+    if not missing_cities:
+        return forecasts
+
+    training_end_date = get_training_end_date(current_system_date)
+    computed = get_stored_forecasts(missing_cities, training_end_date)
+    still_missing = [city_name for city_name in missing_cities if city_name not in computed]
+    if still_missing:
+        computed.update(fit_24_month_forecasts(still_missing, training_end_date))
+
+    for city_name in missing_cities:
+        forecast = MonthlyForecast.from_list(computed.get(city_name, []))
+        forecasts[city_name] = forecast
+        cache_key = generate_24_month_forecast.versioned_cache_key(city_name, current_system_date)
+        cache.set(cache_key, forecast, timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"])
+    return forecasts
+
+
+# --- Precomputed Forecast Store ---
+# Forecasts only depend on data up to the training cutoff (Dec 31 of the previous year), so they are
+# built offline by `flask build-forecasts` and kept in FORECAST_STORE_DB, keyed by city, cutoff and model config.
+
+FORECAST_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecast_store (
+    city TEXT NOT NULL,
+    training_end_date TEXT NOT NULL,
+    model_config TEXT NOT NULL,
+    data_signature TEXT NOT NULL,
+    forecast_json TEXT NOT NULL,
+    built_at TEXT NOT NULL,
+    PRIMARY KEY (city, training_end_date, model_config)
+)
+"""
+
+
+def get_forecast_model_config_key():
+    """Identifies the forecast model settings; entries built with other settings are ignored."""
+    model_config = {
+        "trend": CONFIG["HW_TREND"],
+        "seasonal": CONFIG["HW_SEASONAL_MONTHLY"],
+        "seasonal_periods": CONFIG["HW_SEASONAL_PERIODS_MONTHLY"],
+        "min_months": CONFIG["MIN_MONTHS_DATA_FOR_MONTHLY_HW"],
+        "horizon": 24,
+    }
+    # Only named for other engines, so entries built before engines were selectable stay valid
+    if get_forecast_engine().name != "statsmodels":
+        model_config["engine"] = get_forecast_engine().name
+    return json.dumps(model_config, sort_keys=True)
+
+
+def get_training_data_signatures(training_end_date, city_names=None):
+    """
+    Returns {city: signature} summarising the DailyPrices rows up to training_end_date.
+    The signature changes whenever a row before the cutoff is added, removed or corrected.
+    """
+    end_exclusive_str = (training_end_date + timedelta(days=1)).strftime(CONFIG['DATE_FORMAT'])
+    query = ("SELECT City, COUNT(*) AS n, MIN(Date) AS first_date, MAX(Date) AS last_date, "
+             "TOTAL(Price) AS price_sum, TOTAL(Price * julianday(Date)) AS weighted_sum "
+             "FROM DailyPrices WHERE Date < ?")
+    params = [end_exclusive_str]
+    if city_names:
+        query += f" AND City IN ({','.join('?' for _ in city_names)})"
+        params.extend(city_names)
+    query += " GROUP BY City"
+    conn = get_db_connection("NECC_PRICES_DB")
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    conn.close()
+    return {row['City']: f"{row['n']}|{row['first_date']}|{row['last_date']}|"
+                         f"{row['price_sum']!r}|{row['weighted_sum']!r}" for row in rows}
+
+
+def get_stored_forecasts(city_names, training_end_date):
+    """
+    Reads precomputed forecasts for city_names from the forecast store.
+    Returns {city: forecast list} for the cities that have an entry for the current model config.
+    """
+    if not city_names or not os.path.exists(CONFIG["FORECAST_STORE_DB"]):
+        return {}
+    try:
+        conn = get_db_connection("FORECAST_STORE_DB")
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT city, forecast_json FROM forecast_store WHERE training_end_date = ? AND model_config = ? "
+            f"AND city IN ({','.join('?' for _ in city_names)})",
+            [training_end_date.strftime(CONFIG['DATE_FORMAT']), get_forecast_model_config_key()] + list(city_names))
+        rows = cursor.fetchall()
+        conn.close()
+        return {row['city']: json.loads(row['forecast_json']) for row in rows}
+    except Exception as e:
+        logger.error(f"Error reading forecast store: {e}")
+        return {}
+
+
+def build_forecast_store(current_system_date, city_names=None, force=False):
+    """
+    Fits and stores forecasts for the training cutoff implied by current_system_date.
+    Only cities whose training data signature changed since the stored entry are refitted
+    (all requested cities when force is set). Returns the list of rebuilt cities.
+    """
+    training_end_date = get_training_end_date(current_system_date)
+    training_end_str = training_end_date.strftime(CONFIG['DATE_FORMAT'])
+    model_config = get_forecast_model_config_key()
+    signatures = get_training_data_signatures(training_end_date, city_names)
+    if city_names:
+        # Cities without any training rows still get an (empty) entry so they are not refitted per request
+        for city_name in city_names:
+            signatures.setdefault(city_name, "0")
+
+    conn = sqlite3.connect(CONFIG["FORECAST_STORE_DB"])
+    try:
+        conn.execute(FORECAST_STORE_SCHEMA)
+        stored_signatures = dict(conn.execute(
+            "SELECT city, data_signature FROM forecast_store WHERE training_end_date = ? AND model_config = ?",
+            (training_end_str, model_config)).fetchall())
+        to_build = sorted(city_name for city_name, signature in signatures.items()
+                          if force or stored_signatures.get(city_name) != signature)
+        logger.info(f"Forecast store: {len(to_build)} of {len(signatures)} cities need a rebuild "
+                    f"for training cutoff {training_end_str}.")
+        if not to_build:
+            return []
+
+        forecasts, fit_infos = fit_24_month_forecasts(to_build, training_end_date, signatures, with_fit_info=True)
+        built_at = datetime.now(pytz.timezone(CONFIG['TIMEZONE'])).isoformat(timespec='seconds')
+        save_hw_model_fits(conn, training_end_date, signatures, fit_infos, built_at)
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO forecast_store "
+                "(city, training_end_date, model_config, data_signature, forecast_json, built_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(city_name, training_end_str, model_config, signatures[city_name],
+                  json.dumps(forecasts[city_name]), built_at) for city_name in to_build])
+    finally:
+        conn.close()
+
+    # Drop the rebuilt cities' memoized forecasts so the new entries are served
+    for city_name in to_build:
+        cache.delete(generate_24_month_forecast.versioned_cache_key(city_name, current_system_date))
+    return to_build
+
+
+# --- Holt-Winters Model Registry ---
+# Every fit made by fit_24_month_forecasts is recorded per city and training cutoff (parameters, SSE,
+# fit time, optimizer iterations) in FORECAST_STORE_DB. Later fits start from it: identical training data
+# reuses the stored parameters without optimizing, otherwise the latest stored fit warm-starts the optimizer.
+
+HW_MODEL_REGISTRY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hw_model_registry (
+    city TEXT NOT NULL,
+    hw_config TEXT NOT NULL,
+    training_end_date TEXT NOT NULL,
+    data_signature TEXT NOT NULL,
+    params_json TEXT NOT NULL,
+    sse REAL,
+    fit_seconds REAL,
+    iterations INTEGER,
+    fit_mode TEXT,
+    fitted_at TEXT NOT NULL,
+    PRIMARY KEY (city, hw_config, training_end_date)
+)
+"""
+
+
+def get_hw_config_key():
+    """The settings that change the fitted parameters (MIN_MONTHS_DATA_FOR_MONTHLY_HW does not)."""
+    return json.dumps({
+        "trend": CONFIG["HW_TREND"],
+        "seasonal": CONFIG["HW_SEASONAL_MONTHLY"],
+        "seasonal_periods": CONFIG["HW_SEASONAL_PERIODS_MONTHLY"],
+    }, sort_keys=True)
+
+
+def get_hw_model_priors(city_names, training_end_date, signatures):
+    """
+    Returns {city: {"params": ..., "reuse": bool}} from the registry: reuse is set when the stored fit
+    has the same cutoff and training data signature, else the most recent fit is used as a warm start.
+    """
+    if not city_names or not os.path.exists(CONFIG["FORECAST_STORE_DB"]):
+        return {}
+    training_end_str = training_end_date.strftime(CONFIG['DATE_FORMAT'])
+    priors = {}
+    try:
+        conn = get_db_connection("FORECAST_STORE_DB")
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'hw_model_registry'")
+        if not cursor.fetchone():
+            conn.close()
+            return {}
+        cursor.execute(
+            f"SELECT city, training_end_date, data_signature, params_json FROM hw_model_registry "
+            f"WHERE hw_config = ? AND city IN ({','.join('?' for _ in city_names)}) "
+            f"ORDER BY city, training_end_date DESC",
+            [get_hw_config_key()] + list(city_names))
+        rows = cursor.fetchall()
+        conn.close()
+    except Exception as e:
+        logger.error(f"Error reading HW model registry: {e}")
+        return {}
+
+    for row in rows:
+        exact = row['training_end_date'] == training_end_str and row['data_signature'] == signatures.get(row['city'])
+        if row['city'] not in priors or exact:
+            priors[row['city']] = {"params": json.loads(row['params_json']), "reuse": exact}
+    return priors
+
+
+def save_hw_model_fits(conn, training_end_date, signatures, fit_infos, fitted_at):
+    """Records fit_infos ({city: fit_info}) in the registry on a writable forecast store connection."""
+    conn.execute(HW_MODEL_REGISTRY_SCHEMA)
+    training_end_str = training_end_date.strftime(CONFIG['DATE_FORMAT'])
+    hw_config = get_hw_config_key()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO hw_model_registry (city, hw_config, training_end_date, data_signature, "
+            "params_json, sse, fit_seconds, iterations, fit_mode, fitted_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(city_name, hw_config, training_end_str, signatures.get(city_name, "0"), json.dumps(info["params"]),
+              info["sse"], info["fit_seconds"], info["iterations"], info["fit_mode"], fitted_at)
+             for city_name, info in fit_infos.items()])
+    if fit_infos:
+        by_mode = {}
+        for info in fit_infos.values():
+            count, seconds = by_mode.get(info["fit_mode"], (0, 0.0))
+            by_mode[info["fit_mode"]] = (count + 1, seconds + info["fit_seconds"])
+        logger.info("HW fits recorded: " + ", ".join(
+            f"{mode} {count} ({seconds:.2f}s)" for mode, (count, seconds) in sorted(by_mode.items())))
+
+
+@app.cli.command("show-model-registry")
+@click.option("--city", "city_names", multiple=True, help="Only show these cities (repeatable).")
+def show_model_registry_command(city_names):
+    """Print recorded HW fits: SSE, fit time, optimizer iterations and how each fit was started."""
+    conn = sqlite3.connect(CONFIG["FORECAST_STORE_DB"])
+    try:
+        conn.execute(HW_MODEL_REGISTRY_SCHEMA)
+        query = ("SELECT city, training_end_date, fit_mode, iterations, fit_seconds, sse, fitted_at "
+                 "FROM hw_model_registry WHERE hw_config = ?")
+        params = [get_hw_config_key()]
+        if city_names:
+            query += f" AND city IN ({','.join('?' for _ in city_names)})"
+            params.extend(city_names)
+        rows = conn.execute(query + " ORDER BY city, training_end_date", params).fetchall()
+    finally:
+        conn.close()
+    click.echo(f"{'city':<30} {'cutoff':<10} {'mode':<6} {'iters':>5} {'seconds':>8} {'sse':>12}  fitted_at")
+    for city, cutoff, mode, iterations, seconds, sse, fitted_at in rows:
+        click.echo(f"{city:<30} {cutoff:<10} {mode:<6} {iterations:>5} {seconds:>8.3f} {sse:>12.3f}  {fitted_at}")
+
+
+@app.cli.command("build-forecasts")
+@click.option("--city", "city_names", multiple=True, help="Only rebuild these NECC cities (repeatable).")
+@click.option("--force", is_flag=True, help="Refit even if the training data is unchanged.")
+@click.option("--date", "system_date", default=None, help="System date (YYYY-MM-DD) that determines the training cutoff.")
+def build_forecasts_command(city_names, force, system_date):
+    """Precompute 24-month forecasts into the forecast store."""
+    if system_date:
+        current_system_date = datetime.strptime(system_date, CONFIG['DATE_FORMAT']).date()
+    else:
+        current_system_date = datetime.now(pytz.timezone(CONFIG['TIMEZONE'])).date()
+    rebuilt = build_forecast_store(current_system_date, list(city_names) or None, force=force)
+    click.echo(f"Rebuilt {len(rebuilt)} forecast(s) for training cutoff {get_training_end_date(current_system_date)}.")
+
+
+# --- Backtesting ---
+# Rolling-origin evaluation of the forecast model: for every city and cutoff year the model is fitted on the
+# months up to Dec 31 of the previous year (as generate_24_month_forecast does) and its forecast is scored
+# against the months that actually followed. Each city's monthly series is loaded once and all of its
+# cutoffs and model configurations are evaluated in one process-pool task. Results go to FORECAST_STORE_DB.
+
+BACKTEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backtest_results (
+    run_id TEXT NOT NULL,
+    city TEXT NOT NULL,
+    model_config TEXT NOT NULL,
+    training_end_date TEXT NOT NULL,
+    horizon_months INTEGER NOT NULL,
+    n_points INTEGER NOT NULL,
+    mape REAL,
+    rmse REAL,
+    fit_seconds REAL,
+    PRIMARY KEY (run_id, city, model_config, training_end_date)
+)
+"""
+
+
+def make_backtest_model_config(trend, seasonal, min_months):
+    """Model configuration evaluated by a backtest; json.dumps(..., sort_keys=True) of it is its key."""
+    return {
+        "trend": trend,
+        "seasonal": seasonal,
+        "seasonal_periods": CONFIG["HW_SEASONAL_PERIODS_MONTHLY"],
+        "min_months": min_months,
+    }
+
+
+def forecast_error_metrics(actual, predicted):
+    """(MAPE in %, RMSE) of two aligned arrays; months with a zero or missing value are ignored."""
+    actual = np.asarray(actual, dtype=np.float64)
+    predicted = np.asarray(predicted, dtype=np.float64)
+    valid = np.isfinite(actual) & np.isfinite(predicted) & (actual != 0)
+    if not valid.any():
+        return None, None
+    errors = actual[valid] - predicted[valid]
+    return float(np.mean(np.abs(errors / actual[valid])) * 100), float(np.sqrt(np.mean(errors ** 2)))
+
+
+def backtest_city(city_name, monthly_series, cutoff_years, model_configs, horizon):
+    """
+    Evaluates every model config at every cutoff year for one city's monthly average series.
+    Module level and free of app state so it can run in a process pool. Consecutive cutoffs of a
+    config warm-start from the previous fit, like production fits do from the model registry.
+    Returns [(city, config key, training_end_date, n_points, mape, rmse, fit_seconds)].
+    """
+    rows = []
+    for model_config in model_configs:
+        config_key = json.dumps(model_config, sort_keys=True)
+        prior_fit = None
+        for year in cutoff_years:
+            # Label slices keep the series' monthly frequency, which the forecast index is built from
+            training = monthly_series.loc[:pd.Timestamp(year - 1, 12, 1)]
+            actual = monthly_series.loc[pd.Timestamp(year, 1, 1):pd.Timestamp(year, 1, 1) + pd.DateOffset(months=horizon - 1)]
+            if len(training) < model_config["min_months"] or actual.empty:
+                continue
+            try:
+                results, fit_info = fit_hw_model(training, prior_fit, model_config)
+                predicted = results.forecast(horizon)
+            except Exception as e:
+                logger.warning(f"Backtest fit failed for {city_name}, cutoff {year - 1}-12-31, {config_key}: {e}")
+                continue
+            prior_fit = {"params": fit_info["params"]}
+            # Align the forecast with the months that have actual data
+            predicted_values = predicted.reindex(actual.index).to_numpy(dtype=np.float64)
+            mape, rmse = forecast_error_metrics(actual.to_numpy(dtype=np.float64), predicted_values)
+            rows.append((city_name, config_key, f"{year - 1}-12-31", int(np.isfinite(predicted_values).sum()),
+                         mape, rmse, fit_info["fit_seconds"]))
+    return rows
+
+
+def run_backtest(model_configs, city_names=None, start_year=None, end_year=None, horizon=24, run_id=None):
+    """
+    Runs a rolling-origin backtest over city_names (all NECC cities by default) and stores the rows under
+    run_id in backtest_results. Only complete months (up to the end of last month) are used.
+    Returns (run_id, number of evaluations stored).
+    """
+    now = datetime.now(pytz.timezone(CONFIG['TIMEZONE']))
+    run_id = run_id or now.strftime("%Y%m%dT%H%M%S")
+    data_end_date = now.date().replace(day=1) - timedelta(days=1)
+    if not city_names:
+        conn = get_db_connection("NECC_PRICES_DB")
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT City FROM DailyPrices ORDER BY City")
+        city_names = [row['City'] for row in cursor.fetchall()]
+        conn.close()
+    monthly_by_city = get_monthly_avgs_for_cities_df(city_names, data_end_date)
+
+    min_year = min((series.index[0].year for series in monthly_by_city.values() if len(series)), default=None)
+    if min_year is None:
+        return run_id, 0
+    cutoff_years = list(range(max(start_year or min_year + 1, min_year + 1), (end_year or data_end_date.year) + 1))
+    tasks = [(city_name, monthly_by_city[city_name], cutoff_years, model_configs, horizon)
+             for city_name in city_names if city_name in monthly_by_city]
+    max_workers = min(CONFIG["BACKTEST_MAX_WORKERS"] or os.cpu_count() or 1, len(tasks))
+    logger.info(f"Backtest {run_id}: {len(tasks)} cities x {len(cutoff_years)} cutoffs x {len(model_configs)} "
+                f"configs with {max(max_workers, 1)} worker(s).")
+
+    results = None
+    if max_workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(backtest_city, *zip(*tasks)))
+        except Exception as e:
+            logger.error(f"Process pool backtest failed, falling back to serial evaluation: {e}")
+            results = None
+    if results is None:
+        results = [backtest_city(*task) for task in tasks]
+
+    rows = [(run_id, city_name, config_key, cutoff, horizon, n_points, mape, rmse, fit_seconds)
+            for city_rows in results for city_name, config_key, cutoff, n_points, mape, rmse, fit_seconds in city_rows]
+    conn = sqlite3.connect(CONFIG["FORECAST_STORE_DB"])
+    try:
+        conn.execute(BACKTEST_SCHEMA)
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO backtest_results (run_id, city, model_config, training_end_date, "
+                "horizon_months, n_points, mape, rmse, fit_seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    finally:
+        conn.close()
+    return run_id, len(rows)
+
+
+def get_backtest_report(run_id=None, city_name=None):
+    """
+    Summarises a stored backtest run (the latest one by default): per model config the mean MAPE and RMSE
+    over all city/cutoff evaluations, best first, and per cutoff year. Returns None if there is no such run.
+    """
+    if not os.path.exists(CONFIG["FORECAST_STORE_DB"]):
+        return None
+    conn = get_db_connection("FORECAST_STORE_DB")
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'backtest_results'")
+        if not cursor.fetchone():
+            return None
+        if not run_id:
+            cursor.execute("SELECT MAX(run_id) AS run_id FROM backtest_results")
+            run_id = cursor.fetchone()['run_id']
+        query = ("SELECT city, model_config, training_end_date, horizon_months, n_points, mape, rmse "
+                 "FROM backtest_results WHERE run_id = ?")
+        params = [run_id]
+        if city_name:
+            query += " AND city = ?"
+            params.append(city_name)
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return None
+
+    config_keys = np.array([row['model_config'] for row in rows])
+    cutoffs = np.array([row['training_end_date'] for row in rows])
+    mapes = np.array([row['mape'] if row['mape'] is not None else np.nan for row in rows], dtype=np.float64)
+    rmses = np.array([row['rmse'] if row['rmse'] is not None else np.nan for row in rows], dtype=np.float64)
+
+    def summarise(mask):
+        return {
+            "evaluations": int(mask.sum()),
+            "mean_mape": round(float(np.nanmean(mapes[mask])), 3) if np.isfinite(mapes[mask]).any() else None,
+            "mean_rmse": round(float(np.nanmean(rmses[mask])), 3) if np.isfinite(rmses[mask]).any() else None,
+        }
+
+    configs = []
+    for config_key in np.unique(config_keys):
+        in_config = config_keys == config_key
+        summary = {"model_config": json.loads(config_key), **summarise(in_config)}
+        summary["by_cutoff"] = {cutoff: summarise(in_config & (cutoffs == cutoff))
+                                for cutoff in np.unique(cutoffs[in_config]).tolist()}
+        configs.append(summary)
+    configs.sort(key=lambda summary: (summary["mean_mape"] is None, summary["mean_mape"] or 0))
+    return {"run_id": run_id, "city": city_name, "horizon_months": rows[0]['horizon_months'],
+            "cities": len({row['city'] for row in rows}), "configs": configs}
+
+
+@app.cli.command("backtest")
+@click.option("--trend", "trends", multiple=True, help="HW trend to evaluate: add, mul or none (repeatable; default HW_TREND).")
+@click.option("--seasonal", "seasonals", multiple=True, help="HW seasonality: add, mul or none (repeatable; default HW_SEASONAL_MONTHLY).")
+@click.option("--min-months", "min_months_values", multiple=True, type=int, help="MIN_MONTHS_DATA_FOR_MONTHLY_HW values (repeatable).")
+@click.option("--city", "city_names", multiple=True, help="Only these cities (repeatable; default all).")
+@click.option("--start-year", type=int, default=None, help="First forecast year evaluated.")
+@click.option("--end-year", type=int, default=None, help="Last forecast year evaluated.")
+@click.option("--horizon", type=click.IntRange(1, 24), default=24, show_default=True, help="Months scored after each cutoff.")
+def backtest_command(trends, seasonals, min_months_values, city_names, start_year, end_year, horizon):
+    """Rolling-origin backtest of the forecast model over every combination of the given settings."""
+    def parse_component(value):
+        value = value.lower()
+        if value not in ("add", "mul", "none"):
+            raise click.BadParameter(f"'{value}' is not one of add, mul, none.")
+        return None if value == "none" else value
+
+    model_configs = [make_backtest_model_config(trend, seasonal, min_months)
+                     for trend in ([parse_component(t) for t in trends] or [CONFIG["HW_TREND"]])
+                     for seasonal in ([parse_component(v) for v in seasonals] or [CONFIG["HW_SEASONAL_MONTHLY"]])
+                     for min_months in (min_months_values or [CONFIG["MIN_MONTHS_DATA_FOR_MONTHLY_HW"]])]
+    started = time.perf_counter()
+    run_id, evaluations = run_backtest(model_configs, list(city_names) or None, start_year, end_year, horizon)
+    click.echo(f"Backtest {run_id}: {evaluations} evaluations in {time.perf_counter() - started:.1f}s.")
+    report = get_backtest_report(run_id)
+    for summary in (report or {}).get("configs", []):
+        click.echo(f"  MAPE {summary['mean_mape']!s:>8}%  RMSE {summary['mean_rmse']!s:>9}  "
+                   f"n={summary['evaluations']:<5} {json.dumps(summary['model_config'], sort_keys=True)}")
+
+
+@timed_span("dynamic_averages")
+def calculate_dynamic_averages_from_forecast(forecast, current_system_date):
+    """
+    Calculates dynamic averages (1M, 3M, 6M, 9M, 12M) from a MonthlyForecast,
+    starting from the month *after* the current_system_date.
+    Returns a dict with average values and individual next 12 months (from current+1).
+    Returns dict with None/empty values if prediction data is not available.
+    """
+    logger.info(f"Calculating dynamic averages from forecast data. Current date: {current_system_date}.")
+
+    results = {
+        "next_1_month_avg": None, "next_3_months_avg": None,
+        "next_6_months_avg": None, "next_9_months_avg": None,
+        "next_12_months_avg": None,
+        "individual_next_12_months": [] # List of monthly predictions for the next 12 months starting from current+1
+    }
+
+    if not len(forecast):
+        logger.warning("No forecast data provided for dynamic average calculation.")
+        return results
+
+    # Position of the month after the current month; each window average is two prefix-sum lookups.
+    # Windows end where the original month-start + MonthEnd(p_months - 1) bound did, which is
+    # p_months - 1 months in (1 month for the 1-month average); kept so served values don't change.
+    start = forecast.offset(current_system_date.year, current_system_date.month) + 1
+    for p_months in [1, 3, 6, 9, 12]:
+        average = forecast.average(start, max(p_months - 1, 1))
+        if average is not None:
+            results[f"next_{p_months}_month{'s' if p_months > 1 else ''}_avg"] = round(average, 2)
+
+    # The next 12 months that have a predicted price, starting from the month after the current month
+    results["individual_next_12_months"] = forecast.to_list(max(start, 0), skip_missing=True)[:12]
+    return results
+
+
+def build_prediction_payload(effective_city_name, current_system_date, latest_price_data, forecast):
+    """
+    Assembles the prediction response body for one NECC city from its latest price
+    and its full 24-month MonthlyForecast. Shared by the single-city and batch endpoints.
+    """
+    if not isinstance(forecast, MonthlyForecast):
+        forecast = MonthlyForecast.from_list(forecast) # Forecast lists cached before MonthlyForecast existed
+
+    # Derive Calendar Year Prediction Average and breakdown from the first 12 months of the 24-month forecast
+    # The 24-month forecast starts from Jan of the current year.
+    calendar_year_avg_price = forecast.average(0, 12)
+    calendar_year_prediction_data = {
+        "year": current_system_date.year, # Calendar year is the current system year
+        "avg_price": round(calendar_year_avg_price, 2) if calendar_year_avg_price is not None else None,
+        # The 'predictions' field contains the first 12 months from the full forecast for calendar year breakdown
+        "predictions": forecast.to_list(0, 12)
+    }
+
+    return {
+        "city_name_used_for_prediction": effective_city_name, # Important for frontend mapping
+        "latest_price_info": latest_price_data,
+        # Include the full 24-month forecast data as the main prediction dataset
+        "full_24_month_forecast": forecast.to_list(),
+        # Include derived data: Calendar year prediction (average and first 12 months breakdown)
+        "next_calendar_year_prediction": calendar_year_prediction_data,
+        # Dynamic averages (1M, 3M.. 12M) and individual next 12 months (from current+1)
+        "dynamic_averages_from_forecast": calculate_dynamic_averages_from_forecast(forecast, current_system_date),
+    }
+
+
+# --- Aggregates Engine ---
+# Yearly and monthly averages for any number of cities come from per-month (sum, count) groups computed
+# in one grouped pass: the MonthlyPriceRollup table when it has been built (`flask build-rollups`), a NumPy
+# group-by over the columnar price store, or a single SQL GROUP BY over DailyPrices.
+
+PRICE_ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS MonthlyPriceRollup (
+    City TEXT NOT NULL,
+    Year INTEGER NOT NULL,
+    Month INTEGER NOT NULL,
+    PriceSum REAL NOT NULL,
+    PriceCount INTEGER NOT NULL,
+    PRIMARY KEY (City, Year, Month)
+);
+CREATE TABLE IF NOT EXISTS PriceRollupState (
+    City TEXT PRIMARY KEY,
+    Signature TEXT NOT NULL
+);
+"""
+
+def sql_price_value(value):
+    """
+    price_value() SQL function: a TEXT price parsed the way to_numeric(errors='coerce') reads it, or NULL
+    when it is not a number (float() alone would also accept '1_000' and 'nan').
+    """
+    if not isinstance(value, str) or '_' in value:
+        return None
+    try:
+        price = float(value)
+    except ValueError:
+        return None
+    return price if price == price else None # NaN != NaN
+
+
+def register_price_functions(conn):
+    """Registers price_value() (see sql_price_value) on a necc_prices.db connection."""
+    conn.create_function("price_value", 1, sql_price_value, deterministic=True)
+
+
+# Numeric prices count as they are; TEXT prices (e.g. a Price column without REAL affinity) are parsed by
+# price_value(), so the sums match to_numeric(errors='coerce') + dropna in get_historical_daily_prices_df.
+PRICE_VALUE_SQL = "CASE typeof(Price) WHEN 'integer' THEN Price WHEN 'real' THEN Price WHEN 'text' THEN price_value(Price) END"
+MONTHLY_SUMS_SQL = f"""
+    SELECT City, CAST(strftime('%Y', Date) AS INTEGER) AS Year, CAST(strftime('%m', Date) AS INTEGER) AS Month,
+           SUM({PRICE_VALUE_SQL}) AS PriceSum, COUNT({PRICE_VALUE_SQL}) AS PriceCount
+    FROM DailyPrices
+    WHERE City IN ({{placeholders}}) AND strftime('%Y', Date) IS NOT NULL
+    GROUP BY City, Year, Month
+    HAVING PriceCount > 0
+"""
+
+
+def get_monthly_price_sums(city_names):
+    """
+    Returns {city: [(year, month, price_sum, price_count), ...]} sorted by month, for every city with data.
+    """
+    if not city_names:
+        return {}
+    city_names = list(city_names)
+    placeholders = ",".join("?" for _ in city_names)
+    sums_by_city = {}
+
+    conn = get_db_connection("NECC_PRICES_DB")
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'PriceRollupState'")
+        if cursor.fetchone():
+            cursor.execute(f"SELECT City FROM PriceRollupState WHERE City IN ({placeholders})", city_names)
+            rolled_up = [row['City'] for row in cursor.fetchall()]
+            if rolled_up:
+                cursor.execute(
+                    f"SELECT City, Year, Month, PriceSum, PriceCount FROM MonthlyPriceRollup "
+                    f"WHERE City IN ({','.join('?' for _ in rolled_up)}) ORDER BY City, Year, Month", rolled_up)
+                for row in cursor.fetchall():
+                    sums_by_city.setdefault(row['City'], []).append(
+                        (row['Year'], row['Month'], row['PriceSum'], row['PriceCount']))
+            # Cities the rollup has never seen fall through to a direct aggregation
+            city_names = [c for c in city_names if c not in set(rolled_up)]
+            if not city_names:
+                return sums_by_city
+            placeholders = ",".join("?" for _ in city_names)
+
+        store = get_price_store()
+        if store is None:
+            cursor.execute(MONTHLY_SUMS_SQL.format(placeholders=placeholders) + " ORDER BY City, Year, Month",
+                           city_names)
+            for row in cursor.fetchall():
+                sums_by_city.setdefault(row['City'], []).append(
+                    (row['Year'], row['Month'], row['PriceSum'], row['PriceCount']))
+            return sums_by_city
+    finally:
+        conn.close()
+
+    for city_name in city_names:
+        days, prices = store.city_prices(city_name)
+        if len(days) == 0:
+            continue
+        month_ordinals = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        first_month = int(month_ordinals[0])
+        bins = month_ordinals - first_month
+        price_sums = np.bincount(bins, weights=prices)
+        price_counts = np.bincount(bins)
+        present = np.nonzero(price_counts)[0]
+        sums_by_city[city_name] = [
+            ((first_month + int(b)) // 12 + 1970, (first_month + int(b)) % 12 + 1, float(price_sums[b]), int(price_counts[b]))
+            for b in present]
+    return sums_by_city
+
+
+def build_averages_payload(city_name, monthly_sums):
+    """Builds the /api/averages body for one city from its sorted (year, month, sum, count) groups."""
+    yearly_avg = []
+    monthly_avg_last_5_years = []
+    if monthly_sums:
+        years = {}
+        for year, month, price_sum, price_count in monthly_sums:
+            year_sum, year_count = years.get(year, (0.0, 0))
+            years[year] = (year_sum + price_sum, year_count + price_count)
+        yearly_avg = [{'year': year, 'avg_price': round(year_sum / year_count, 2)}
+                      for year, (year_sum, year_count) in sorted(years.items())]
+
+        # Monthly averages for the last 5 years relative to the latest data year (e.g. 2021-2025 if latest is 2025)
+        start_year_5_years_ago = monthly_sums[-1][0] - 4
+        monthly_avg_last_5_years = [{'year': year, 'month': month, 'avg_price': round(price_sum / price_count, 2)}
+                                    for year, month, price_sum, price_count in monthly_sums
+                                    if year >= start_year_5_years_ago]
+    return {
+        "city": city_name,
+        "yearly_avg": yearly_avg,
+        "monthly_avg_last_5_years": monthly_avg_last_5_years
+    }
+
+
+def get_city_data_signatures(conn, city_names=None):
+    """Returns {city: signature} over all DailyPrices rows of each city; it changes when any row changes."""
+    query = ("SELECT City, COUNT(*) AS n, MAX(Date) AS last_date, TOTAL(Price) AS price_sum, "
+             "TOTAL(Price * julianday(Date)) AS weighted_sum FROM DailyPrices")
+    params = []
+    if city_names:
+        query += f" WHERE City IN ({','.join('?' for _ in city_names)})"
+        params = list(city_names)
+    query += " GROUP BY City"
+    return {row[0]: f"{row[1]}|{row[2]}|{row[3]!r}|{row[4]!r}" for row in conn.execute(query, params)}
+
+
+def refresh_price_rollup(conn, city_names=None, force=False):
+    """
+    Brings MonthlyPriceRollup up to date on a writable connection to necc_prices.db.
+    Only cities whose DailyPrices signature changed since the last refresh are re-aggregated
+    (all given cities when force is set). Returns the list of refreshed cities.
+    """
+    conn.executescript(PRICE_ROLLUP_SCHEMA)
+    register_price_functions(conn)
+    signatures = get_city_data_signatures(conn, city_names)
+    stored = dict(conn.execute("SELECT City, Signature FROM PriceRollupState").fetchall())
+    changed = sorted(c for c, signature in signatures.items() if force or stored.get(c) != signature)
+    # Cities that no longer have any rows
+    removed = [c for c in (city_names or stored.keys()) if c in stored and c not in signatures]
+
+    with conn:
+        for city_name in removed:
+            conn.execute("DELETE FROM MonthlyPriceRollup WHERE City = ?", (city_name,))
+            conn.execute("DELETE FROM PriceRollupState WHERE City = ?", (city_name,))
+        for i in range(0, len(changed), 500):
+            batch = changed[i:i + 500]
+            placeholders = ",".join("?" for _ in batch)
+            conn.execute(f"DELETE FROM MonthlyPriceRollup WHERE City IN ({placeholders})", batch)
+            conn.execute("INSERT INTO MonthlyPriceRollup (City, Year, Month, PriceSum, PriceCount) "
+                         + MONTHLY_SUMS_SQL.format(placeholders=placeholders), batch)
+            conn.executemany("INSERT OR REPLACE INTO PriceRollupState (City, Signature) VALUES (?, ?)",
+                             [(c, signatures[c]) for c in batch])
+    if changed or removed:
+        logger.info(f"Price rollup refreshed for {len(changed)} cities, removed {len(removed)}.")
+    return changed
+
+
+@app.cli.command("build-rollups")
+@click.option("--city", "city_names", multiple=True, help="Only refresh these cities (repeatable).")
+@click.option("--force", is_flag=True, help="Re-aggregate even if the city's rows are unchanged.")
+def build_rollups_command(city_names, force):
+    """Create or incrementally refresh the MonthlyPriceRollup table in necc_prices.db."""
+    conn = sqlite3.connect(CONFIG["NECC_PRICES_DB"])
+    try:
+        refreshed = refresh_price_rollup(conn, list(city_names) or None, force=force)
+        if refreshed:
+            bump_derived_table_version(conn, "MonthlyPriceRollup")
+    finally:
+        conn.close()
+    click.echo(f"Refreshed monthly rollups for {len(refreshed)} cities.")
+
+
+# --- Price Ingest ---
+# `flask ingest-prices` and POST /api/ingest bulk-load NECC daily price files into DailyPrices. Each batch is
+# staged with executemany and merged set-based (UPDATE ... FROM, INSERT ... WHERE NOT EXISTS), all in one WAL
+# transaction, so a (City, Date) that already exists is updated rather than duplicated. The derived tables of
+# the changed cities are then refreshed and their data versions bumped, which retires their cached entries.
+
+INGEST_STAGING_SCHEMA = """
+CREATE TEMP TABLE IF NOT EXISTS ingest_staging (
+    City TEXT NOT NULL,
+    Date TEXT NOT NULL,
+    Price REAL NOT NULL,
+    PRIMARY KEY (City, Date)
+)
+"""
+
+
+def _iter_raw_price_records(lines, file_format):
+    """Yields (line_number, {lowercased key: value}) from CSV or NDJSON text lines."""
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, {(key or '').strip().lower(): value for key, value in row.items()}
+    elif file_format == 'ndjson':
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"line {line_number}: invalid JSON ({e})") from None
+            if not isinstance(record, dict):
+                raise ValueError(f"line {line_number}: expected a JSON object")
+            yield line_number, {str(key).lower(): value for key, value in record.items()}
+    else:
+        raise ValueError(f"Unsupported ingest format: {file_format}")
+
+
+def parse_price_records(lines, file_format):
+    """
+    Yields (city, date, price) from text lines in 'csv' (header with City, Date and Price columns, any case)
+    or 'ndjson' ({"city": ..., "date": ..., "price": ...} per line) format. Dates are normalized to YYYY-MM-DD.
+    Raises ValueError naming the line of the first invalid record.
+    """
+    for line_number, record in _iter_raw_price_records(lines, file_format):
+        try:
+            city_name = str(record.get('city') or '').strip()
+            if not city_name:
+                raise ValueError("missing city")
+            date_str = date_type.fromisoformat(str(record.get('date') or '').strip()[:10]).strftime(CONFIG['DATE_FORMAT'])
+            price = float(record.get('price'))
+            if not np.isfinite(price):
+                raise ValueError(f"price is not finite: {price}")
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"line {line_number}: {e}") from None
+        yield city_name, date_str, price
+
+
+def ingest_price_records(records, refresh_forecasts=True):
+    """
+    Upserts (city, date, price) records into DailyPrices and refreshes everything derived from the changed
+    cities: MonthlyPriceRollup and LatestPrices (when built), stored forecasts, the columnar price store and
+    their CityDataVersion. An invalid record aborts the ingest before anything is committed.
+    Returns {"rows", "inserted", "updated", "unchanged", "changed_cities"}.
+    """
+    stats = {"rows": 0, "inserted": 0, "updated": 0}
+    changed_cities = set()
+    records = iter(records)
+    conn = sqlite3.connect(CONFIG["NECC_PRICES_DB"], timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(CITY_DATA_VERSION_SCHEMA)
+        conn.execute(INGEST_STAGING_SCHEMA)
+        with conn:
+            while True:
+                batch = list(itertools.islice(records, CONFIG["INGEST_BATCH_SIZE"]))
+                if not batch:
+                    break
+                conn.execute("DELETE FROM ingest_staging")
+                # A (City, Date) repeated within the batch keeps its last price
+                conn.executemany("INSERT OR REPLACE INTO ingest_staging (City, Date, Price) VALUES (?, ?, ?)", batch)
+                changed_cities.update(row[0] for row in conn.execute(
+                    "SELECT DISTINCT s.City FROM ingest_staging s WHERE NOT EXISTS "
+                    "(SELECT 1 FROM DailyPrices d WHERE d.City = s.City AND d.Date = s.Date AND d.Price IS s.Price)"))
+                stats["updated"] += conn.execute(
+                    "UPDATE DailyPrices SET Price = s.Price FROM ingest_staging s "
+                    "WHERE DailyPrices.City = s.City AND DailyPrices.Date = s.Date "
+                    "AND DailyPrices.Price IS NOT s.Price").rowcount
+                stats["inserted"] += conn.execute(
+                    "INSERT INTO DailyPrices (Date, City, Price) SELECT s.Date, s.City, s.Price FROM ingest_staging s "
+                    "WHERE NOT EXISTS (SELECT 1 FROM DailyPrices d WHERE d.City = s.City AND d.Date = s.Date)").rowcount
+                stats["rows"] += len(batch)
+            conn.execute("DELETE FROM ingest_staging")
+        stats["unchanged"] = max(stats["rows"] - stats["inserted"] - stats["updated"], 0)
+        changed = sorted(changed_cities)
+        stats["changed_cities"] = changed
+        logger.info(f"Ingested {stats['rows']} price rows: {stats['inserted']} inserted, {stats['updated']} updated, "
+                    f"{len(changed)} cities changed.")
+        if not changed:
+            return stats
+
+        # Derived data first, versions last: a worker that sees the new version also sees the refreshed tables
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "PriceRollupState" in tables:
+            refresh_price_rollup(conn, changed)
+        if "LatestPrices" in tables:
+            refresh_latest_prices(conn, changed)
+        if refresh_forecasts and os.path.exists(CONFIG["FORECAST_STORE_DB"]):
+            build_forecast_store(datetime.now(pytz.timezone(CONFIG['TIMEZONE'])).date(), changed)
+
+        updated_at = datetime.now(pytz.timezone(CONFIG['TIMEZONE'])).isoformat(timespec='seconds')
+        with conn:
+            conn.executemany(
+                "INSERT INTO CityDataVersion (City, Version, UpdatedAt) VALUES (?, 1, ?) "
+                "ON CONFLICT(City) DO UPDATE SET Version = Version + 1, UpdatedAt = excluded.UpdatedAt",
+                [(city_name, updated_at) for city_name in changed])
+    finally:
+        conn.close()
+
+    get_city_data_versions(force=True)
+    get_price_store() # Rebuild the on-disk store now rather than in the first request after the ingest
+    return stats
+
+
+@app.cli.command("ingest-prices")
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "file_format", type=click.Choice(["csv", "ndjson"]), default=None,
+              help="Input format (default: .ndjson/.jsonl files are NDJSON, anything else CSV).")
+@click.option("--no-forecasts", is_flag=True, help="Do not refit stored forecasts of the changed cities.")
+def ingest_prices_command(paths, file_format, no_forecasts):
+    """Bulk-load NECC daily price files (CSV or NDJSON) into DailyPrices."""
+    def records():
+        for path in paths:
+            path_format = file_format or ('ndjson' if path.lower().endswith(('.ndjson', '.jsonl')) else 'csv')
+            with open(path, newline='', encoding='utf-8') as f:
+                try:
+                    yield from parse_price_records(f, path_format)
+                except ValueError as e:
+                    raise ValueError(f"{path}: {e}") from None
+
+    try:
+        stats = ingest_price_records(records(), refresh_forecasts=not no_forecasts)
+    except ValueError as e:
+        raise click.ClickException(f"Ingest aborted, nothing was written. {e}")
+    click.echo(f"Ingested {stats['rows']} rows: {stats['inserted']} inserted, {stats['updated']} updated, "
+               f"{stats['unchanged']} unchanged. Changed cities: {', '.join(stats['changed_cities']) or 'none'}.")
+
+
+# --- Spatial Index ---
+# Nearest-NECC lookups for arbitrary coordinates. NECC cities are indexed in a KD-tree over their unit-sphere
+# (x, y, z) positions: straight-line (chord) distance orders points exactly like great-circle distance, so
+# the tree's k nearest are the k nearest by haversine, which is then computed for them with NumPy.
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km. Arguments are degrees (scalars or arrays, broadcast against each other)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _unit_sphere_points(latitudes, longitudes):
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
 
 
-    daily_df_filtered = daily_df[daily_df.index <= end_date_ts]
+class SpatialIndex:
+    """KD-tree over named points; query() returns the k nearest names with haversine distances in km."""
 
+    def __init__(self, names, latitudes, longitudes):
+        from scipy.spatial import cKDTree # Deferred to the first nearest-city lookup
 
-    if daily_df_filtered.empty:
-         logger.warning(f"No daily data found up to {end_date} after filtering for {city_name}.")
-         return pd.Series(name="Price", dtype=float)
+        self.names = list(names)
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.tree = cKDTree(_unit_sphere_points(self.latitudes, self.longitudes)) if self.names else None
 
-    # Resample to monthly start and calculate mean
-    # Use .mean() method which handles NaNs correctly
-    monthly_avg = daily_df_filtered['Price'].resample('MS').mean().dropna()
+    def __len__(self):
+        return len(self.names)
 
-    return monthly_avg
+    def query(self, latitudes, longitudes, k=1):
+        """
+        For arrays of query points returns (indices, distances_km), both shaped (n_points, k'),
+        with k' = min(k, len(self)), nearest first.
+        """
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+        longitudes = np.atleast_1d(np.asarray(longitudes, dtype=np.float64))
+        k = min(k, len(self))
+        if k == 0:
+            empty = np.empty((len(latitudes), 0))
+            return empty.astype(np.intp), empty
+        _, indices = self.tree.query(_unit_sphere_points(latitudes, longitudes), k=k)
+        indices = np.asarray(indices).reshape(len(latitudes), k)
+        distances = haversine_km(latitudes[:, None], longitudes[:, None],
+                                 self.latitudes[indices], self.longitudes[indices])
+        return indices, distances
 
 
-@cache.memoize(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"])
-def get_latest_price_info_db(city_name):
-    logger.info(f"Fetching latest price for {city_name} from DB.")
+_necc_spatial_index = None
+_necc_spatial_index_signature = None
+_necc_spatial_index_lock = threading.Lock()
+
+
+def get_necc_spatial_index():
+    """SpatialIndex over necc_city_coordinates, rebuilt when nearest_necc.db changes. None if unavailable."""
+    global _necc_spatial_index, _necc_spatial_index_signature
     try:
-        conn = get_db_connection("NECC_PRICES_DB")
-        cursor = conn.cursor()
-        cursor.execute("SELECT Date, Price FROM DailyPrices WHERE City = ? ORDER BY Date DESC LIMIT 1", (city_name,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return {"date": row['Date'], "price": float(row['Price']) if row['Price'] is not None else None}
-        return {"date": None, "price": None}
-    except Exception as e:
-        logger.error(f"Database error fetching latest price for {city_name}: {e}")
-        return {"date": None, "price": None}
+        stat = os.stat(CONFIG["NEAREST_NECC_DB"])
+    except OSError as e:
+        logger.error(f"Could not stat {CONFIG['NEAREST_NECC_DB']} for the spatial index: {e}")
+        return None
+    signature = (stat.st_size, stat.st_mtime_ns)
+    if _necc_spatial_index is not None and _necc_spatial_index_signature == signature:
+        return _necc_spatial_index
+    with _necc_spatial_index_lock:
+        if _necc_spatial_index is not None and _necc_spatial_index_signature == signature:
+            return _necc_spatial_index
+        try:
+            conn = get_db_connection("NEAREST_NECC_DB")
+            cursor = conn.cursor()
+            cursor.execute("SELECT city, latitude, longitude FROM necc_city_coordinates "
+                           "WHERE latitude IS NOT NULL AND longitude IS NOT NULL ORDER BY city")
+            rows = cursor.fetchall()
+            conn.close()
+            _necc_spatial_index = SpatialIndex([row['city'] for row in rows], [row['latitude'] for row in rows],
+                                               [row['longitude'] for row in rows])
+            _necc_spatial_index_signature = signature
+            logger.info(f"Spatial index built over {len(_necc_spatial_index)} NECC cities.")
+        except Exception as e:
+            logger.error(f"Could not build NECC spatial index: {e}")
+            return None
+        return _necc_spatial_index
 
-# --- Prediction Engine (Enhanced) ---
 
-@cache.memoize(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"])
-def generate_24_month_forecast(city_name, current_system_date):
+def find_nearest_necc_cities(latitudes, longitudes, k=1):
     """
-    Generates a 24-month forecast (monthly) using HW model trained on data
-    up to the end of the year preceding the current_system_date's year.
-    Forecast starts from the beginning of the current_system_date's year.
-    Returns a list of dictionaries: [{"month": "YYYY-MM", "price": price}].
-    Returns empty list if prediction is not possible due to insufficient data.
+    Returns, for each query point, a list of its k nearest NECC cities:
+    [{"name", "latitude", "longitude", "distance"}] with distance in km, nearest first.
     """
-    logger.info(f"Generating 24-month forecast for {city_name}. Current system date: {current_system_date}")
+    index = get_necc_spatial_index()
+    if index is None:
+        raise RuntimeError("NECC spatial index is unavailable")
+    indices, distances = index.query(latitudes, longitudes, k)
+    return [[{"name": index.names[i], "latitude": float(index.latitudes[i]), "longitude": float(index.longitudes[i]),
+              "distance": round(float(distance), 2)} for i, distance in zip(row_indices, row_distances)]
+            for row_indices, row_distances in zip(indices.tolist(), distances.tolist())]
 
-    # Determine the end date for training data: end of the year before the current year
-    training_end_date = datetime(current_system_date.year - 1, 12, 31).date()
-    training_end_timestamp = pd.Timestamp(training_end_date)
 
-    # Get historical monthly averages up to the training end date
-    historical_monthly_data = get_historical_monthly_avg_up_to_date_df(city_name, training_end_timestamp)
+def parse_coordinates(latitude, longitude):
+    """Validates one (lat, lon) pair in degrees. Returns floats or raises ValueError."""
+    latitude, longitude = float(latitude), float(longitude)
+    if not (-90.0 <= latitude <= 90.0) or not (-180.0 <= longitude <= 180.0):
+        raise ValueError(f"coordinates out of range: {latitude}, {longitude}")
+    return latitude, longitude
 
-    # Check if sufficient data exists for robust HW model
-    # Need at least MIN_MONTHS_DATA_FOR_MONTHLY_HW months of data
-    if historical_monthly_data.empty or len(historical_monthly_data) < CONFIG["MIN_MONTHS_DATA_FOR_MONTHLY_HW"]:
-        logger.warning(f"Not enough historical monthly data ({len(historical_monthly_data)} months) "
-                       f"up to {training_end_date} for {city_name} to generate a 24-month forecast. "
-                       f"Minimum required: {CONFIG['MIN_MONTHS_DATA_FOR_MONTHLY_HW']} months.")
-        return [] # Return empty list if insufficient data
 
+def rebuild_district_tables(district_centroids, top_n=5):
+    """
+    Regenerates district_necc_map (nearest NECC city of every district) and necc_top_districts (top_n
+    nearest districts of every NECC city) in nearest_necc.db from {district: (lat, lon)} centroids.
+    Returns (districts mapped, NECC cities ranked).
+    """
+    city_index = get_necc_spatial_index()
+    if city_index is None or not len(city_index):
+        raise RuntimeError("No NECC city coordinates to map districts to")
+    district_names = sorted(district_centroids)
+    district_index = SpatialIndex(district_names, [district_centroids[d][0] for d in district_names],
+                                  [district_centroids[d][1] for d in district_names])
+    nearest_city, nearest_distance = city_index.query(district_index.latitudes, district_index.longitudes, k=1)
+    top_districts, top_distances = district_index.query(city_index.latitudes, city_index.longitudes, k=top_n)
+
+    conn = sqlite3.connect(CONFIG["NEAREST_NECC_DB"])
     try:
-        # Fit the Holt-Winters model
-        model = ExponentialSmoothing(
-            historical_monthly_data,
-            trend=CONFIG["HW_TREND"],
-            seasonal=CONFIG["HW_SEASONAL_MONTHLY"], # Use monthly seasonal config
-            seasonal_periods=CONFIG["HW_SEASONAL_PERIODS_MONTHLY"], # Use monthly seasonal periods
-            initialization_method='estimated'
-        ).fit()
+        conn.execute("CREATE TABLE IF NOT EXISTS district_necc_map (district TEXT, necc_city TEXT, distance REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS necc_top_districts "
+                     "(necc_city TEXT, nearby_district TEXT, distance REAL, rank INTEGER)")
+        with conn:
+            conn.execute("DELETE FROM district_necc_map")
+            conn.executemany(
+                "INSERT INTO district_necc_map (district, necc_city, distance) VALUES (?, ?, ?)",
+                [(district_name, city_index.names[city_i], round(float(distance), 2))
+                 for district_name, city_i, distance in zip(district_names, nearest_city[:, 0].tolist(),
+                                                            nearest_distance[:, 0].tolist())])
+            conn.execute("DELETE FROM necc_top_districts")
+            conn.executemany(
+                "INSERT INTO necc_top_districts (necc_city, nearby_district, distance, rank) VALUES (?, ?, ?, ?)",
+                [(city_name, district_names[district_i], round(float(distance), 2), rank)
+                 for city_name, row_indices, row_distances in zip(city_index.names, top_districts.tolist(),
+                                                                  top_distances.tolist())
+                 for rank, (district_i, distance) in enumerate(zip(row_indices, row_distances), start=1)])
+    finally:
+        conn.close()
+    close_db_connections() # Pooled read connections may hold stale pages of the rewritten tables
+    return len(district_names), len(city_index)
 
-        # Forecast for next 24 months (periods)
-        forecast_steps = 24
-        future_predictions_series = model.forecast(forecast_steps) # This returns a pandas Series with DatetimeIndex
 
-        # Format predictions into list of dicts
-        predicted_data_list = []
-        # Iterate over the Series index (pandas Timestamps) and values
-        for date_index, price in future_predictions_series.items():
-             # Ensure date_index is treated as a Timestamp
-             date_ts = pd.Timestamp(date_index)
-             predicted_data_list.append({
-                 # Format date using strftime
-                 "month": date_ts.strftime('%Y-%m'),
-                 "price": round(price, 2) if pd.notna(price) else None
-             })
+@app.cli.command("build-district-map")
+@click.argument("centroids_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--top-n", default=5, show_default=True, help="Nearby districts ranked per NECC city.")
+def build_district_map_command(centroids_path, top_n):
+    """Regenerate district_necc_map and necc_top_districts from a district centroid CSV (district,latitude,longitude)."""
+    district_centroids = {}
+    with open(centroids_path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            row = {(key or '').strip().lower(): value for key, value in row.items()}
+            try:
+                district_name = (row.get('district') or '').strip()
+                if not district_name:
+                    raise ValueError("missing district")
+                district_centroids[district_name] = parse_coordinates(row.get('latitude', row.get('lat')),
+                                                                      row.get('longitude', row.get('lon')))
+            except (TypeError, ValueError) as e:
+                raise click.ClickException(f"{centroids_path}: line {reader.line_num}: {e}")
+    if not district_centroids:
+        raise click.ClickException(f"No districts in {centroids_path}.")
 
-        return predicted_data_list
+    started = time.perf_counter()
+    districts, cities = rebuild_district_tables(district_centroids, top_n=top_n)
+    click.echo(f"Mapped {districts} districts to {cities} NECC cities in {time.perf_counter() - started:.2f}s.")
 
-    except Exception as e:
-        logger.error(f"Error generating 24-month HW forecast for {city_name}: {e}")
-        return [] # Return empty list on error
+
+# --- Location Search ---
+# In-memory search over NECC city and district names, built from nearest_necc.db whenever the file changes
+# (like the spatial index). Names are matched case-, accent- and punctuation-insensitively ('e godavari'
+# finds 'E.Godavari') through a prefix trie over every word start, with a trigram index for misspellings.
+# The same index resolves approximate names in the per-location routes and answers district -> NECC city
+# lookups without a DB round trip.
+
+# Well-known alternative names. Aliases of names that are not in the mapping database are ignored; more can
+# be added per deployment as (alias, name) rows in an optional location_aliases table in nearest_necc.db.
+LOCATION_ALIASES = {
+    "Bangalore": "Bengaluru (CC)",
+    "Bombay": "Mumbai (CC)",
+    "Madras": "Chennai (CC)",
+    "Calcutta": "Kolkata (WB)",
+    "Lucknow": "Luknow (CC)",
+    "Muzaffarpur": "Muzaffurpur (CC)",
+    "Allahabad": "Prayagraj",
+    "Berhampur": "Brahmapur (OD)",
+    "East Godavari": "E.Godavari",
+    "West Godavari": "W.Godavari",
+    "Vizag": "Visakhapatnam",
+    "Gurgaon": "Gurugram",
+    "Mysore": "Mysuru",
+    "Belgaum": "Belagavi",
+    "Trivandrum": "Thiruvananthapuram",
+    "Baroda": "Vadodara",
+    "Poona": "Pune",
+    "Banaras": "Varanasi",
+    "Benares": "Varanasi",
+    "Cochin": "Ernakulam",
+    "Tuticorin": "Thoothukudi",
+    "Sambhajinagar": "Aurangabad (Chhatrapati Sambhajinagar)",
+}
+
+LOCATION_TYPES = ("necc", "district")
+
+
+def normalize_location_key(name):
+    """Search key of a location name: accents, case and punctuation dropped ('E.Godavari' -> 'e godavari')."""
+    text = "".join(c for c in unicodedata.normalize("NFKD", name) if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[\W_]+", " ", text.casefold()).split())
+
+
+def location_key_trigrams(key):
+    """Trigrams of every word of a search key, padded like pg_trgm ('  w', ' wo', ..., 'rd ')."""
+    return {padded[i:i + 3] for word in key.split() for padded in (f"  {word} ",) for i in range(len(padded) - 2)}
+
+
+def qualifier_aliases(name):
+    """Implicit aliases of a name with a parenthesized qualifier: 'Mumbai (CC)' -> 'Mumbai'; spelled-out
+    qualifiers count too: 'Aurangabad (Chhatrapati Sambhajinagar)' -> 'Aurangabad', 'Chhatrapati Sambhajinagar'."""
+    base = re.sub(r"\s*\([^)]*\)", "", name).strip()
+    aliases = [base] if base and base != name else []
+    aliases.extend(q.strip() for q in re.findall(r"\(([^)]*)\)", name) if len(q.strip()) > 3)
+    return aliases
+
+
+class _TrieNode:
+    __slots__ = ("children", "matches")
+
+    def __init__(self):
+        self.children = {}
+        self.matches = [] # (rank, entry id, key id) of the keys passing through this node, best first
 
 
-def calculate_dynamic_averages_from_forecast(forecast_data_list, current_system_date):
+class LocationSearchIndex:
     """
-    Calculates dynamic averages (1M, 3M, 6M, 9M, 12M) from a list of monthly forecast data,
-    starting from the month *after* the current_system_date.
-    forecast_data_list is expected to be a list of dicts: [{"month": "YYYY-MM", "price": price}, ...]
-    Returns a dict with average values and individual next 12 months (from current+1).
-    Returns dict with None/empty values if prediction data is not available or processing fails.
+    Prefix trie plus trigram index over NECC cities and districts (entries) and their search keys: the
+    normalized name and aliases. search() ranks exact key matches first, then keys starting with the query,
+    then keys with a word starting with it, then trigram matches by similarity.
     """
-    logger.info(f"Calculating dynamic averages from forecast data. Current date: {current_system_date}.")
 
-    results = {
-        "next_1_month_avg": None, "next_3_months_avg": None,
-        "next_6_months_avg": None, "next_9_months_avg": None,
-        "next_12_months_avg": None,
-        "individual_next_12_months": [] # List of monthly predictions for the next 12 months starting from current+1
-    }
+    def __init__(self, necc_cities, district_map, aliases=()):
+        """necc_cities: names; district_map: {district: (necc_city, distance)}; aliases: (alias, name) pairs."""
+        self.district_map = dict(district_map)
+        self.entry_names, self.entry_types = [], []
+        for location_type, names in (("necc", sorted(set(necc_cities))), ("district", sorted(self.district_map))):
+            self.entry_names.extend(names)
+            self.entry_types.extend([location_type] * len(names))
+        self.names_by_type = {location_type: set() for location_type in LOCATION_TYPES}
+        entries_by_name = {}
+        for entry_id, (name, location_type) in enumerate(zip(self.entry_names, self.entry_types)):
+            self.names_by_type[location_type].add(name)
+            entries_by_name.setdefault(name, []).append(entry_id)
 
-    if not forecast_data_list:
-        logger.warning("No forecast data list provided for dynamic average calculation.")
-        return results
+        self.keys, self.key_entries, self.key_aliases = [], [], [] # per key id; key_aliases: alias text or None
+        self.entries_by_key = {} # normalized key -> [key ids]
+        for entry_id, name in enumerate(self.entry_names):
+            self._add_key(name, entry_id, None)
+            for alias in qualifier_aliases(name):
+                self._add_key(alias, entry_id, alias)
+        for alias, name in aliases:
+            for entry_id in entries_by_name.get(name, ()):
+                self._add_key(alias, entry_id, alias)
 
-    # Convert forecast list to DataFrame for easier date-based slicing
-    forecast_df = pd.DataFrame(forecast_data_list)
-    try:
-        # Convert 'month' column to datetime objects (Month Start) and set as index
-        forecast_df['month'] = pd.to_datetime(forecast_df['month'], format='%Y-%m')
-        forecast_df = forecast_df.set_index('month')
-        # Ensure index is explicitly a DatetimeIndex
-        forecast_df.index = pd.to_datetime(forecast_df.index)
-        forecast_df['price'] = pd.to_numeric(forecast_df['price'], errors='coerce')
-         # Drop rows where price is NaN after conversion - important for averaging
-        forecast_df.dropna(subset=['price'], inplace=True)
+        self._trie = _TrieNode()
+        for key_id, key in enumerate(self.keys):
+            word_starts = [0] + [i + 1 for i, c in enumerate(key) if c == " "]
+            for start in word_starts:
+                node = self._trie
+                for c in key[start:]:
+                    node = node.children.setdefault(c, _TrieNode())
+                    node.matches.append((0 if start == 0 else 1, key_id))
+        self._finish_trie()
 
-        if forecast_df.empty:
-            logger.warning("Forecast DataFrame is empty after processing for dynamic averages.")
-            return results
+        trigram_keys = {}
+        self._key_trigram_counts = np.zeros(len(self.keys), dtype=np.float64)
+        for key_id, key in enumerate(self.keys):
+            trigrams = location_key_trigrams(key)
+            self._key_trigram_counts[key_id] = len(trigrams)
+            for trigram in trigrams:
+                trigram_keys.setdefault(trigram, []).append(key_id)
+        self._trigram_keys = {trigram: np.array(key_ids, dtype=np.int32) for trigram, key_ids in trigram_keys.items()}
 
-    except Exception as e:
-        logger.error(f"Error processing forecast data list into DataFrame for dynamic averages: {e}")
-        return results
+    def __len__(self):
+        return len(self.entry_names)
+
+    def _add_key(self, text, entry_id, alias):
+        key = normalize_location_key(text)
+        if not key or any(self.key_entries[k] == entry_id for k in self.entries_by_key.get(key, ())):
+            return
+        self.entries_by_key.setdefault(key, []).append(len(self.keys))
+        self.keys.append(key)
+        self.key_entries.append(entry_id)
+        self.key_aliases.append(alias)
 
+    def _finish_trie(self):
+        """Orders each node's matches (name prefix before word prefix, names before aliases, shorter names
+        first) and keeps one match per entry, so a prefix query only reads the head of one list."""
+        key_order = sorted(range(len(self.keys)), key=lambda key_id: (
+            self.key_aliases[key_id] is not None, len(self.entry_names[self.key_entries[key_id]]),
+            self.entry_names[self.key_entries[key_id]]))
+        key_rank = [0] * len(self.keys)
+        for rank, key_id in enumerate(key_order):
+            key_rank[key_id] = rank
 
-    # Determine the start month for dynamic averages (the month after the current month)
-    # Use MonthBegin to get the start of the next month correctly relative to the current system date
-    # Ensure current_system_date is treated as a Timestamp for calculations
-    current_date_ts = pd.Timestamp(current_system_date)
-    dynamic_avg_start_month_ts = current_date_ts + pd.offsets.MonthBegin(1)
+        stack = [self._trie]
+        while stack:
+            node = stack.pop()
+            seen = set()
+            matches = []
+            for tier, key_id in sorted(node.matches, key=lambda match: (match[0], key_rank[match[1]])):
+                entry_id = self.key_entries[key_id]
+                if entry_id not in seen:
+                    seen.add(entry_id)
+                    matches.append((tier, entry_id, key_id))
+            node.matches = matches
+            stack.extend(node.children.values())
 
+    def _result(self, entry_id, key_id, match, score):
+        name, location_type = self.entry_names[entry_id], self.entry_types[entry_id]
+        necc_city, distance = (name, 0.0) if location_type == "necc" else self.district_map[name]
+        return {"name": name, "type": location_type, "necc_city": necc_city,
+                "distance_to_necc": round(distance, 1) if distance is not None else None,
+                "match": match, "alias": self.key_aliases[key_id], "score": round(score, 3)}
 
-    periods_in_months = [1, 3, 6, 9, 12]
-    months_to_collect_individual = 12 # We need the next 12 individual months starting from dynamic_avg_start_month_ts
+    def fuzzy_matches(self, key, location_type=None, min_similarity=0.3):
+        """[(similarity, entry id, key id)] of keys sharing trigrams with key, best per entry, most similar first."""
+        trigrams = location_key_trigrams(key)
+        key_id_arrays = [self._trigram_keys[t] for t in trigrams if t in self._trigram_keys]
+        if not key_id_arrays:
+            return []
+        shared = np.bincount(np.concatenate(key_id_arrays), minlength=len(self.keys))
+        similarity = shared / (len(trigrams) + self._key_trigram_counts - shared) # Jaccard over trigram sets
+        candidates = np.flatnonzero(similarity >= min_similarity)
+        best = {}
+        for key_id in candidates[np.argsort(-similarity[candidates], kind="stable")].tolist():
+            entry_id = self.key_entries[key_id]
+            if entry_id not in best and (location_type is None or self.entry_types[entry_id] == location_type):
+                best[entry_id] = (float(similarity[key_id]), entry_id, key_id)
+        return list(best.values())
 
-    for p_months in periods_in_months:
-        # Calculate the end month for this period (inclusive) starting from dynamic_avg_start_month_ts
-        dynamic_avg_end_month_ts = dynamic_avg_start_month_ts + pd.offsets.MonthEnd(p_months - 1)
+    def search(self, query, limit=10, location_type=None, min_similarity=0.3):
+        """Up to `limit` results ({"name", "type", "necc_city", "distance_to_necc", "match", "alias", "score"})."""
+        key = normalize_location_key(query)
+        if not key or limit <= 0:
+            return []
+        results, seen = [], set()
 
-        # Filter the forecast DataFrame for this period using the DatetimeIndex
-        # Use .loc for label-based slicing on the DatetimeIndex
-        # Need to get the forecast data from the start of the dynamic average period
-        relevant_forecast_months = forecast_df.loc[
-            (forecast_df.index >= dynamic_avg_start_month_ts) &
-            (forecast_df.index <= dynamic_avg_end_month_ts)
-        ]
+        def add(entry_id, key_id, match, score):
+            if entry_id in seen or (location_type is not None and self.entry_types[entry_id] != location_type):
+                return
+            seen.add(entry_id)
+            results.append(self._result(entry_id, key_id, match, score))
 
-        if not relevant_forecast_months.empty and not relevant_forecast_months['price'].isna().all():
-            # Calculate mean of non-null prices in this period
-            results[f"next_{p_months}_month{'s' if p_months > 1 else ''}_avg"] = round(relevant_forecast_months['price'].mean(), 2)
+        for key_id in self.entries_by_key.get(key, ()):
+            add(self.key_entries[key_id], key_id, "exact", 1.0)
+        node = self._trie
+        for c in key:
+            node = node.children.get(c)
+            if node is None:
+                break
         else:
-            # logger.warning(f"No valid forecast data found for next {p_months} months starting from {dynamic_avg_start_month_ts.strftime('%Y-%m')}")
-            pass # Keep the average as None if no data
+            for tier, entry_id, key_id in node.matches:
+                if len(results) >= limit:
+                    break
+                add(entry_id, key_id, "prefix" if tier == 0 else "word_prefix", len(key) / len(self.keys[key_id]))
+        if len(results) < limit:
+            for similarity, entry_id, key_id in self.fuzzy_matches(key, location_type, min_similarity):
+                if len(results) >= limit:
+                    break
+                add(entry_id, key_id, "fuzzy", similarity)
+        return results[:limit]
+
+    def resolve(self, location_type, name, min_similarity=0.5):
+        """
+        Canonical name of `location_type` that `name` refers to: itself if known, else the single entry whose
+        normalized name or alias equals it, else the single most similar entry at min_similarity or more.
+        None if there is no such entry (or it is ambiguous).
+        """
+        if name in self.names_by_type[location_type]:
+            return name
+        key = normalize_location_key(name)
+        if not key:
+            return None
+        entry_ids = {self.key_entries[key_id] for key_id in self.entries_by_key.get(key, ())
+                     if self.entry_types[self.key_entries[key_id]] == location_type}
+        if entry_ids:
+            return self.entry_names[entry_ids.pop()] if len(entry_ids) == 1 else None
+        matches = self.fuzzy_matches(key, location_type, min_similarity)
+        if matches and (len(matches) == 1 or matches[0][0] > matches[1][0]):
+            return self.entry_names[matches[0][1]]
+        return None
 
+    def associated_necc_city(self, district_name):
+        """(necc_city, distance) of a district in district_necc_map, or (None, None)."""
+        return self.district_map.get(district_name, (None, None))
 
-    # Collect individual predictions for the next 12 months starting from dynamic_avg_start_month_ts
+
+_location_search_index = None
+_location_search_index_signature = None
+_location_search_index_lock = threading.Lock()
+
+
+def load_location_aliases(cursor):
+    """LOCATION_ALIASES plus the rows of the optional location_aliases (alias, name) table."""
+    aliases = list(LOCATION_ALIASES.items())
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'location_aliases'")
+    if cursor.fetchone():
+        cursor.execute("SELECT alias, name FROM location_aliases")
+        aliases.extend((row['alias'], row['name']) for row in cursor.fetchall() if row['alias'] and row['name'])
+    return aliases
+
+
+def get_location_search_index():
+    """LocationSearchIndex over nearest_necc.db, rebuilt when the file changes. None if unavailable."""
+    global _location_search_index, _location_search_index_signature
     try:
-        # Find the start position in the forecast_df index that is >= dynamic_avg_start_month_ts
-        # searchsorted finds the index where the dynamic_avg_start_month_ts could be inserted to maintain order
-        start_pos_idx = forecast_df.index.searchsorted(dynamic_avg_start_month_ts, side='left')
+        stat = os.stat(CONFIG["NEAREST_NECC_DB"])
+    except OSError as e:
+        logger.error(f"Could not stat {CONFIG['NEAREST_NECC_DB']} for the location search index: {e}")
+        return None
+    signature = (stat.st_size, stat.st_mtime_ns)
+    if _location_search_index is not None and _location_search_index_signature == signature:
+        return _location_search_index
+    with _location_search_index_lock:
+        if _location_search_index is not None and _location_search_index_signature == signature:
+            return _location_search_index
+        try:
+            started = time.perf_counter()
+            conn = get_db_connection("NEAREST_NECC_DB")
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT DISTINCT city FROM necc_city_coordinates")
+                necc_cities = [row['city'] for row in cursor.fetchall() if row['city']]
+                # rowid order, so a duplicated district keeps the row `SELECT ... WHERE district = ?` returned
+                cursor.execute("SELECT district, necc_city, distance FROM district_necc_map ORDER BY rowid")
+                district_map = {}
+                for row in cursor.fetchall():
+                    if row['district']:
+                        district_map.setdefault(row['district'], (row['necc_city'], row['distance']))
+                aliases = load_location_aliases(cursor)
+            finally:
+                conn.close()
+            _location_search_index = LocationSearchIndex(necc_cities, district_map, aliases)
+            _location_search_index_signature = signature
+            logger.info(f"Location search index built over {len(_location_search_index)} names in "
+                        f"{(time.perf_counter() - started) * 1000:.1f} ms.")
+        except Exception as e:
+            logger.error(f"Could not build location search index: {e}")
+            return None
+        return _location_search_index
 
-        # Slice the DataFrame from the start position for the next 12 months using iloc (integer-based)
-        individual_months_df = forecast_df.iloc[start_pos_idx : start_pos_idx + months_to_collect_individual]
 
-        results["individual_next_12_months"] = [
-            {"month": idx.strftime('%Y-%m'), "price": row['price'] if pd.notna(row['price']) else None}
-            for idx, row in individual_months_df.iterrows()
-        ]
-    except Exception as e:
-         logger.error(f"Error slicing forecast data for individual next 12 months: {e}")
-         results["individual_next_12_months"] = []
+# Per-location endpoints whose name argument is resolved: endpoint -> (view arg, fixed type or None for <type>)
+LOCATION_NAME_ARGS = {
+    "get_all_predictions": ("location_name", None),
+    "get_prices": ("location_name", None),
+    "get_averages": ("location_name", None),
+    "get_nearby_districts": ("necc_city", "necc"),
+}
 
 
-    return results
+@app.url_value_preprocessor
+def _resolve_location_name(endpoint, values):
+    """
+    Rewrites a misspelled, differently cased or aliased location name in the per-location routes to its
+    canonical name before the view (and its cache and ETag lookups) sees it. Unknown names are left as they
+    are, so those routes still answer them with their empty payloads.
+    """
+    if endpoint not in LOCATION_NAME_ARGS or not values:
+        return
+    arg, location_type = LOCATION_NAME_ARGS[endpoint]
+    location_type = location_type or values.get("type")
+    name = values.get(arg)
+    if location_type not in LOCATION_TYPES or not name:
+        return
+    index = get_location_search_index()
+    if index is None or name in index.names_by_type[location_type]:
+        return
+    if location_type == "necc":
+        try:
+            if name in get_latest_prices_snapshot():
+                return # A city with prices but no coordinates row is still an exact name
+        except Exception as e:
+            logger.error(f"Could not read latest prices while resolving {name}: {e}")
+    resolved = index.resolve(location_type, name, CONFIG["LOCATION_RESOLVE_MIN_SIMILARITY"])
+    if resolved is not None and resolved != name:
+        logger.info(f"Resolved {location_type} '{name}' to '{resolved}'.")
+        values[arg] = resolved
 
 
 # --- API Endpoints ---
@@ -349,7 +3642,7 @@ def index():
 
 
 @app.route('/api/predict/<type>/<path:location_name>')
-@cache.memoize(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"]) # Cache the entire endpoint result
+@memoize_single_flight(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"], version_func=location_data_version) # Cache the entire endpoint result
 def get_all_predictions(type, location_name):
     logger.info(f"Received prediction request for type: {type}, location: {location_name}")
     effective_city_name = location_name
@@ -404,53 +3697,219 @@ def get_all_predictions(type, location_name):
     latest_price_data = get_latest_price_info_db(effective_city_name)
 
     # 2. Generate the full 24-month forecast (trained on data up to end of previous year)
-    # This function now returns a LIST of dicts or an empty list []
-    full_24_month_forecast_list = generate_24_month_forecast(effective_city_name, current_system_date)
+    # This function returns a MonthlyForecast (empty when no forecast is possible)
+    forecast = generate_24_month_forecast(effective_city_name, current_system_date)
 
-    # 3. Derive Calendar Year Prediction Average and breakdown from the first 12 months of the 24-month forecast
-    # The 24-month forecast starts from Jan of the current year.
-    calendar_year_predictions_for_avg = full_24_month_forecast_list[:12]
-    calendar_year_avg_price = None
-    target_cal_year = current_system_date.year # Calendar year is the current system year
+    response_data = build_prediction_payload(effective_city_name, current_system_date,
+                                             latest_price_data, forecast)
+    if distance_to_necc is not None:
+        response_data["distance_to_necc"] = round(distance_to_necc,1)
 
-    if calendar_year_predictions_for_avg:
-        # Filter out None prices before calculating mean
-        prices_for_cal_year_avg = [p['price'] for p in calendar_year_predictions_for_avg if p['price'] is not None]
-        if prices_for_cal_year_avg:
-             calendar_year_avg_price = round(np.mean(prices_for_cal_year_avg), 2)
+    return jsonify(response_data)
 
-    calendar_year_prediction_data = {
-        "year": target_cal_year,
-        "avg_price": calendar_year_avg_price,
-        # The 'predictions' field contains the first 12 months from the full forecast for calendar year breakdown
-        "predictions": calendar_year_predictions_for_avg
-    }
 
+def parse_requested_city_names(requested, max_cities):
+    """
+    City names of a multi-city request, given as "a,b,c" or a list of names: in request order without blanks
+    or duplicates, at most max_cities of them, or every NECC city for "all".
+    Raises ValueError with the message for the client when the list is unusable.
+    """
+    if isinstance(requested, str):
+        if requested.strip().lower() == 'all':
+            return get_necc_city_names()
+        requested = requested.split(',')
+    if not isinstance(requested, list) or not all(isinstance(c, str) for c in requested):
+        raise ValueError("'cities' must be a list of NECC city names or 'all'.")
+    city_names = list(dict.fromkeys(c.strip() for c in requested if c.strip()))
+    if not city_names:
+        raise ValueError("No cities specified. Use ?cities=a,b,c or ?cities=all.")
+    if len(city_names) > max_cities:
+        raise ValueError(f"At most {max_cities} cities per request; use ?cities=all for every city.")
+    return city_names
 
-    # 4. Calculate dynamic averages and individual next 12 months from the full 24-month forecast list
-    # This function accepts the list of dicts and processes it, starting calculations from the month after current_system_date
-    derived_dynamic_forecast_data = calculate_dynamic_averages_from_forecast(full_24_month_forecast_list, current_system_date)
 
+@app.route('/api/predict/batch', methods=['GET', 'POST'])
+def get_batch_predictions():
+    """
+    Predictions for many NECC cities in one request.
+    Cities are given as ?cities=a,b,c (or a JSON body {"cities": [...]}); "all" selects every NECC city.
+    Returns {city: payload}, each payload matching /api/predict/necc/<city>.
+    """
+    requested = None
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        requested = body.get('cities')
+    if requested is None:
+        requested = request.args.get('cities', '')
+    try:
+        city_names = parse_requested_city_names(requested, CONFIG["BATCH_PREDICT_MAX_CITIES"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Database error fetching NECC cities for batch prediction: {e}")
+        return jsonify({"error": "Could not fetch NECC cities list"}), 500
 
-    response_data = {
-        "city_name_used_for_prediction": effective_city_name, # Important for frontend mapping
-        "latest_price_info": latest_price_data,
-        # Include the full 24-month forecast data as the main prediction dataset
-        "full_24_month_forecast": full_24_month_forecast_list,
-        # Include derived data: Calendar year prediction (average and first 12 months breakdown)
-        "next_calendar_year_prediction": calendar_year_prediction_data,
-        # Dynamic averages (1M, 3M.. 12M) and individual next 12 months (from current+1)
-        "dynamic_averages_from_forecast": derived_dynamic_forecast_data,
-    }
-    if distance_to_necc is not None:
-        response_data["distance_to_necc"] = round(distance_to_necc,1)
+    logger.info(f"Received batch prediction request for {len(city_names)} cities.")
+    current_system_date = datetime.now(pytz.timezone(CONFIG['TIMEZONE'])).date()
+    forecasts = generate_24_month_forecasts_batch(city_names, current_system_date)
+    try:
+        latest_prices = get_latest_prices_snapshot()
+    except Exception as e:
+        logger.error(f"Database error fetching latest prices for batch prediction: {e}")
+        latest_prices = {}
 
+    response_data = {}
+    for city_name in city_names:
+        latest_price_data = latest_prices.get(city_name, {"date": None, "price": None})
+        response_data[city_name] = build_prediction_payload(
+            city_name, current_system_date, latest_price_data, forecasts.get(city_name, []))
     return jsonify(response_data)
 
 
+PRICE_STREAM_CHUNK_ROWS = 5000 # Rows fetched/serialized per chunk when streaming price history
+
+
+def iter_price_row_chunks(city_name, start_date_str=None, end_date_str=None):
+    """
+    Yields (dates, prices) list pairs of at most PRICE_STREAM_CHUNK_ROWS rows, oldest first,
+    straight from the columnar price store or the DB cursor. Same rows as get_historical_daily_prices_df.
+    """
+    store = get_price_store()
+    if store is not None:
+        try:
+            start_day = date_str_to_day_ordinal(start_date_str) if start_date_str else None
+            end_day = date_str_to_day_ordinal(end_date_str) if end_date_str else None
+        except ValueError:
+            store = None # Malformed date strings: let SQL compare them as before
+    if store is not None:
+        days, prices = store.city_prices(city_name, start_day, end_day)
+        for i in range(0, len(days), PRICE_STREAM_CHUNK_ROWS):
+            chunk_dates = np.datetime_as_string(days[i:i + PRICE_STREAM_CHUNK_ROWS].astype('datetime64[D]'))
+            yield chunk_dates.tolist(), prices[i:i + PRICE_STREAM_CHUNK_ROWS].tolist()
+        return
+
+    query = "SELECT Date, Price FROM DailyPrices WHERE City = ?"
+    params = [city_name]
+    if start_date_str:
+        query += " AND Date >= ?"
+        params.append(start_date_str)
+    if end_date_str:
+        query += " AND Date <= ?"
+        params.append(end_date_str)
+    query += " ORDER BY Date ASC"
+
+    conn = get_db_connection("NECC_PRICES_DB")
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(PRICE_STREAM_CHUNK_ROWS)
+            if not rows:
+                break
+            chunk_dates, chunk_prices = [], []
+            for row in rows:
+                try:
+                    price = float(row['Price'])
+                except (TypeError, ValueError):
+                    continue # Same as to_numeric(errors='coerce') + dropna
+                if price != price:
+                    continue
+                chunk_dates.append(str(row['Date'])[:10])
+                chunk_prices.append(price)
+            yield chunk_dates, chunk_prices
+    finally:
+        conn.close()
+
+
+def stream_price_history(city_name, output_format, start_date_str=None, end_date_str=None, city_label=None):
+    """Generator producing the price history of city_name as 'ndjson', 'csv' or chunked 'json' text."""
+    city_label = city_label or city_name
+    if output_format == 'json':
+        yield '{"city": ' + json.dumps(city_label) + ', "prices": ['
+    elif output_format == 'csv':
+        yield 'date,price\n'
+
+    first = True
+    rows = iter_price_row_chunks(city_name, start_date_str, end_date_str) if city_name else ()
+    for chunk_dates, chunk_prices in rows:
+        if output_format == 'ndjson':
+            yield ''.join(f'{{"date": "{d}", "price": {json.dumps(p)}}}\n' for d, p in zip(chunk_dates, chunk_prices))
+        elif output_format == 'csv':
+            yield ''.join(f'{d},{p!r}\n' for d, p in zip(chunk_dates, chunk_prices))
+        elif chunk_dates:
+            body = ', '.join(f'{{"date": "{d}", "price": {json.dumps(p)}}}' for d, p in zip(chunk_dates, chunk_prices))
+            yield body if first else ', ' + body
+            first = False
+
+    if output_format == 'json':
+        yield ']}'
+
+
 @app.route('/api/prices/<type>/<path:location_name>')
-@cache.memoize(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"])
 def get_prices(type, location_name):
+    """
+    Price history. ?format=ndjson|csv (or ?stream=1 for JSON) streams rows at constant memory
+    instead of building the cached JSON response.
+    For charts, ?max_points=N (with ?downsample=lttb|minmax) and/or ?resolution=daily|weekly|monthly|auto
+    return a reduced JSON series; see the Chart Downsampling section.
+    """
+    output_format = request.args.get('format', 'json').lower()
+    stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+    if output_format not in ('json', 'ndjson', 'csv'):
+        return jsonify({"error": "Invalid format specified. Use 'json', 'ndjson' or 'csv'."}), 400
+
+    chart_args = [arg for arg in ('max_points', 'resolution', 'downsample') if arg in request.args]
+    if chart_args:
+        if output_format != 'json' or stream:
+            return jsonify({"error": f"{', '.join(chart_args)} can only be used with the JSON response."}), 400
+        resolution = request.args.get('resolution', 'daily').lower()
+        method = request.args.get('downsample', 'lttb').lower()
+        max_points = request.args.get('max_points')
+        if resolution not in PRICE_RESOLUTIONS + ("auto",):
+            return jsonify({"error": "Invalid resolution. Use 'daily', 'weekly', 'monthly' or 'auto'."}), 400
+        if method not in DOWNSAMPLE_METHODS:
+            return jsonify({"error": "Invalid downsample method. Use 'lttb' or 'minmax'."}), 400
+        if max_points is not None:
+            try:
+                max_points = int(max_points)
+            except ValueError:
+                max_points = 0
+            if not 3 <= max_points <= CONFIG["CHART_MAX_POINTS_LIMIT"]:
+                return jsonify({"error": f"max_points must be an integer from 3 to {CONFIG['CHART_MAX_POINTS_LIMIT']}."}), 400
+        return get_prices_json(type, location_name, request.args.get('start_date'), request.args.get('end_date'),
+                               chart=(max_points, resolution, method))
+    if output_format == 'json' and not stream:
+        return get_prices_json(type, location_name, request.args.get('start_date'), request.args.get('end_date'))
+
+    logger.info(f"Streaming {output_format} price history for type: {type}, location: {location_name}")
+    effective_city_name = location_name
+    if type == 'district':
+        associated_city, _ = get_associated_necc_city(location_name)
+        effective_city_name = associated_city # None streams an empty history, like the JSON response
+        if not associated_city:
+            logger.warning(f"District {location_name} not found or no associated NECC city for prices.")
+    elif type != 'necc':
+        return jsonify({"error": "Invalid location type specified. Use 'necc' or 'district'."}), 400
+
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    mimetypes = {'json': 'application/json', 'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+    response = Response(
+        stream_price_history(effective_city_name, output_format, start_date, end_date,
+                             city_label=effective_city_name or location_name),
+        mimetype=mimetypes[output_format])
+    if output_format == 'csv':
+        filename = secure_filename(f"{effective_city_name or location_name}_prices.csv") or "prices.csv"
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def get_prices_json(type, location_name, start_date=None, end_date=None, chart=None):
+    """
+    JSON price history. Not memoized per request: the range is sliced from the city's cached full
+    history (get_city_price_history), so every start_date/end_date is served correctly from one entry.
+    chart=(max_points, resolution, method) returns the cached chart series (get_chart_price_series) instead.
+    """
     logger.info(f"Price history request for type: {type}, location: {location_name}")
     effective_city_name = location_name
     if type == 'district':
@@ -469,26 +3928,40 @@ def get_prices(type, location_name):
         logger.error(f"Effective city name not determined for price history for location {location_name}, type {type}.")
         return jsonify({"city": location_name, "prices": []}), 200
 
+    if chart is not None:
+        max_points, resolution, method = chart
+        try:
+            days, prices, resolution, source_points = get_chart_price_series(
+                effective_city_name, start_date, end_date, max_points, resolution, method)
+        except ValueError:
+            return jsonify({"error": "start_date and end_date must be 'YYYY-MM-DD' dates."}), 400
+        except Exception as e:
+            logger.error(f"Database error fetching chart prices for {effective_city_name}: {e}")
+            days, prices, source_points = np.empty(0, dtype=np.int32), np.empty(0), 0
+        dates = np.datetime_as_string(days.astype('datetime64[D]')).tolist()
+        return jsonify({"city": effective_city_name,
+                        "prices": [{'date': d, 'price': p} for d, p in zip(dates, prices.tolist())],
+                        "resolution": resolution, "source_points": source_points})
 
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-
-    prices_df = get_historical_daily_prices_df(effective_city_name, start_date, end_date)
-    # get_historical_daily_prices_df already logs if empty
-
-    # Convert DataFrame to list of dicts
-    prices_list = []
-    if not prices_df.empty:
-        # Iterate over DataFrame index (Date) and rows
-        for date_val, row in prices_df.iterrows():
-            # date_val is already a pandas Timestamp, format it
-            prices_list.append({'date': date_val.strftime(CONFIG['DATE_FORMAT']), 'price': row['Price']})
+    try:
+        days, prices = get_city_price_range(effective_city_name, start_date, end_date)
+        dates = np.datetime_as_string(np.asarray(days).astype('datetime64[D]')).tolist()
+        prices = prices.tolist()
+    except ValueError:
+        # Malformed date strings: compared as strings in SQL, as before
+        prices_df = get_historical_daily_prices_df(effective_city_name, start_date, end_date)
+        dates = prices_df.index.strftime(CONFIG['DATE_FORMAT']).tolist() if not prices_df.empty else []
+        prices = prices_df['Price'].tolist() if not prices_df.empty else []
+    except Exception as e:
+        logger.error(f"Database error fetching daily prices for {effective_city_name}: {e}")
+        dates, prices = [], []
 
+    prices_list = [{'date': d, 'price': p} for d, p in zip(dates, prices)]
     return jsonify({"city": effective_city_name, "prices": prices_list})
 
 
 @app.route('/api/averages/<type>/<path:location_name>')
-@cache.memoize(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"])
+@memoize_single_flight(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"], version_func=location_data_version)
 def get_averages(type, location_name):
     logger.info(f"Averages request for type: {type}, location: {location_name}")
     effective_city_name = location_name
@@ -517,49 +3990,98 @@ def get_averages(type, location_name):
         }), 200
 
 
-    # Fetch all daily prices to calculate averages
-    all_daily_prices_df = get_historical_daily_prices_df(effective_city_name)
-    # get_historical_daily_prices_df already logs if empty
+    # Averages come from grouped monthly sums (rollup table, price store or one SQL GROUP BY)
+    try:
+        monthly_sums = get_monthly_price_sums([effective_city_name]).get(effective_city_name, [])
+    except Exception as e:
+        logger.error(f"Database error aggregating averages for {effective_city_name}: {e}")
+        monthly_sums = []
+    if not monthly_sums:
+        logger.warning(f"No historical daily prices found for {effective_city_name} to calculate averages.")
 
-    yearly_avg = []
-    monthly_avg_last_5_years = []
+    return jsonify(build_averages_payload(effective_city_name, monthly_sums))
 
-    if not all_daily_prices_df.empty:
-        # Yearly averages
-        # Use .dt.year for integer year extraction from DatetimeIndex
-        yearly_avg_df = all_daily_prices_df['Price'].resample('YE').mean().dropna() # YE for Year End
-        yearly_avg = [{'year': idx.year, 'avg_price': round(price,2)} for idx, price in yearly_avg_df.items()]
 
+@app.route('/api/averages/batch')
+def get_batch_averages():
+    """Yearly and monthly averages for several NECC cities (?cities=a,b,c) from one grouped query."""
+    city_names = list(dict.fromkeys(c.strip() for c in request.args.get('cities', '').split(',') if c.strip()))
+    if not city_names:
+        return jsonify({"error": "No cities specified. Use ?cities=a,b,c."}), 400
+    logger.info(f"Batch averages request for {len(city_names)} cities.")
+    try:
+        sums_by_city = get_monthly_price_sums(city_names)
+    except Exception as e:
+        logger.error(f"Database error aggregating batch averages: {e}")
+        return jsonify({"error": "Could not calculate averages"}), 500
+    return jsonify({city_name: build_averages_payload(city_name, sums_by_city.get(city_name, []))
+                    for city_name in city_names})
 
-        # Monthly averages for last 5 years (relative to the latest data point)
-        monthly_avg_all_df = all_daily_prices_df['Price'].resample('MS').mean().dropna() # MS for Month Start
 
-        # Filter for the last 5 full years of monthly data relative to the latest data point
-        if not monthly_avg_all_df.empty:
-            latest_date_in_data = all_daily_prices_df.index.max()
-            # Calculate the start date for the last 5 full years, relative to the latest data year
-            # Example: if latest data is in 2025, start from Jan 1 of 2021
-            start_year_5_years_ago = latest_date_in_data.year - 4 # e.g., 2025 - 4 = 2021
-            five_years_ago_start_timestamp = pd.Timestamp(f"{start_year_5_years_ago}-01-01")
+def get_compare_city_names():
+    """Cities of an /api/compare request (see parse_requested_city_names)."""
+    return parse_requested_city_names(request.args.get('cities', ''), CONFIG["COMPARE_MAX_CITIES"])
 
-            # Ensure filtering is within the bounds of the available monthly data
-            # Only take data points from the determined start date onwards
-            monthly_avg_last_5_df = monthly_avg_all_df[monthly_avg_all_df.index >= five_years_ago_start_timestamp]
 
-            monthly_avg_last_5_years = [{'year': idx.year, 'month': idx.month, 'avg_price': round(price,2)}
-                                  for idx, price in monthly_avg_last_5_df.items()]
-        # else monthly_avg_last_5_years remains empty list
+@app.route('/api/compare')
+def get_comparison():
+    """
+    Prices of several NECC cities aligned on one date axis, with their forecasts, for the comparison view.
+    ?cities=a,b,c (or ?cities=all), optional ?start=&end= ('YYYY-MM-DD', inclusive; start_date/end_date
+    also work) and ?resolution=daily|weekly|monthly. Columnar body: "dates" and, under "prices", one array
+    per city (null where the city has no price that day); "forecast" holds the forecast "months" and, under
+    "prices", one array per city, plus each city's calendar-year average as in /api/predict.
+    """
+    try:
+        city_names = get_compare_city_names()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Database error fetching NECC cities for comparison: {e}")
+        return jsonify({"error": "Could not fetch NECC cities list"}), 500
+    resolution = request.args.get('resolution', 'daily').lower()
+    if resolution not in PRICE_RESOLUTIONS:
+        return jsonify({"error": "Invalid resolution. Use 'daily', 'weekly' or 'monthly'."}), 400
+    start_date = request.args.get('start', request.args.get('start_date'))
+    end_date = request.args.get('end', request.args.get('end_date'))
+
+    logger.info(f"Comparison request for {len(city_names)} cities.")
+    try:
+        days, matrix = get_price_matrix(tuple(city_names), start_date, end_date, resolution)
+    except ValueError:
+        return jsonify({"error": "start and end must be 'YYYY-MM-DD' dates."}), 400
+    except Exception as e:
+        logger.error(f"Database error building comparison matrix: {e}")
+        return jsonify({"error": "Could not fetch comparison prices"}), 500
 
+    current_system_date = datetime.now(pytz.timezone(CONFIG['TIMEZONE'])).date()
+    forecasts_by_city = generate_24_month_forecasts_batch(city_names, current_system_date)
+    forecasts = []
+    for city_name in city_names:
+        forecast = forecasts_by_city.get(city_name, [])
+        # Forecast lists cached before MonthlyForecast existed
+        forecasts.append(forecast if isinstance(forecast, MonthlyForecast) else MonthlyForecast.from_list(forecast))
+    forecast_months, forecast_matrix = align_forecasts(forecasts)
+    # Select the calendar year by month, as align_forecasts starts the axis at the earliest forecast
+    calendar_year_avgs = [forecast.average(forecast.offset(current_system_date.year, 1), 12) for forecast in forecasts]
 
     return jsonify({
-        "city": effective_city_name,
-        "yearly_avg": yearly_avg,
-        "monthly_avg_last_5_years": monthly_avg_last_5_years
+        "cities": city_names,
+        "resolution": resolution,
+        "dates": np.datetime_as_string(days.astype('datetime64[D]')).tolist(),
+        "prices": {city_name: nan_to_none(matrix[:, i]) for i, city_name in enumerate(city_names)},
+        "forecast": {
+            "year": current_system_date.year,
+            "months": forecast_months,
+            "prices": {city_name: nan_to_none(forecast_matrix[:, i]) for i, city_name in enumerate(city_names)},
+            "calendar_year_avg": {city_name: round(avg, 2) if avg is not None else None
+                                  for city_name, avg in zip(city_names, calendar_year_avgs)},
+        },
     })
 
 
 @app.route('/api/necc_cities')
-@cache.memoize(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"] * 24) # Cache longer as this changes infrequently
+@memoize_single_flight(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"] * 24, version_func=mapping_data_version) # Cache longer as this changes infrequently
 def get_necc_cities():
     logger.info("Fetching list of NECC cities.")
     cities = []
@@ -579,7 +4101,7 @@ def get_necc_cities():
 
 
 @app.route('/api/districts')
-@cache.memoize(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"] * 24)
+@memoize_single_flight(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"] * 24, version_func=mapping_data_version)
 def get_districts():
     logger.info("Fetching list of all districts.")
     districts = []
@@ -597,8 +4119,31 @@ def get_districts():
     return jsonify(districts)
 
 
+@app.route('/api/search')
+def search_locations():
+    """
+    Prefix and fuzzy search over NECC cities and districts, aliases included: ?q=&limit=&type=necc|district.
+    Lets clients look names up as the user types instead of downloading the full lists.
+    """
+    query = request.args.get('q', '').strip()
+    location_type = request.args.get('type') or None
+    if location_type is not None and location_type not in LOCATION_TYPES:
+        return jsonify({"error": "Invalid location type specified. Use 'necc' or 'district'."}), 400
+    try:
+        limit = int(request.args.get('limit', CONFIG["SEARCH_DEFAULT_LIMIT"]))
+    except ValueError:
+        return jsonify({"error": "'limit' must be an integer."}), 400
+    limit = max(1, min(limit, CONFIG["SEARCH_MAX_LIMIT"]))
+
+    index = get_location_search_index()
+    if index is None:
+        return jsonify({"error": "Location search is unavailable"}), 500
+    results = index.search(query, limit, location_type, CONFIG["SEARCH_MIN_SIMILARITY"]) if query else []
+    return jsonify({"query": query, "results": results})
+
+
 @app.route('/api/nearby_districts/<path:necc_city>')
-@cache.memoize(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"])
+@memoize_single_flight(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"], version_func=mapping_data_version)
 def get_nearby_districts(necc_city):
     logger.info(f"Fetching nearby districts for {necc_city}.")
     nearby_districts = []
@@ -629,44 +4174,105 @@ def get_nearby_districts(necc_city):
         return jsonify({"error": f"Could not fetch nearby districts for {necc_city}"}), 500
 
 
+@app.route('/api/backtest')
+def get_backtest():
+    """Summary of a stored backtest run (?run_id=, default the latest; optional ?city=). Runs come from `flask backtest`."""
+    try:
+        report = get_backtest_report(request.args.get('run_id'), request.args.get('city'))
+    except Exception as e:
+        logger.error(f"Error reading backtest results: {e}")
+        return jsonify({"error": "Could not read backtest results"}), 500
+    if report is None:
+        return jsonify({"error": "No backtest results found. Run `flask backtest` first."}), 404
+    return jsonify(report)
+
+
+@app.route('/api/nearest')
+def get_nearest_necc_cities():
+    """The k nearest NECC cities to ?lat=&lon= (&k=, default 1), with great-circle distances in km."""
+    try:
+        latitude, longitude = parse_coordinates(request.args.get('lat'), request.args.get('lon'))
+        k = int(request.args.get('k', 1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Provide numeric 'lat' (-90..90), 'lon' (-180..180) and optional integer 'k'."}), 400
+    if not 1 <= k <= CONFIG["NEAREST_MAX_K"]:
+        return jsonify({"error": f"'k' must be between 1 and {CONFIG['NEAREST_MAX_K']}."}), 400
+    try:
+        nearest = find_nearest_necc_cities([latitude], [longitude], k)[0]
+    except Exception as e:
+        logger.error(f"Error finding nearest NECC cities for ({latitude}, {longitude}): {e}")
+        return jsonify({"error": "Could not resolve nearest NECC cities"}), 500
+    return jsonify({"lat": latitude, "lon": longitude, "nearest": nearest})
+
+
+@app.route('/api/nearest/batch', methods=['POST'])
+def get_nearest_necc_cities_batch():
+    """
+    Nearest NECC cities for many points in one vectorized query. JSON body:
+    {"points": [[lat, lon], ...] or [{"lat": ..., "lon": ...}, ...], "k": 1}. Results follow the input order.
+    """
+    body = request.get_json(silent=True) or {}
+    points = body.get('points')
+    if not isinstance(points, list) or not points:
+        return jsonify({"error": "Provide a non-empty 'points' list."}), 400
+    if len(points) > CONFIG["NEAREST_BATCH_MAX_POINTS"]:
+        return jsonify({"error": f"At most {CONFIG['NEAREST_BATCH_MAX_POINTS']} points per request."}), 400
+    try:
+        k = int(body.get('k', 1))
+        coordinates = [parse_coordinates(point['lat'], point['lon']) if isinstance(point, dict)
+                       else parse_coordinates(*point) for point in points]
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid point: {e}"}), 400
+    if not 1 <= k <= CONFIG["NEAREST_MAX_K"]:
+        return jsonify({"error": f"'k' must be between 1 and {CONFIG['NEAREST_MAX_K']}."}), 400
+    latitudes, longitudes = zip(*coordinates)
+    try:
+        nearest = find_nearest_necc_cities(latitudes, longitudes, k)
+    except Exception as e:
+        logger.error(f"Error finding nearest NECC cities for {len(points)} points: {e}")
+        return jsonify({"error": "Could not resolve nearest NECC cities"}), 500
+    return jsonify({"results": [{"lat": latitude, "lon": longitude, "nearest": point_nearest}
+                                for (latitude, longitude), point_nearest in zip(coordinates, nearest)]})
+
+
 @app.route('/api/necc_cities_locations_prices')
-@cache.memoize(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"]) # Cache for 1 hour, prices can update
+@memoize_single_flight(timeout=CONFIG["CACHE_DEFAULT_TIMEOUT"], version_func=all_locations_data_version)
 def get_necc_cities_locations_prices():
     logger.info("Fetching locations and latest prices for all NECC cities.")
     cities_data = []
 
     conn_nearest = None
-    conn_prices = None
 
     try:
         conn_nearest = get_db_connection("NEAREST_NECC_DB")
         cursor_nearest = conn_nearest.cursor()
 
-        # Get all NECC cities with their coordinates
-        # Fetch distinct cities from necc_city_coordinates table
-        cursor_nearest.execute("SELECT city, latitude, longitude FROM necc_city_coordinates")
-        necc_cities_coords = cursor_nearest.fetchall()
-
+        # Coordinates and latest prices for every city in one statement: attach the prices DB
+        # (read-only, once per pooled connection) and join against the latest price snapshot
+        cursor_nearest.execute("PRAGMA database_list")
+        if not any(row['name'] == 'prices' for row in cursor_nearest.fetchall()):
+            prices_uri = f"file:{os.path.abspath(app.config['NECC_PRICES_DB'])}?mode=ro"
+            if "NECC_PRICES_DB" in CONFIG["SQLITE_IMMUTABLE_DBS"]:
+                prices_uri += "&immutable=1"
+            cursor_nearest.execute("ATTACH DATABASE ? AS prices", (prices_uri,))
+        latest_source = _latest_prices_source(cursor_nearest, schema="prices.")
+        cursor_nearest.execute(f"""
+            SELECT c.city, c.latitude, c.longitude, lp.Price AS latest_price
+            FROM necc_city_coordinates c
+            LEFT JOIN {latest_source} lp ON lp.City = c.city
+        """)
+        necc_cities_rows = cursor_nearest.fetchall()
 
-        if not necc_cities_coords:
+        if not necc_cities_rows:
             logger.warning("No NECC city coordinates found in necc_city_coordinates table.")
             return jsonify([])
 
-        conn_prices = get_db_connection("NECC_PRICES_DB") # Open only once
-        cursor_prices = conn_prices.cursor()
-
-        for city_row in necc_cities_coords:
-            city_name = city_row['city']
-            # Fetch latest price for this city
-            cursor_prices.execute("SELECT Price FROM DailyPrices WHERE City = ? ORDER BY Date DESC LIMIT 1", (city_name,))
-            price_row = cursor_prices.fetchone()
-            latest_price = float(price_row['Price']) if price_row and price_row['Price'] is not None else None
-
+        for city_row in necc_cities_rows:
             cities_data.append({
-                "name": city_name,
+                "name": city_row['city'],
                 "latitude": city_row['latitude'],
                 "longitude": city_row['longitude'],
-                "latest_price": latest_price
+                "latest_price": float(city_row['latest_price']) if city_row['latest_price'] is not None else None
             })
 
         return jsonify(cities_data)
@@ -678,8 +4284,277 @@ def get_necc_cities_locations_prices():
     finally:
         if conn_nearest:
             conn_nearest.close()
-        if conn_prices:
-            conn_prices.close()
+
+
+@app.route('/api/ingest', methods=['POST'])
+def post_ingest():
+    """
+    Upserts a CSV (default) or NDJSON (?format=ndjson or Content-Type application/x-ndjson) request body
+    into DailyPrices. Requires 'Authorization: Bearer <INGEST_API_TOKEN>'.
+    """
+    token = CONFIG["INGEST_API_TOKEN"]
+    if not token:
+        return jsonify({"error": "Ingest API is disabled."}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return jsonify({"error": "Unauthorized"}), 401
+    file_format = request.args.get('format') or ('ndjson' if request.mimetype == 'application/x-ndjson' else 'csv')
+    if file_format not in ('csv', 'ndjson'):
+        return jsonify({"error": "Invalid format specified. Use 'csv' or 'ndjson'."}), 400
+    refresh_forecasts = request.args.get('refresh_forecasts', '1').lower() not in ('0', 'false', 'no')
+
+    lines = io.TextIOWrapper(io.BufferedReader(request.stream), encoding='utf-8', newline='')
+    try:
+        stats = ingest_price_records(parse_price_records(lines, file_format), refresh_forecasts=refresh_forecasts)
+    except ValueError as e:
+        return jsonify({"error": f"Ingest aborted, nothing was written. {e}"}), 400
+    except Exception as e:
+        logger.error(f"Error ingesting prices: {e}")
+        return jsonify({"error": "Failed to ingest prices"}), 500
+    return jsonify(stats)
+
+
+# --- Schema Management ---
+# `flask migrate-schema` creates the covering indexes the hot queries rely on (optionally normalizing
+# DailyPrices.Date to ISO 'YYYY-MM-DD' first) and runs ANALYZE. `flask check-query-plans`, also run at
+# startup, logs EXPLAIN QUERY PLAN for every query the app issues and warns on full table scans.
+
+SCHEMA_INDEXES = {
+    "NECC_PRICES_DB": [
+        ("idx_dailyprices_city_date_price", "DailyPrices", "City, Date, Price"),
+    ],
+    "NEAREST_NECC_DB": [
+        ("idx_district_necc_map_district", "district_necc_map", "district, necc_city, distance"),
+        ("idx_necc_city_coordinates_city", "necc_city_coordinates", "city, latitude, longitude"),
+        ("idx_necc_top_districts_city_rank", "necc_top_districts", "necc_city, rank, nearby_district, distance"),
+    ],
+}
+
+# (description, db key, SQL, sample params) for each query shape used by the app
+APP_QUERIES = [
+    ("daily prices by range", "NECC_PRICES_DB",
+     "SELECT Date, Price FROM DailyPrices WHERE City = ? AND Date >= ? AND Date <= ? ORDER BY Date ASC",
+     ("x", "2000-01-01", "2000-12-31")),
+    ("latest price snapshot", "NECC_PRICES_DB", LATEST_PRICES_SQL.format(schema="", where=""), ()),
+    ("batch daily prices", "NECC_PRICES_DB",
+     "SELECT City, Date, Price FROM DailyPrices WHERE City IN (?, ?) AND Date < ? ORDER BY City ASC, Date ASC",
+     ("x", "y", "2000-01-01")),
+    ("monthly sums", "NECC_PRICES_DB", MONTHLY_SUMS_SQL.format(placeholders="?, ?"), ("x", "y")),
+    ("district to NECC city", "NEAREST_NECC_DB",
+     "SELECT necc_city, distance FROM district_necc_map WHERE district = ?", ("x",)),
+    ("city coordinates", "NEAREST_NECC_DB",
+     "SELECT latitude, longitude FROM necc_city_coordinates WHERE city = ?", ("x",)),
+    ("NECC city list", "NEAREST_NECC_DB", "SELECT DISTINCT city FROM necc_city_coordinates ORDER BY city", ()),
+    ("district list", "NEAREST_NECC_DB", "SELECT DISTINCT district FROM district_necc_map ORDER BY district", ()),
+    ("nearby districts", "NEAREST_NECC_DB",
+     "SELECT nearby_district, distance, rank FROM necc_top_districts WHERE necc_city = ? ORDER BY rank ASC LIMIT 5",
+     ("x",)),
+]
+
+
+def normalize_daily_price_dates(conn):
+    """
+    Rewrites DailyPrices.Date values to ISO 'YYYY-MM-DD' so string comparisons and index ranges are
+    chronological. Handles ISO timestamps and DD-MM-YYYY / DD/MM/YYYY. Returns (rewritten, unparseable).
+    """
+    with conn:
+        rewritten = conn.execute(
+            "UPDATE DailyPrices SET Date = date(Date) WHERE date(Date) IS NOT NULL AND Date != date(Date)").rowcount
+        rewritten += conn.execute(
+            "UPDATE DailyPrices SET Date = substr(Date, 7, 4) || '-' || substr(Date, 4, 2) || '-' || substr(Date, 1, 2) "
+            "WHERE (Date GLOB '[0-9][0-9]-[0-9][0-9]-[0-9][0-9][0-9][0-9]*' "
+            "OR Date GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]*') "
+            "AND date(substr(Date, 7, 4) || '-' || substr(Date, 4, 2) || '-' || substr(Date, 1, 2)) IS NOT NULL").rowcount
+    unparseable = conn.execute("SELECT COUNT(*) FROM DailyPrices WHERE date(Date) IS NULL OR Date != date(Date)").fetchone()[0]
+    return rewritten, unparseable
+
+
+def migrate_schema(normalize_dates=False, analyze=True):
+    """Creates missing indexes on both databases (and optionally normalizes dates). Returns created index names."""
+    created = []
+    for db_key, indexes in SCHEMA_INDEXES.items():
+        conn = sqlite3.connect(CONFIG[db_key])
+        try:
+            if db_key == "NECC_PRICES_DB" and normalize_dates:
+                rewritten, unparseable = normalize_daily_price_dates(conn)
+                logger.info(f"Normalized {rewritten} DailyPrices dates to ISO format.")
+                if unparseable:
+                    logger.warning(f"{unparseable} DailyPrices rows still have a date that is not 'YYYY-MM-DD'.")
+            existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            with conn:
+                for index_name, table, columns in indexes:
+                    if index_name not in existing:
+                        logger.info(f"Creating index {index_name} ON {table}({columns}) in {CONFIG[db_key]}.")
+                        conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table}({columns})")
+                        created.append(index_name)
+            if analyze:
+                conn.execute("ANALYZE")
+                conn.commit()
+        finally:
+            conn.close()
+    # Pooled read connections cache the old schema/statistics; reopen them
+    close_db_connections()
+    return created
+
+
+def check_query_plans():
+    """
+    Logs EXPLAIN QUERY PLAN for every query in APP_QUERIES and warns when a query scans a whole table
+    without an index. Returns the descriptions of the queries that do.
+    """
+    full_scans = []
+    for description, db_key, sql, params in APP_QUERIES:
+        try:
+            conn = get_db_connection(db_key)
+            try:
+                plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.warning(f"Could not explain query '{description}': {e}")
+            continue
+        logger.info(f"Query plan for {description}: {' | '.join(plan)}")
+        if any(step.startswith("SCAN") and "INDEX" not in step for step in plan):
+            logger.warning(f"Query '{description}' does a full table scan; run `flask migrate-schema`.")
+            full_scans.append(description)
+    return full_scans
+
+
+@app.cli.command("migrate-schema")
+@click.option("--normalize-dates", is_flag=True, help="Rewrite DailyPrices.Date values to ISO 'YYYY-MM-DD'.")
+@click.option("--no-analyze", is_flag=True, help="Skip ANALYZE after creating indexes.")
+def migrate_schema_command(normalize_dates, no_analyze):
+    """Create covering indexes on both databases and refresh planner statistics."""
+    created = migrate_schema(normalize_dates=normalize_dates, analyze=not no_analyze)
+    click.echo(f"Created {len(created)} index(es): {', '.join(created) or 'none needed'}.")
+    full_scans = check_query_plans()
+    if full_scans:
+        raise click.ClickException(f"Queries still doing full table scans: {', '.join(full_scans)}")
+
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """Log the query plan of every app query and fail if any does a full table scan."""
+    full_scans = check_query_plans()
+    if full_scans:
+        raise click.ClickException(f"Queries doing full table scans: {', '.join(full_scans)}")
+    click.echo("All app queries use indexes.")
+
+
+# --- Worker Startup ---
+# pandas, statsmodels and scipy are imported on first use, so a worker serving only lists and lookups
+# starts in a fraction of the time and memory. Under gunicorn with preload_app (see gunicorn.conf.py),
+# preload_for_workers() instead imports them once in the master together with the shared data, and
+# workers forked from it share those pages copy-on-write.
+
+def preload_for_workers():
+    """
+    Imports the deferred modules and loads the spatial and search indexes (and price store) before workers fork.
+    Also runs the startup query plan check (SCHEMA_CHECK_ON_STARTUP), as `python app.py` does.
+    """
+    started = time.perf_counter()
+    pd.DataFrame # First attribute access runs the deferred pandas import
+    import scipy.spatial
+    import statsmodels.tsa.holtwinters
+    get_necc_spatial_index()
+    get_location_search_index()
+    if CONFIG["PRICE_STORE_ENABLED"]:
+        get_price_store()
+    if app.config["CACHE_TYPE"] == "FileSystemCache":
+        # Its entries outlive the process and may predate databases replaced while the app was down
+        cache.clear()
+    if CONFIG["SCHEMA_CHECK_ON_STARTUP"]:
+        check_query_plans() # Warn early if any hot query would scan a whole table (missing indexes)
+    close_db_connections() # Workers open their own connections; sqlite3 handles must not cross a fork
+    # Objects allocated so far are never collected again, so collections in the workers don't write to
+    # (and un-share) the pages holding them
+    gc.freeze()
+    logger.info(f"Preloaded modules and shared data in {time.perf_counter() - started:.2f}s "
+                f"({gc.get_freeze_count()} objects frozen).")
+
+
+STARTUP_PROBE = """
+import importlib, json, resource, sys, time
+sys.path.insert(0, {app_dir!r})
+started = time.perf_counter()
+module = importlib.import_module({module_name!r})
+result = {{"import_seconds": time.perf_counter() - started, "routes": []}}
+heavy = ["pandas.core.frame", "statsmodels.tsa.holtwinters", "scipy.spatial"]
+rss_mb = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+result["rss_after_import_mb"] = rss_mb()
+client = module.app.test_client()
+for route in {routes!r}:
+    started = time.perf_counter()
+    status = client.get(route).status_code
+    result["routes"].append({{"route": route, "status": status, "seconds": time.perf_counter() - started,
+                             "rss_mb": rss_mb(), "loaded": [name for name in heavy if name in sys.modules]}})
+print(json.dumps(result))
+"""
+
+
+def run_startup_probe(routes):
+    """Imports the app in a fresh `python -X importtime` process and requests routes in order."""
+    probe = STARTUP_PROBE.format(app_dir=os.path.dirname(os.path.abspath(__file__)), module_name=__name__,
+                                 routes=list(routes))
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", probe],
+                               capture_output=True, text=True, check=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    # "import time: self [us] | cumulative [us] | <indent>name", children listed before their parent.
+    # Kept: the app module's direct imports, and top-level imports made later (the deferred ones, per route).
+    imports, children = [], []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        indent = len(name) - len(name.lstrip()) - 1
+        entry = (name.strip(), int(cumulative_us) / 1e6)
+        if indent == 2:
+            children.append(entry)
+        elif indent == 0:
+            imports.extend(children if entry[0] == __name__ else [entry])
+            children = []
+    result["slowest_imports"] = sorted(imports, key=lambda item: item[1], reverse=True)[:8]
+    return result
+
+
+@app.cli.command("startup-benchmark")
+@click.option("--runs", default=5, show_default=True, help="Fresh interpreter processes to measure.")
+@click.option("--route", "routes", multiple=True,
+              help="Route requested after the import, in order (repeatable). Default: a list, a lookup, "
+                   "prices, averages and a forecast.")
+@click.option("--output", type=click.Path(dir_okay=False), help="Append the summary as a JSON line to this file.")
+def startup_benchmark_command(runs, routes, output):
+    """Measure cold import time (-X importtime), max RSS and first-request cost of a fresh worker."""
+    routes = list(routes) or ["/api/districts", "/api/nearest?lat=20.6&lon=78.9", "/api/prices/necc/Hyderabad",
+                              "/api/averages/necc/Hyderabad", "/api/predict/necc/Hyderabad"]
+    results = [run_startup_probe(routes) for _ in range(runs)]
+
+    import_seconds = sorted(result["import_seconds"] for result in results)
+    summary = {
+        "measured_at": datetime.now(pytz.timezone(CONFIG['TIMEZONE'])).isoformat(timespec='seconds'),
+        "runs": runs,
+        "import_seconds_median": import_seconds[len(import_seconds) // 2],
+        "import_seconds_max": import_seconds[-1],
+        "rss_after_import_mb": max(result["rss_after_import_mb"] for result in results),
+        "slowest_imports": results[-1]["slowest_imports"],
+        "routes": [],
+    }
+    click.echo(f"import {__name__}: median {summary['import_seconds_median'] * 1000:.0f}ms, "
+               f"max {summary['import_seconds_max'] * 1000:.0f}ms, max RSS {summary['rss_after_import_mb']:.0f}MB")
+    for name, cumulative in summary["slowest_imports"]:
+        click.echo(f"  {name:30s} {cumulative * 1000:8.1f}ms")
+    for i, route in enumerate(routes):
+        route_results = [result["routes"][i] for result in results]
+        seconds = sorted(r["seconds"] for r in route_results)
+        route_summary = {"route": route, "status": route_results[-1]["status"],
+                         "first_request_seconds_median": seconds[len(seconds) // 2],
+                         "rss_mb": max(r["rss_mb"] for r in route_results), "loaded": route_results[-1]["loaded"]}
+        summary["routes"].append(route_summary)
+        click.echo(f"{route_summary['status']} {route_summary['first_request_seconds_median'] * 1000:8.1f}ms "
+                   f"{route_summary['rss_mb']:6.0f}MB {route} (loaded: {', '.join(route_summary['loaded']) or '-'})")
+    if output:
+        with open(output, "a") as f:
+            f.write(json.dumps(summary) + "\n")
+        click.echo(f"Appended results to {output}.")
 
 
 # --- Main Execution ---
@@ -692,6 +4567,10 @@ if __name__ == '__main__':
             # For this project context, exiting is acceptable.
             exit(1)
 
+    # Warn early if any hot query would scan a whole table (missing indexes)
+    if CONFIG["SCHEMA_CHECK_ON_STARTUP"]:
+        check_query_plans()
+
     # Check for 'templates' folder if render_template is used for '/'
     # Check if the root URL is handled by render_template
     root_uses_template = False
@@ -0,0 +1,17 @@
+# benchmarks/__init__.py
+# Performance benchmarks for app.py against a synthetic database (see synthetic_db.py).
+#
+#     pip install pytest pytest-benchmark
+#     python -m pytest benchmarks                            # run; results are saved to benchmarks/results
+#     python -m pytest benchmarks --benchmark-compare        # ...and compare with the previous saved run
+#     python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:15%
+#     python -m pytest benchmarks --synthetic-cities 200 --synthetic-years 20   # larger scale
+#
+# Every benchmark runs twice, "cold" (cache cleared before each round) and "warm" (cache primed once).
+# Saved runs carry the git commit, so `pytest-benchmark compare benchmarks/results/*/*.json` shows
+# regressions between revisions.
+#
+# benchmarks/load_test.py drives gunicorn with concurrent virtual users replaying dashboard sessions:
+#
+#     python -m benchmarks.load_test run --workers 4 --users 300 --duration 60
+#     python -m benchmarks.load_test compare benchmarks/results/load/*.json
@@ -0,0 +1,100 @@
+# benchmarks/bench_app.py
+# Hot helpers and every /api/* route, each measured cold and warm (see the `run` fixture in conftest.py).
+from datetime import date
+
+import pytest
+
+
+def bench_get_historical_daily_prices_df(run, egg_app, sample):
+    run(egg_app.get_historical_daily_prices_df, sample["city"])
+
+
+def bench_get_historical_daily_prices_df_range(run, egg_app, sample):
+    run(egg_app.get_historical_daily_prices_df, sample["city"], f"{sample['today'].year - 2}-01-01",
+        f"{sample['today'].year - 1}-06-30")
+
+
+def bench_generate_24_month_forecast(run, egg_app, sample):
+    # Cold rounds fit the Holt-Winters model (there is no forecast store in the synthetic directory)
+    run(egg_app.generate_24_month_forecast, sample["city"], sample["today"], rounds=5)
+
+
+def bench_calculate_dynamic_averages_from_forecast(run, egg_app, sample):
+    with egg_app.app.app_context():
+        forecast = egg_app.generate_24_month_forecast(sample["city"], sample["today"])
+    run(egg_app.calculate_dynamic_averages_from_forecast, forecast, sample["today"])
+
+
+def bench_get_averages(run, egg_app, sample):
+    run(egg_app.get_averages, "necc", sample["city"])
+
+
+# (id, method, path, body) of every /api/* route; {placeholders} are filled from the `sample` fixture.
+# The ingest body is the same row every round, i.e. an upsert that changes nothing.
+API_REQUESTS = [
+    ("necc_cities", "GET", "/api/necc_cities", None),
+    ("districts", "GET", "/api/districts", None),
+    ("necc_cities_locations_prices", "GET", "/api/necc_cities_locations_prices", None),
+    ("predict_necc", "GET", "/api/predict/necc/{city}", None),
+    ("predict_district", "GET", "/api/predict/district/{district}", None),
+    ("predict_batch", "GET", "/api/predict/batch?cities={cities_csv}", None),
+    ("prices_necc", "GET", "/api/prices/necc/{city}", None),
+    ("prices_range", "GET", "/api/prices/necc/{city}?start_date={last_year}-01-01", None),
+    ("prices_district", "GET", "/api/prices/district/{district}", None),
+    ("prices_csv", "GET", "/api/prices/necc/{city}?format=csv", None),
+    ("prices_chart_lttb", "GET", "/api/prices/necc/{city}?max_points=500", None),
+    ("prices_chart_auto", "GET", "/api/prices/necc/{city}?resolution=auto&max_points=200", None),
+    ("averages_necc", "GET", "/api/averages/necc/{city}", None),
+    ("averages_district", "GET", "/api/averages/district/{district}", None),
+    ("averages_batch", "GET", "/api/averages/batch?cities={cities_csv}", None),
+    ("compare", "GET", "/api/compare?cities={cities_csv}&start={last_year}-01-01&end={last_year}-12-31", None),
+    ("compare_all", "GET", "/api/compare?cities=all", None),
+    ("nearby_districts", "GET", "/api/nearby_districts/{city}", None),
+    ("search_prefix", "GET", "/api/search?q=dist&type=district&limit=20", None),
+    ("search_fuzzy", "GET", "/api/search?q={misspelled_city}", None),
+    ("nearest", "GET", "/api/nearest?lat={lat}&lon={lon}&k=5", None),
+    ("nearest_batch", "POST", "/api/nearest/batch", "nearest_points"),
+    ("backtest", "GET", "/api/backtest", None),
+    ("cache_stats", "GET", "/api/cache/stats", None),
+    ("ingest", "POST", "/api/ingest?refresh_forecasts=0", "City,Date,Price\n{city},{today},450.0\n"),
+]
+
+
+@pytest.fixture(scope="session")
+def backtest_run(egg_app, sample):
+    """
+    A one-city backtest run, so /api/backtest has a report to serve. The minimum history is the 36 months
+    of production, or what the synthetic data has before the first cutoff (two seasons at least).
+    Returns the number of evaluations stored.
+    """
+    year = sample["today"].year
+    with egg_app.app.app_context():
+        history = egg_app.get_monthly_avgs_for_cities_df([sample["city"]], date(year - 3, 12, 31)).get(sample["city"], ())
+        min_months = max(min(36, len(history)), 2 * egg_app.CONFIG["HW_SEASONAL_PERIODS_MONTHLY"])
+        _, evaluations = egg_app.run_backtest([egg_app.make_backtest_model_config("add", "mul", min_months)],
+                                              [sample["city"]], start_year=year - 2, end_year=year - 1)
+    return evaluations
+
+
+@pytest.mark.parametrize("request_id", [entry[0] for entry in API_REQUESTS])
+def bench_api(run, egg_app, sample, backtest_run, request_id):
+    _, method, path, body = next(entry for entry in API_REQUESTS if entry[0] == request_id)
+    if request_id == "backtest" and not backtest_run:
+        pytest.skip("Synthetic history too short for a backtest; generate it with more --years.")
+    placeholders = dict(sample, cities_csv=",".join(sample["cities"]), last_year=sample["today"].year - 1,
+                        misspelled_city=sample["city"][1:].lower())
+    kwargs = {}
+    if body == "nearest_points":
+        points = [{"lat": sample["lat"] + i * 0.01, "lon": sample["lon"]} for i in range(500)]
+        kwargs = {"json": {"points": points, "k": 3}}
+    elif body is not None:
+        kwargs = {"data": body.format(**placeholders), "headers": {"Authorization": "Bearer benchmark"}}
+    path = path.format(**placeholders)
+    client = egg_app.app.test_client()
+
+    def call():
+        response = client.open(path, method=method, **kwargs)
+        response.get_data() # Drain streamed bodies so their generation is measured
+        assert response.status_code == 200, f"{method} {path}: {response.status_code}"
+
+    run(call, rounds=5 if request_id.startswith(("predict", "compare")) else None)
@@ -0,0 +1,81 @@
+# benchmarks/conftest.py
+import os
+from datetime import date
+
+import pytest
+
+from benchmarks.synthetic_db import configure_app, generate
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("synthetic database")
+    group.addoption("--synthetic-dir", help="Use (or create) the synthetic databases in this directory "
+                                            "instead of a temporary one.")
+    group.addoption("--synthetic-cities", type=int, default=30)
+    group.addoption("--synthetic-years", type=float, default=10)
+    group.addoption("--synthetic-districts", type=int, default=600)
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    # Save runs next to the suite, wherever pytest is started from
+    if config.getoption("benchmark_storage", None) == "file://./.benchmarks":
+        config.option.benchmark_storage = f"file://{RESULTS_DIR}"
+
+
+@pytest.fixture(scope="session")
+def egg_app(request, tmp_path_factory):
+    """The app module, configured against a synthetic database generated once per session."""
+    out_dir = request.config.getoption("synthetic_dir") or str(tmp_path_factory.mktemp("synthetic"))
+    if not os.path.exists(os.path.join(out_dir, "necc_prices.db")):
+        generate(out_dir, cities=request.config.getoption("synthetic_cities"),
+                 years=request.config.getoption("synthetic_years"),
+                 districts=request.config.getoption("synthetic_districts"))
+    egg_app = configure_app(out_dir)
+    egg_app.CONFIG["INGEST_API_TOKEN"] = "benchmark"
+    egg_app.cache.clear()
+    return egg_app
+
+
+@pytest.fixture(scope="session")
+def sample(egg_app):
+    """Names used by the benchmarks: a city, one of its districts, several cities and a coordinate."""
+    conn = egg_app.get_db_connection("NEAREST_NECC_DB")
+    try:
+        city_rows = conn.execute("SELECT city, latitude, longitude FROM necc_city_coordinates ORDER BY city").fetchall()
+        district = conn.execute("SELECT district FROM district_necc_map WHERE necc_city = ? LIMIT 1",
+                                (city_rows[0]['city'],)).fetchone()['district']
+    finally:
+        conn.close()
+    return {
+        "city": city_rows[0]['city'],
+        "district": district,
+        "cities": [row['city'] for row in city_rows[:5]],
+        "lat": city_rows[0]['latitude'] + 0.3,
+        "lon": city_rows[0]['longitude'] - 0.2,
+        "today": date.today(),
+    }
+
+
+@pytest.fixture(params=["cold", "warm"])
+def run(request, benchmark, egg_app):
+    """
+    run(fn, *args) benchmarks fn: "cold" clears the cache before every round, "warm" calls fn once first.
+    Calls run inside an app context, like a request handler.
+    """
+    cache_state = request.param
+    benchmark.group = request.node.originalname
+    benchmark.extra_info["cache"] = cache_state
+
+    def clear_cache():
+        egg_app.cache.clear()
+
+    def runner(fn, *args, rounds=None):
+        with egg_app.app.app_context():
+            if cache_state == "cold":
+                return benchmark.pedantic(fn, args, setup=clear_cache, rounds=rounds or 10, iterations=1)
+            fn(*args)
+            return benchmark(fn, *args)
+    return runner
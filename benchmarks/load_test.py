@@ -0,0 +1,506 @@
+# benchmarks/load_test.py
+# Replays the dashboard's request mix against the app under gunicorn with many concurrent virtual users, and
+# reports latency percentiles per route, throughput and cache hit ratio:
+#
+#     python -m benchmarks.load_test run --workers 4 --users 300 --duration 60
+#     python -m benchmarks.load_test run --url http://127.0.0.1:8000 --users 100   # an already running server
+#     python -m benchmarks.load_test compare benchmarks/results/load/A.json benchmarks/results/load/B.json
+#
+# Without --url, gunicorn is started with gunicorn.conf.py against a synthetic database (see synthetic_db.py).
+# Each virtual user is one browser tab: it runs dashboard sessions modelled on static/script.js (see
+# dashboard_session), fetches at most BROWSER_CONNECTIONS URLs at a time and keeps its own HTTP cache, so
+# URLs it has seen are revalidated with If-None-Match like the browser does with max-age=0.
+import gzip
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from urllib.parse import quote, urlsplit
+
+import click
+import numpy as np
+
+try:
+    import brotli # Optional: without it the virtual users do not offer br, like browsers on plain http
+except ImportError:
+    brotli = None
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results", "load")
+BROWSER_CONNECTIONS = 6 # Concurrent HTTP/1.1 connections a browser opens per host
+MAX_COMPARE_CITIES = 8 # Most cities a simulated user compares (static/script.js has no limit)
+CHART_MAX_POINTS = 1440 # script.js asks for about one point per screen pixel; 1440 is a common laptop width
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli is not None else "gzip, deflate"
+SERVER_TIMING_CACHE = re.compile(r'cache;desc="hit (\d+), miss (\d+)"')
+
+# route: label that groups URLs in the report ("GET /api/predict/necc/<name>"); body: JSON for POSTs
+Fetch = namedtuple("Fetch", "route method path body")
+# One finished request: seconds since the run started, latency in seconds, Server-Timing cache lookups
+Sample = namedtuple("Sample", "route status started latency nbytes cache_hits cache_misses")
+
+
+def api_fetch(route, path, body=None):
+    return Fetch(route, "POST" if body is not None else "GET", path, body)
+
+
+def location_fetches(location_type, name, start_date=None, end_date=None):
+    """The three requests fetchDataForLocation makes concurrently for a selected city or district."""
+    quoted = quote(name, safe="")
+    prices_path = f"/api/prices/{location_type}/{quoted}?max_points={CHART_MAX_POINTS}"
+    if start_date:
+        prices_path += f"&start_date={start_date}&end_date={end_date}"
+    return [
+        api_fetch(f"GET /api/prices/{location_type}/<name>", prices_path),
+        api_fetch(f"GET /api/averages/{location_type}/<name>", f"/api/averages/{location_type}/{quoted}"),
+        api_fetch(f"GET /api/predict/{location_type}/<name>", f"/api/predict/{location_type}/{quoted}"),
+    ]
+
+
+def dashboard_session(rng, catalog, options):
+    """
+    One dashboard visit as a generator, following the fetch calls in static/script.js. It yields either a
+    list of Fetches (a wave the browser sends concurrently; the reply is the list of decoded responses) or
+    a number of seconds the user spends reading the page before the next interaction.
+    """
+    # Page load: the HTML and static assets, then $(document).ready fetches the dropdowns and map markers
+    yield [api_fetch("GET /", "/"), api_fetch("GET /static/*", "/static/style.css"),
+           api_fetch("GET /static/*", "/static/script.js")]
+    yield [api_fetch("GET /api/necc_cities", "/api/necc_cities"),
+           api_fetch("GET /api/necc_cities_locations_prices", "/api/necc_cities_locations_prices")]
+    # fetchAllPredictionsForConsolidatedTable, once the city list has arrived
+    yield [api_fetch("POST /api/predict/batch", "/api/predict/batch", {"cities": "all"})]
+
+    today = date.today()
+    start_date = date(today.year - 5, 1, 1).isoformat() # The trend chart's "last 5 years" range
+    for _ in range(int(rng.integers(1, options["max_selections"] + 1))):
+        yield float(rng.exponential(options["think_time"]))
+        if rng.random() < options["district_share"]:
+            location_type, name = "district", catalog["districts"][int(rng.integers(len(catalog["districts"])))]
+            # The district dropdown searches as the user types (select2 debounces keystrokes to ~1 request per pause)
+            for length in (3, 6):
+                if length <= len(name):
+                    query = quote(name[:length], safe="")
+                    yield [api_fetch("GET /api/search", f"/api/search?q={query}&type=district&limit=20")]
+                    yield float(rng.exponential(0.5))
+        else:
+            location_type, name = "necc", rng.choice(catalog["cities"], p=catalog["city_weights"])
+        prices, averages, prediction = yield location_fetches(location_type, name, start_date, today.isoformat())
+        # fetchNearbyDistrictsForMap runs after the prediction tells which NECC city a district maps to
+        effective_city = name if location_type == "necc" else (prediction or {}).get("city_name_used_for_prediction")
+        if effective_city:
+            yield [api_fetch("GET /api/nearby_districts/<name>", f"/api/nearby_districts/{quote(effective_city, safe='')}")]
+
+    if rng.random() < options["compare_share"]:
+        yield float(rng.exponential(options["think_time"]))
+        count = int(rng.integers(2, min(MAX_COMPARE_CITIES, len(catalog["cities"])) + 1))
+        cities = rng.choice(catalog["cities"], size=count, replace=False, p=catalog["city_weights"])
+        # fetchAllDataForComparison: one request for last year's prices and the forecasts of every compared city
+        year_ago = (today - timedelta(days=365)).isoformat()
+        cities_arg = quote(",".join(cities), safe=",")
+        yield [api_fetch("GET /api/compare", f"/api/compare?cities={cities_arg}&start={year_ago}&end={today.isoformat()}")]
+
+
+def decode_body(data, encoding):
+    if encoding == "gzip":
+        data = gzip.decompress(data)
+    elif encoding == "br":
+        data = brotli.decompress(data)
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+class VirtualUser:
+    """A browser tab: sends waves of Fetches with at most BROWSER_CONNECTIONS in flight and an ETag cache."""
+
+    def __init__(self, client, user_id, browser_cache):
+        self.client = client
+        self.user_id = user_id
+        self.browser_cache = browser_cache
+        self.http_cache = {} # path -> (etag, body, content coding)
+        self.connections = threading.Semaphore(BROWSER_CONNECTIONS)
+
+    def _fetch(self, fetch):
+        with self.connections:
+            return self.client.request(fetch, self.http_cache if self.browser_cache else None)
+
+    def fetch_wave(self, wave):
+        futures = [self.client.executor.submit(self._fetch, fetch) for fetch in wave]
+        return [future.result() for future in futures]
+
+    def run(self, catalog, options, start_delay, deadline):
+        rng = np.random.default_rng([options["seed"], self.user_id])
+        time.sleep(start_delay)
+        sessions = 0
+        while time.time() < deadline:
+            session = dashboard_session(rng, catalog, options)
+            reply = None
+            try:
+                while time.time() < deadline:
+                    step = session.send(reply)
+                    if isinstance(step, float):
+                        time.sleep(min(step, max(deadline - time.time(), 0)))
+                        reply = None
+                    else:
+                        reply = self.fetch_wave(step)
+                else:
+                    break
+            except StopIteration:
+                sessions += 1
+            time.sleep(min(float(rng.exponential(options["think_time"])), max(deadline - time.time(), 0)))
+        return sessions
+
+
+class LoadClient:
+    """HTTP side of one client process: a shared thread pool, one keep-alive connection per thread, samples."""
+
+    def __init__(self, base_url, max_threads, started_at):
+        url = urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="load-client")
+        self.started_at = started_at
+        self.samples = [] # list.append is atomic, so worker threads append without a lock
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=300)
+        return conn
+
+    def request(self, fetch, http_cache):
+        """Sends one Fetch, records its Sample and returns the decoded JSON body (or None)."""
+        headers = {"Accept-Encoding": ACCEPT_ENCODING, "User-Agent": "egg-price-portal-load-test"}
+        cached = http_cache.get(fetch.path) if http_cache is not None and fetch.method == "GET" else None
+        if cached is not None:
+            headers["If-None-Match"] = cached[0]
+        body = None
+        if fetch.body is not None:
+            body = json.dumps(fetch.body).encode()
+            headers["Content-Type"] = "application/json"
+
+        conn = self._connection()
+        started = time.time() - self.started_at
+        start = time.perf_counter()
+        try:
+            conn.request(fetch.method, fetch.path, body, headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close() # Reopened by the next request on this thread
+            self.samples.append(Sample(fetch.route, 0, started, time.perf_counter() - start, 0, 0, 0))
+            return None
+        latency = time.perf_counter() - start
+
+        lookups = SERVER_TIMING_CACHE.search(response.getheader("Server-Timing", ""))
+        hits, misses = (int(lookups.group(1)), int(lookups.group(2))) if lookups else (0, 0)
+        self.samples.append(Sample(fetch.route, response.status, started, latency, len(data), hits, misses))
+
+        if response.status == 304 and cached is not None:
+            return decode_body(cached[1], cached[2])
+        if response.status != 200:
+            return None
+        encoding = response.getheader("Content-Encoding", "identity")
+        etag = response.getheader("ETag")
+        if http_cache is not None and etag and fetch.method == "GET":
+            http_cache[fetch.path] = (etag, data, encoding)
+        if not response.getheader("Content-Type", "").startswith("application/json"):
+            return None
+        return decode_body(data, encoding)
+
+
+def run_client_process(base_url, user_ids, total_users, catalog, options, started_at):
+    """Runs the given virtual users until the deadline in this process. Returns (samples, sessions)."""
+    client = LoadClient(base_url, len(user_ids) * BROWSER_CONNECTIONS, started_at)
+    deadline = started_at + options["duration"]
+    users = [VirtualUser(client, user_id, options["browser_cache"]) for user_id in user_ids]
+    time.sleep(max(started_at - time.time(), 0))
+    with ThreadPoolExecutor(max_workers=len(users), thread_name_prefix="virtual-user") as runner:
+        futures = [runner.submit(user.run, catalog, options, options["ramp_up"] * user.user_id / total_users, deadline)
+                   for user in users]
+        sessions = sum(future.result() for future in futures)
+    client.executor.shutdown()
+    return [tuple(sample) for sample in client.samples], sessions
+
+
+def _client_process_entry(args):
+    return run_client_process(*args)
+
+
+# --- Server ---
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_json(base_url, path, timeout=10):
+    url = urlsplit(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        data = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"GET {path}: HTTP {response.status}")
+        return json.loads(data)
+    finally:
+        conn.close()
+
+
+def start_gunicorn(data_dir, workers, threads, preload, timeout, log_path):
+    """Starts gunicorn with gunicorn.conf.py against data_dir's databases. Returns (process, base_url)."""
+    port = free_port()
+    command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--workers", str(workers),
+               "--threads", str(threads), "--timeout", str(timeout), "--bind", f"127.0.0.1:{port}",
+               f"benchmarks.synthetic_db:configured_wsgi_app({data_dir!r})"]
+    env = dict(os.environ, GUNICORN_PRELOAD="1" if preload else "0")
+    with open(log_path, "ab") as log:
+        process = subprocess.Popen(command, cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException(f"gunicorn exited with status {process.returncode}; see {log_path}")
+        try:
+            get_json(base_url, "/api/necc_cities", timeout=5)
+            return process, base_url
+        except (OSError, RuntimeError, http.client.HTTPException):
+            time.sleep(0.25)
+    stop_gunicorn(process)
+    raise click.ClickException(f"gunicorn did not answer within 120s; see {log_path}")
+
+
+def stop_gunicorn(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def load_catalog(base_url, popularity_skew, seed):
+    """City and district names from the server; city popularity follows a Zipf law over a shuffled order."""
+    cities = sorted(city["name"] for city in get_json(base_url, "/api/necc_cities"))
+    districts = sorted(district["name"] for district in get_json(base_url, "/api/districts"))
+    if not cities:
+        raise click.ClickException(f"{base_url}/api/necc_cities returned no cities")
+    ranks = np.random.default_rng(seed).permutation(len(cities)) + 1
+    weights = 1.0 / ranks ** popularity_skew
+    return {"cities": cities, "districts": districts or cities, "city_weights": (weights / weights.sum()).tolist()}
+
+
+# --- Report ---
+
+def summarize(samples, warmup, sessions):
+    """Per-route and overall latency percentiles (ms), throughput and cache outcome counts."""
+    measured = [Sample(*sample) for sample in samples if sample[2] >= warmup]
+    if not measured:
+        raise click.ClickException("No requests completed after the warm-up; increase --duration")
+    window = max(sample.started + sample.latency for sample in measured) - warmup
+
+    def stats(group):
+        latencies = np.array([sample.latency for sample in group]) * 1000
+        statuses = np.array([sample.status for sample in group])
+        hits = sum(sample.cache_hits for sample in group)
+        misses = sum(sample.cache_misses for sample in group)
+        # A response is a cache hit when every memoized/body-cache lookup it made hit
+        hit_responses = sum(1 for s in group if s.status == 200 and s.cache_hits and not s.cache_misses)
+        miss_responses = sum(1 for s in group if s.status == 200 and s.cache_misses)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {
+            "requests": len(group),
+            "errors": int(np.count_nonzero((statuses == 0) | (statuses >= 400))),
+            "not_modified": int(np.count_nonzero(statuses == 304)),
+            "throughput_rps": round(len(group) / window, 2),
+            "p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2), "p99_ms": round(float(p99), 2),
+            "mean_ms": round(float(latencies.mean()), 2), "max_ms": round(float(latencies.max()), 2),
+            "response_bytes": int(sum(sample.nbytes for sample in group)),
+            "cache_hit_ratio": round(hit_responses / (hit_responses + miss_responses), 4)
+            if hit_responses + miss_responses else None,
+            "cache_lookups": {"hits": hits, "misses": misses},
+        }
+
+    routes = {}
+    for sample in measured:
+        routes.setdefault(sample.route, []).append(sample)
+    totals = stats(measured)
+    totals["sessions"] = sessions
+    totals["window_seconds"] = round(window, 2)
+    return {"routes": {route: stats(group) for route, group in sorted(routes.items())}, "totals": totals}
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def format_ms(value):
+    return f"{value:.1f}" if value is not None else "-"
+
+
+def print_report(report):
+    header = f"{'route':<44} {'reqs':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'err':>5} {'304':>6} {'hit%':>6}"
+    click.echo(header)
+    click.echo("-" * len(header))
+    rows = list(report["routes"].items()) + [("TOTAL", report["totals"])]
+    for route, stats in rows:
+        hit_ratio = f"{stats['cache_hit_ratio'] * 100:.1f}" if stats["cache_hit_ratio"] is not None else "-"
+        click.echo(f"{route:<44} {stats['requests']:>7} {stats['throughput_rps']:>8.1f} {format_ms(stats['p50_ms']):>8} "
+                   f"{format_ms(stats['p95_ms']):>8} {format_ms(stats['p99_ms']):>8} {format_ms(stats['max_ms']):>8} "
+                   f"{stats['errors']:>5} {stats['not_modified']:>6} {hit_ratio:>6}")
+    totals = report["totals"]
+    lookups = totals["cache_lookups"]
+    lookup_count = lookups["hits"] + lookups["misses"]
+    click.echo(f"\n{totals['sessions']} sessions, {totals['requests']} requests in {totals['window_seconds']}s "
+               f"({totals['throughput_rps']:.1f} req/s); cache lookups hit "
+               f"{(lookups['hits'] / lookup_count * 100 if lookup_count else 0):.1f}% of {lookup_count}. "
+               f"Latencies in ms.")
+
+
+# --- CLI ---
+
+@click.group()
+def main():
+    """Load test the dashboard API with virtual users replaying static/script.js sessions."""
+
+
+@main.command()
+@click.option("--url", help="Load test this running server instead of starting gunicorn.")
+@click.option("--workers", default=4, show_default=True, help="gunicorn worker processes.")
+@click.option("--threads", default=1, show_default=True, help="Threads per gunicorn worker.")
+@click.option("--preload/--no-preload", default=True, show_default=True, help="gunicorn preload_app.")
+@click.option("--synthetic-dir", type=click.Path(file_okay=False),
+              help="Serve the synthetic databases in this directory (generated if missing). Default: a temporary one.")
+@click.option("--synthetic-cities", default=30, show_default=True)
+@click.option("--synthetic-years", default=10.0, show_default=True)
+@click.option("--synthetic-districts", default=600, show_default=True)
+@click.option("--users", default=200, show_default=True, help="Concurrent virtual users (browser tabs).")
+@click.option("--duration", default=60.0, show_default=True, help="Seconds the users keep starting requests.")
+@click.option("--ramp-up", default=10.0, show_default=True, help="Seconds over which users start.")
+@click.option("--warmup", default=0.0, show_default=True,
+              help="Requests started in the first seconds are left out of the report (0 includes the cold start).")
+@click.option("--think-time", default=5.0, show_default=True, help="Mean seconds between a user's interactions.")
+@click.option("--max-selections", default=3, show_default=True, help="Max locations a user selects per session.")
+@click.option("--district-share", default=0.5, show_default=True, help="Share of selections that are districts.")
+@click.option("--compare-share", default=0.2, show_default=True, help="Share of sessions that compare cities.")
+@click.option("--popularity-skew", default=1.0, show_default=True,
+              help="Zipf exponent of city popularity (0 picks cities uniformly).")
+@click.option("--browser-cache/--no-browser-cache", default=True, show_default=True,
+              help="Revalidate URLs a user has seen with If-None-Match.")
+@click.option("--client-processes", type=int,
+              help="Processes the virtual users are spread over. Default: one per 100 users, at most 4.")
+@click.option("--seed", default=1, show_default=True)
+@click.option("--output", type=click.Path(dir_okay=False),
+              help="Report JSON path. Default: benchmarks/results/load/<time>_<commit>_<workers>w_<users>u.json")
+def run(url, workers, threads, preload, synthetic_dir, synthetic_cities, synthetic_years, synthetic_districts,
+        users, duration, ramp_up, warmup, client_processes, output, **session_options):
+    """Run a load test and save its report."""
+    options = dict(session_options, duration=duration, ramp_up=ramp_up)
+    process = None
+    with tempfile.TemporaryDirectory(prefix="egg-load-test-") as tmp_dir:
+        if url is None:
+            from benchmarks.synthetic_db import generate
+
+            data_dir = os.path.abspath(synthetic_dir or tmp_dir)
+            if not os.path.exists(os.path.join(data_dir, "necc_prices.db")):
+                click.echo(f"Generating synthetic databases in {data_dir} ...")
+                generate(data_dir, cities=synthetic_cities, years=synthetic_years, districts=synthetic_districts)
+            log_path = os.path.join(tmp_dir, "gunicorn.log")
+            process, url = start_gunicorn(data_dir, workers, threads, preload, timeout=300, log_path=log_path)
+            click.echo(f"gunicorn: {workers} workers x {threads} threads on {url}")
+        try:
+            catalog = load_catalog(url, options["popularity_skew"], options["seed"])
+            client_processes = client_processes or max(1, min(4, users // 100))
+            started_at = time.time() + 2 + client_processes # Time for the client processes to start
+            click.echo(f"{users} users over {client_processes} client process(es) for {duration}s "
+                       f"({len(catalog['cities'])} cities, {len(catalog['districts'])} districts) ...")
+            jobs = [(url, list(range(i, users, client_processes)), users, catalog, options, started_at)
+                    for i in range(client_processes)]
+            with multiprocessing.get_context("spawn").Pool(client_processes) as pool:
+                results = pool.map(_client_process_entry, jobs)
+        finally:
+            if process is not None:
+                stop_gunicorn(process)
+
+    samples = [sample for process_samples, _ in results for sample in process_samples]
+    report = summarize(samples, warmup, sum(sessions for _, sessions in results))
+    report["meta"] = {
+        "commit": git_revision(),
+        "started": datetime.fromtimestamp(started_at).isoformat(timespec="seconds"),
+        "url": url if process is None else None,
+        "workers": workers if process is not None else None,
+        "threads": threads if process is not None else None,
+        "preload": preload if process is not None else None,
+        "users": users, "warmup": warmup, "client_processes": client_processes,
+        "cities": len(catalog["cities"]), "districts": len(catalog["districts"]),
+        "options": options, "python": platform.python_version(), "cpu_count": os.cpu_count(),
+    }
+    print_report(report)
+
+    if output is None:
+        label = f"{workers}w" if process is not None else "url"
+        output = os.path.join(RESULTS_DIR, f"{datetime.fromtimestamp(started_at):%Y%m%d-%H%M%S}_"
+                                           f"{report['meta']['commit']}_{label}_{users}u.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    click.echo(f"Saved {output}")
+
+
+@main.command()
+@click.argument("reports", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--metric", "metrics", multiple=True, default=["p50_ms", "p95_ms", "p99_ms", "throughput_rps"],
+              show_default=True, help="Report fields to compare (repeatable).")
+def compare(reports, metrics):
+    """Compare saved reports route by route; changes are relative to the first report."""
+    loaded = []
+    for path in reports:
+        with open(path) as f:
+            loaded.append(json.load(f))
+    for i, (path, report) in enumerate(zip(reports, loaded)):
+        meta = report["meta"]
+        server = f"{meta['workers']} workers x {meta['threads']} threads" if meta["workers"] else meta["url"]
+        click.echo(f"[{i}] {os.path.basename(path)}: commit {meta['commit']}, {server}, {meta['users']} users, "
+                   f"{report['totals']['requests']} requests")
+
+    routes = sorted({route for report in loaded for route in report["routes"]}) + ["TOTAL"]
+    for metric in metrics:
+        click.echo(f"\n{metric}")
+        click.echo(f"{'route':<44}" + "".join(f"{f'[{i}]':>20}" for i in range(len(loaded))))
+        for route in routes:
+            values = [(report["totals"] if route == "TOTAL" else report["routes"].get(route, {})).get(metric)
+                      for report in loaded]
+            cells = []
+            for i, value in enumerate(values):
+                if value is None:
+                    cells.append("-")
+                elif i == 0 or not values[0]:
+                    cells.append(f"{value:.1f}")
+                else:
+                    cells.append(f"{value:.1f} ({(value - values[0]) / values[0] * 100:+.0f}%)")
+            click.echo(f"{route:<44}" + "".join(f"{cell:>20}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# benchmarks/synthetic_db.py
+# Builds necc_prices.db and nearest_necc.db with the app's schema at a chosen scale, so benchmarks
+# (and `python app.py`) can run without the production databases:
+#
+#     python -m benchmarks.synthetic_db OUT_DIR --cities 30 --years 10 --districts 600
+import math
+import os
+import sqlite3
+from datetime import date, timedelta
+
+import click
+import numpy as np
+from scipy.signal import lfilter
+
+# Rough bounding box of the Indian mainland, where NECC cities and districts are placed
+LATITUDE_RANGE = (8.5, 31.5)
+LONGITUDE_RANGE = (70.0, 90.0)
+
+
+def synthetic_city_names(count):
+    return [f"City{i:03d}" for i in range(count)]
+
+
+def synthetic_daily_prices(days, rng, base_price, trend_per_year, seasonal_amplitude, noise_sd):
+    """
+    Price series over `days` (datetime64[D]): linear trend, a yearly cycle peaking in winter (as egg prices
+    do) scaled by seasonal_amplitude (a fraction of the base price), and AR(1) noise with noise_sd in rupees.
+    """
+    years = (days - days[0]).astype(np.float64) / 365.25
+    day_of_year = (days - days.astype('datetime64[Y]')).astype(np.float64)
+    seasonal = seasonal_amplitude * base_price * np.cos(2 * math.pi * (day_of_year - 15) / 365.25)
+    # AR(1) noise, so day-to-day moves look like a market rather than white noise
+    noise = lfilter([1.0], [1.0, -0.9], rng.normal(0.0, noise_sd, len(days)))
+    return np.round(np.maximum(base_price + trend_per_year * years + seasonal + noise, 1.0), 2)
+
+
+def write_prices_db(path, city_names, years, end_date, trend_per_year, seasonal_amplitude, noise_sd,
+                    missing_fraction, rng):
+    """Creates DailyPrices (Date 'YYYY-MM-DD', City, Price) with `years` of history per city. Returns the row count."""
+    all_days = np.arange(np.datetime64(end_date - timedelta(days=round(years * 365.25))),
+                         np.datetime64(end_date + timedelta(days=1)))
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("CREATE TABLE DailyPrices (Date TEXT, City TEXT, Price REAL)")
+        rows = 0
+        with conn:
+            for city_name in city_names:
+                # Cities join at different times and skip some days (holidays, no quote), like the real table
+                start = int(rng.integers(0, max(len(all_days) // 4, 1)))
+                days = all_days[start:]
+                days = days[rng.random(len(days)) >= missing_fraction]
+                prices = synthetic_daily_prices(days, rng, rng.uniform(350, 550), rng.normal(trend_per_year, 3),
+                                                seasonal_amplitude * rng.uniform(0.7, 1.3), noise_sd)
+                conn.executemany("INSERT INTO DailyPrices (Date, City, Price) VALUES (?, ?, ?)",
+                                 zip(np.datetime_as_string(days).tolist(), [city_name] * len(days), prices.tolist()))
+                rows += len(days)
+    finally:
+        conn.close()
+    return rows
+
+
+def write_nearest_db(path, city_names, districts, top_n, rng):
+    """Creates necc_city_coordinates, then maps random district centroids with the app's KD-tree mapping."""
+    import app as egg_app # Deferred: configure_app must point the app at OUT_DIR first
+
+    latitudes = rng.uniform(*LATITUDE_RANGE, len(city_names))
+    longitudes = rng.uniform(*LONGITUDE_RANGE, len(city_names))
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("CREATE TABLE necc_city_coordinates (city TEXT, latitude REAL, longitude REAL)")
+        with conn:
+            conn.executemany("INSERT INTO necc_city_coordinates (city, latitude, longitude) VALUES (?, ?, ?)",
+                             zip(city_names, np.round(latitudes, 4).tolist(), np.round(longitudes, 4).tolist()))
+    finally:
+        conn.close()
+
+    # Districts cluster around the cities (within ~1.5 degrees), named after the city they were placed near
+    anchors = rng.integers(0, len(city_names), districts)
+    centroids = {}
+    for i, anchor in enumerate(anchors.tolist()):
+        centroids[f"{city_names[anchor]} District {i}"] = (
+            float(np.clip(latitudes[anchor] + rng.normal(0, 0.75), -90, 90)),
+            float(np.clip(longitudes[anchor] + rng.normal(0, 0.75), -180, 180)))
+    return egg_app.rebuild_district_tables(centroids, top_n=top_n)
+
+
+def configure_app(out_dir):
+    """Points the app's databases, on-disk stores and FileSystemCache directory at out_dir. Returns the app module."""
+    import app as egg_app
+
+    paths = {
+        "NECC_PRICES_DB": "necc_prices.db",
+        "NEAREST_NECC_DB": "nearest_necc.db",
+        "FORECAST_STORE_DB": "forecast_store.db",
+        "PRICE_STORE_DIR": "price_store",
+        "CACHE_DIR": "flask_cache",
+    }
+    for key, name in paths.items():
+        egg_app.CONFIG[key] = egg_app.app.config[key] = os.path.join(out_dir, name)
+    egg_app.cache.init_app(egg_app.app) # Reopen the cache backend in the new CACHE_DIR
+    egg_app.close_db_connections()
+    return egg_app
+
+
+def configured_wsgi_app(out_dir):
+    """gunicorn app factory: gunicorn -c gunicorn.conf.py 'benchmarks.synthetic_db:configured_wsgi_app("OUT_DIR")'"""
+    return configure_app(out_dir).app
+
+
+def generate(out_dir, cities=30, years=10, districts=600, top_n=5, end_date=None, trend_per_year=8.0,
+             seasonal_amplitude=0.08, noise_sd=4.0, missing_fraction=0.03, seed=1):
+    """
+    Writes necc_prices.db and nearest_necc.db (replacing existing ones) into out_dir, with the app's indexes.
+    Returns {"cities", "price_rows", "districts"}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for name in ("necc_prices.db", "nearest_necc.db"):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(os.path.join(out_dir, name + suffix)):
+                os.remove(os.path.join(out_dir, name + suffix))
+
+    rng = np.random.default_rng(seed)
+    egg_app = configure_app(out_dir)
+    city_names = synthetic_city_names(cities)
+    price_rows = write_prices_db(egg_app.CONFIG["NECC_PRICES_DB"], city_names, years, end_date or date.today(),
+                                 trend_per_year, seasonal_amplitude, noise_sd, missing_fraction, rng)
+    mapped_districts, _ = write_nearest_db(egg_app.CONFIG["NEAREST_NECC_DB"], city_names, districts, top_n, rng)
+    egg_app.migrate_schema()
+    return {"cities": len(city_names), "price_rows": price_rows, "districts": mapped_districts}
+
+
+@click.command()
+@click.argument("out_dir", type=click.Path(file_okay=False))
+@click.option("--cities", default=30, show_default=True, help="Number of NECC cities.")
+@click.option("--years", default=10.0, show_default=True, help="Years of daily history per city (at most).")
+@click.option("--districts", default=600, show_default=True, help="Number of districts mapped to cities.")
+@click.option("--top-n", default=5, show_default=True, help="Nearby districts ranked per city.")
+@click.option("--end-date", type=click.DateTime(formats=["%Y-%m-%d"]), help="Last day of history. Default: today.")
+@click.option("--trend", "trend_per_year", default=8.0, show_default=True, help="Mean price trend in rupees/year.")
+@click.option("--seasonal-amplitude", default=0.08, show_default=True,
+              help="Yearly cycle amplitude as a fraction of a city's base price.")
+@click.option("--noise", "noise_sd", default=4.0, show_default=True, help="Daily AR(1) shock SD in rupees.")
+@click.option("--missing-fraction", default=0.03, show_default=True, help="Fraction of days without a price.")
+@click.option("--seed", default=1, show_default=True)
+def main(out_dir, end_date, **options):
+    """Generate synthetic necc_prices.db and nearest_necc.db in OUT_DIR."""
+    summary = generate(out_dir, end_date=end_date.date() if end_date else None, **options)
+    click.echo(f"Wrote {summary['price_rows']} DailyPrices rows for {summary['cities']} cities and "
+               f"{summary['districts']} districts to {out_dir}.")
+
+
+if __name__ == "__main__":
+    main()
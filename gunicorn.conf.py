@@ -0,0 +1,29 @@
+# gunicorn.conf.py
+# gunicorn -c gunicorn.conf.py app:app
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# Each worker's forecast fit pool defaults to cpu_count // workers processes (see get_forecast_pool_size in
+# app.py), i.e. fits run inline with the default worker count; BATCH_FORECAST_MAX_WORKERS overrides it.
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+# Import app.py once in the master and fork the workers from it. Set GUNICORN_PRELOAD=0 to have each
+# worker import the app itself (needed for --reload; workers then import pandas/statsmodels on first use).
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+
+def when_ready(server):
+    # Runs in the master before any worker is spawned
+    if preload_app:
+        from app import preload_for_workers
+        preload_for_workers() # Includes the SCHEMA_CHECK_ON_STARTUP query plan check
+
+
+def post_worker_init(worker):
+    # Without preload the master never imports the app, so the first worker runs the startup query plan check
+    if not preload_app and worker.age == 1:
+        from app import CONFIG, check_query_plans
+        if CONFIG["SCHEMA_CHECK_ON_STARTUP"]:
+            check_query_plans()
@@ -0,0 +1,223 @@
+# size_aware_cache.py
+# Per-process flask-caching backend with a memory budget in bytes (CACHE_TYPE = "size_aware_cache.SizeAwareLRUCache").
+# Kept out of app.py so flask-caching can import it by name without importing the app module a second time.
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from flask_caching.backends.base import BaseCache
+
+
+class CompactArrays:
+    """
+    Compact stored form of a pandas Series/DataFrame or a tuple of NumPy arrays.
+    Day-precision DatetimeIndexes become int32 day ordinals, and float64 data that round-trips exactly at
+    `decimals` is kept as float32 (restored by rounding on decode, the same rule as the columnar price store).
+    """
+
+    __slots__ = ("kind", "arrays", "decimals", "meta")
+
+    def __init__(self, kind, arrays, decimals, meta):
+        self.kind = kind
+        self.arrays = arrays
+        self.decimals = decimals
+        self.meta = meta
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays) + 64 * len(self.arrays)
+
+    @staticmethod
+    def _pack_floats(values, decimals):
+        if values.dtype == np.float64 and decimals is not None and len(values):
+            values32 = values.astype(np.float32)
+            if np.array_equal(np.round(values32.astype(np.float64), decimals), values, equal_nan=True):
+                return values32, True
+        return values, False
+
+    @staticmethod
+    def _pack_index(index):
+        """int32 day ordinals of a non-empty, day-precision, naive DatetimeIndex; None for any other index."""
+        import pandas as pd
+
+        if isinstance(index, pd.DatetimeIndex) and index.tz is None and len(index):
+            days = index.to_numpy(dtype='datetime64[D]')
+            if np.array_equal(days.astype('datetime64[ns]'), index.to_numpy(dtype='datetime64[ns]')):
+                ordinals = days.astype(np.int64)
+                if ordinals.min() >= np.iinfo(np.int32).min and ordinals.max() <= np.iinfo(np.int32).max:
+                    return ordinals.astype(np.int32)
+        return None
+
+    @classmethod
+    def encode(cls, value, decimals):
+        """Returns a CompactArrays for value, or None if value has no compact form."""
+        if isinstance(value, tuple) and value and all(isinstance(v, np.ndarray) and v.dtype != object for v in value):
+            packed = [cls._pack_floats(v, decimals) for v in value]
+            return cls("tuple", [array for array, _ in packed], decimals, [rounded for _, rounded in packed])
+
+        if not type(value).__module__.startswith("pandas."):
+            return None # Not a pandas object; checked by module name so pandas itself is never imported here
+        import pandas as pd
+
+        if isinstance(value, pd.Series):
+            frame, kind = value.to_frame(name=0), "series"
+        elif isinstance(value, pd.DataFrame):
+            frame, kind = value, "frame"
+        else:
+            return None
+        if not all(dtype.kind in "fiub" for dtype in frame.dtypes) or frame.columns.has_duplicates:
+            return None
+        index = cls._pack_index(frame.index)
+        if index is None:
+            return None
+        columns, rounded = [], []
+        for column in frame.columns:
+            array, was_rounded = cls._pack_floats(frame[column].to_numpy(), decimals)
+            columns.append(array)
+            rounded.append(was_rounded)
+        meta = {"columns": list(frame.columns), "rounded": rounded, "index_name": frame.index.name,
+                "index_freq": frame.index.freqstr, "index_unit": frame.index.unit,
+                "series_name": value.name if kind == "series" else None}
+        return cls(kind, [index] + columns, decimals, meta)
+
+    def _unpack_floats(self, array, rounded):
+        return np.round(array.astype(np.float64), self.decimals) if rounded else array.copy()
+
+    def decode(self):
+        if self.kind == "tuple":
+            return tuple(self._unpack_floats(array, rounded) for array, rounded in zip(self.arrays, self.meta))
+
+        import pandas as pd
+
+        meta = self.meta
+        index = pd.DatetimeIndex(self.arrays[0].astype('datetime64[D]').astype(f'datetime64[{meta["index_unit"]}]'),
+                                 name=meta["index_name"], freq=meta["index_freq"])
+        data = {name: self._unpack_floats(array, rounded)
+                for name, array, rounded in zip(meta["columns"], self.arrays[1:], meta["rounded"])}
+        frame = pd.DataFrame(data, index=index, columns=meta["columns"])
+        if self.kind == "series":
+            return frame[0].rename(meta["series_name"])
+        return frame
+
+
+class SizeAwareLRUCache(BaseCache):
+    """
+    Thread-safe in-process cache bounded by bytes (CACHE_MAX_BYTES, instead of SimpleCache's entry count),
+    evicting least recently used entries first. pandas objects and NumPy array tuples are stored as
+    CompactArrays; anything else is pickled, like SimpleCache does, and counted by its pickled size.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, float32_decimals=2, default_timeout=300,
+                 ignore_delete_many_errors=False):
+        super().__init__(default_timeout=default_timeout, ignore_delete_many_errors=ignore_delete_many_errors)
+        self.max_bytes = max_bytes
+        self.float32_decimals = float32_decimals
+        self._entries = OrderedDict() # key -> (expires_at, stored, nbytes)
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expirations": 0, "rejected": 0,
+                       "compact_entries": 0}
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(max_bytes=config.get("CACHE_MAX_BYTES", 256 * 1024 * 1024),
+                      float32_decimals=config.get("CACHE_FLOAT32_DECIMALS", 2))
+        return cls(*args, **kwargs)
+
+    def _expires_at(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout > 0 else 0
+
+    def _encode(self, value):
+        compact = CompactArrays.encode(value, self.float32_decimals)
+        if compact is not None:
+            return compact, compact.nbytes
+        stored = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return stored, len(stored)
+
+    @staticmethod
+    def _decode(stored):
+        if isinstance(stored, CompactArrays):
+            return stored.decode()
+        return pickle.loads(stored)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+            if isinstance(entry[1], CompactArrays):
+                self._stats["compact_entries"] -= 1
+        return entry
+
+    def _live_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] != 0 and entry[0] <= time.time():
+            self._remove(key)
+            self._stats["expirations"] += 1
+            return None
+        return entry
+
+    def _evict(self):
+        while self._entries and self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries))) # Least recently used first
+            self._stats["evictions"] += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            stored = entry[1]
+        return self._decode(stored)
+
+    def set(self, key, value, timeout=None):
+        stored, nbytes = self._encode(value)
+        expires_at = self._expires_at(timeout)
+        with self._lock:
+            self._remove(key)
+            if nbytes > self.max_bytes:
+                self._stats["rejected"] += 1
+                return False
+            self._entries[key] = (expires_at, stored, nbytes)
+            self._bytes += nbytes
+            if isinstance(stored, CompactArrays):
+                self._stats["compact_entries"] += 1
+            self._stats["sets"] += 1
+            self._evict()
+        return True
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if self._live_entry(key) is not None:
+                return False
+            return self.set(key, value, timeout)
+
+    def delete(self, key):
+        with self._lock:
+            return self._remove(key) is not None
+
+    def has(self, key):
+        with self._lock:
+            return self._live_entry(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._stats["compact_entries"] = 0
+        return True
+
+    def occupancy(self):
+        """Entry count, bytes used against the budget and hit/eviction counters of this process's cache."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes,
+                         utilization=round(self._bytes / self.max_bytes, 4) if self.max_bytes else None)
+        return stats
@@ -15,7 +15,7 @@ let comparisonTrendChart = null;
 let comparisonPredictionChart = null; // For comparison: Calendar Year Prediction
 
 let consolidatedData = []; // Stores prediction data for all NECC cities for the consolidated table
-const MAX_COMPARE_CITIES = 4; // Set the maximum number of cities to compare
+// Any number of cities can be compared: /api/compare returns them all in one aligned, columnar response
 const comparisonColors = [
     'rgb(78, 115, 223)',  // Primary
     'rgb(231, 74, 59)',   // Danger
@@ -23,6 +23,12 @@ const comparisonColors = [
     'rgb(246, 194, 62)'   // Warning
 ];
 
+function comparisonColor(index) {
+    // Theme colours first, then hues spaced by the golden angle so many lines stay distinguishable
+    if (index < comparisonColors.length) return comparisonColors[index];
+    return `hsl(${Math.round((index - comparisonColors.length) * 137.508) % 360}, 65%, 50%)`;
+}
+
 // Placeholder for district coordinates - should ideally be fetched from the backend or a static file
 // Ensure this list is comprehensive and matches your DB/expected data
 const districtCoordinates = {
@@ -177,9 +183,11 @@ const districtCoordinates = {
     // Ensure this list is comprehensive as per your DB
 };
 
+// Price trend charts ask the server for at most about one point per screen pixel (downsampled, shape-preserving)
+const CHART_MAX_POINTS = Math.min(2000, Math.max(300, Math.round(window.screen.width || 1000)));
+
 // Store NECC cities for dropdowns and other logic
 let neccCitiesForDropdown = [];
-let districtsForDropdown = [];
 
 // Store fetched prediction data for the currently selected city
 let currentCityPredictionData = null;
@@ -203,10 +211,23 @@ $(document).ready(function() {
     showLoading("Initializing portal...");
 
     // Initialize Select2 dropdowns
-    $('#districtSelect').select2({ theme: "bootstrap-5", placeholder: "- Select District -" });
+    // Districts are looked up on the server as the user types (prefix and misspelling tolerant) instead of
+    // downloading the full district list up front
+    $('#districtSelect').select2({
+        theme: "bootstrap-5",
+        placeholder: "- Select District -",
+        minimumInputLength: 1,
+        ajax: {
+            url: '/api/search',
+            delay: 200,
+            data: params => ({ q: params.term, type: 'district', limit: 20 }),
+            processResults: data => ({
+                results: data.results.map(result => ({ id: result.name, text: result.name }))
+            })
+        }
+    });
     $('#neccCitySelect').select2({ theme: "bootstrap-5", placeholder: "- Select NECC City -" });
-    // Set maximumSelectionLength for the comparison modal Select2
-    $('#cityComparisonSelect').select2({ theme: "bootstrap-5", placeholder: `Select up to ${MAX_COMPARE_CITIES} cities`, allowClear: true, maximumSelectionLength: MAX_COMPARE_CITIES });
+    $('#cityComparisonSelect').select2({ theme: "bootstrap-5", placeholder: "Select cities to compare", allowClear: true });
 
 
     // Set current year in footer using Moment.js
@@ -286,7 +307,7 @@ $(document).ready(function() {
 
 
     // Fetch initial data (dropdowns, and default city view)
-    Promise.all([fetchNeccCities(), fetchDistricts()])
+    fetchNeccCities()
         .then(() => {
             // Populate comparison modal dropdown after NECC cities are fetched
             populateCityComparisonSelect();
@@ -345,27 +366,6 @@ function fetchNeccCities() {
         });
 }
 
-function fetchDistricts() {
-    return fetch('/api/districts')
-        .then(response => {
-             if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-             return response.json();
-        })
-        .then(districts => {
-            districtsForDropdown = districts.map(d => d.name).sort();
-            const select = $('#districtSelect');
-            select.empty().append(new Option('- Select District -', ''));
-            districtsForDropdown.forEach(district => {
-                select.append(new Option(district, district));
-            });
-        })
-        .catch(error => {
-            console.error('Error fetching districts:', error);
-            // Do not alert here, handled during overall initialization catch
-            throw error; // Propagate error
-        });
-}
-
 function fetchDataForLocation(locationName, type) {
     showLoading(`Loading data for ${locationName}...`);
     resetTabsToDefault(); // Reset to trends tab on new location selection
@@ -432,7 +432,8 @@ function fetchPriceHistory(locationName, type, startDate = null, endDate = null)
     const params = new URLSearchParams();
     if (startDate) params.append('start_date', startDate);
     if (endDate) params.append('end_date', endDate);
-    if (params.toString()) url += `?${params.toString()}`;
+    params.append('max_points', CHART_MAX_POINTS);
+    url += `?${params.toString()}`;
 
     return fetch(url)
         .then(response => {
@@ -506,13 +507,22 @@ function fetchAllPredictionsForConsolidatedTable() {
          return;
     }
 
-    const promises = neccCitiesForDropdown.map(city => {
-        // Fetch prediction data for each NECC city using the updated API
-        // Use catch here to prevent a single failed city from failing the whole Promise.all
-        return fetchPredictionData(city, 'necc')
-            .then(data => ({ name: city, ...data })) // Add city name to the data
-            .catch(err => {
-                console.warn(`Could not fetch prediction for consolidated table city ${city}: ${err.message || err}`);
+    // Fetch predictions for every NECC city in a single batch request instead of one request per city
+    // ("all" rather than the list, which may be longer than the server's per-request limit)
+    fetch('/api/predict/batch', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ cities: 'all' })
+    })
+        .then(response => {
+            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+            return response.json();
+        })
+        .then(predictionsByCity => {
+            consolidatedData = neccCitiesForDropdown.map(city => {
+                const data = predictionsByCity[city];
+                if (data) return { name: city, ...data }; // Add city name to the data
+                console.warn(`No prediction returned for consolidated table city ${city}`);
                 // Return a structure indicating failure for this city
                 return {
                     name: city,
@@ -525,18 +535,12 @@ function fetchAllPredictionsForConsolidatedTable() {
                        next_9_months_avg: null, next_12_months_avg: null, individual_next_12_months: []
                     },
                     distance_to_necc: null
-               };
+                };
             });
-    });
-
-    Promise.all(promises)
-        .then(results => {
-            consolidatedData = results.filter(r => r != null); // Keep all results, even those with empty data
             updateConsolidatedPredictionsTableDisplay();
             hideLoading();
         })
         .catch(error => {
-            // This catch should ideally not be hit if individual promises catch their errors
             console.error("Error fetching all predictions for consolidated table:", error);
             alert("Could not load consolidated predictions summary. Some data may be missing.");
             hideLoading();
@@ -1283,7 +1287,7 @@ function populateCityComparisonSelect() {
     const select = $('#cityComparisonSelect');
     select.empty(); // Clear existing options
      // Add a disabled default option if desired
-    select.append(new Option('Select up to 4 cities', '', false, true));
+    select.append(new Option('Select cities to compare', '', false, true));
 
     neccCitiesForDropdown.forEach(city => {
         select.append(new Option(city, city));
@@ -1297,14 +1301,6 @@ function handleCityComparisonChange() {
          resetComparisonView();
          return;
     }
-    if (selectedCities.length > MAX_COMPARE_CITIES) {
-        alert(`Please select no more than ${MAX_COMPARE_CITIES} cities for comparison.`);
-        // Trim the selection
-        const currentSelection = $('#cityComparisonSelect').val();
-        $('#cityComparisonSelect').val(currentSelection.slice(0, MAX_COMPARE_CITIES)).trigger('change.select2'); // Use change.select2 to notify Select2
-        return; // Exit function after showing alert and trimming
-    }
-
 
     $('#comparisonPrompt').hide();
     $('#comparisonChartsContainer').show();
@@ -1334,41 +1330,24 @@ function resetComparisonView() {
 function fetchAllDataForComparison(cities) {
     showLoading("Loading comparison data...");
 
-    // Fetch historical data for trends comparison
-    const trendPromises = cities.map(city =>
-        fetchPriceHistory(city, 'necc').catch(error => {
-            console.error(`Error fetching history for comparison city ${city}:`, error.message || error);
-            return { city, prices: [] }; // Return empty data on error
-        })
-    );
+    // One request returns every city's prices on a shared date axis plus their forecasts
+    // The comparison chart shows the last year, so only that range is requested
+    const params = new URLSearchParams({
+        cities: cities.join(','),
+        start: moment().subtract(1, 'year').format('YYYY-MM-DD'),
+        end: moment().format('YYYY-MM-DD')
+    });
 
-    // Fetch prediction data for prediction comparison (uses the updated API endpoint)
-    const predictionPromises = cities.map(city =>
-        fetchPredictionData(city, 'necc').catch(error => {
-            console.error(`Error fetching prediction for comparison city ${city}:`, error.message || error);
-            // Return structure matching the expected successful response, but with empty/null data
-            return {
-                city_name_used_for_prediction: city,
-                latest_price_info: { price: null, date: null },
-                full_24_month_forecast: [],
-                next_calendar_year_prediction: { year: moment().year(), avg_price: null, predictions: [] },
-                dynamic_averages_from_forecast: {
-                   next_1_month_avg: null, next_3_months_avg: null, next_6_months_avg: null,
-                   next_9_months_avg: null, next_12_months_avg: null, individual_next_12_months: []
-                },
-                distance_to_necc: null
-            };
+    fetch(`/api/compare?${params.toString()}`)
+        .then(response => {
+            if (!response.ok) {
+                 return response.json().then(err => { throw new Error(`HTTP error! status: ${response.status} - ${err.error || response.statusText}`); }).catch(() => { throw new Error(`HTTP error! status: ${response.status}`); });
+            }
+            return response.json();
         })
-    );
-
-    Promise.all([Promise.all(trendPromises), Promise.all(predictionPromises)])
-        .then(([trendResults, predictionResults]) => {
-
-            // Map results to include city name if not already present
-            const trends = trendResults.map((data, index) => ({ city: cities[index], prices: data.prices || [] }));
-            const predictions = predictionResults.map((data, index) => ({ city: cities[index], ...data }));
-
-            renderComparisonTrendChart(trends);
+        .then(comparison => {
+            const predictions = comparisonPredictionsFromForecast(comparison);
+            renderComparisonTrendChart(comparison);
             renderComparisonPredictionChart(predictions);
             populateComparisonTable(predictions);
             hideLoading();
@@ -1381,8 +1360,26 @@ function fetchAllDataForComparison(cities) {
         });
 }
 
+function comparisonPredictionsFromForecast(comparison) {
+    // Shapes the columnar forecast like the next_calendar_year_prediction of /api/predict, per city
+    const forecast = comparison.forecast;
+    // The month axis starts at the earliest forecast, so select the calendar year by month, not by position
+    const calendarYearIndexes = forecast.months
+        .map((month, i) => month.startsWith(`${forecast.year}-`) ? i : -1)
+        .filter(i => i >= 0);
+    return comparison.cities.map(city => ({
+        city,
+        city_name_used_for_prediction: city,
+        next_calendar_year_prediction: {
+            year: forecast.year,
+            avg_price: forecast.calendar_year_avg[city],
+            predictions: calendarYearIndexes.map(i => ({ month: forecast.months[i], price: forecast.prices[city][i] }))
+        }
+    }));
+}
+
 
-function renderComparisonTrendChart(cityTrendData) {
+function renderComparisonTrendChart(comparison) {
     if (comparisonTrendChart) {
         comparisonTrendChart.destroy();
     }
@@ -1402,26 +1399,19 @@ function renderComparisonTrendChart(cityTrendData) {
      }
 
 
-    // Use the last 1 year of data for each city for consistency if available
-    const comparisonPeriodInDays = 365;
-
-    const datasets = cityTrendData.map((data, index) => {
-        // Filter and map to {x: timestamp, y: price}, handling missing data
-        const cityPricesData = (data.prices || [])
-            .filter(p => p.price !== null && p.price !== undefined)
-            .map(p => ({
-                x: moment(p.date).valueOf(), // Use date timestamp
-                y: p.price
-            }));
-
-        // Get the last `comparisonPeriodInDays` data points if available
-        const recentCityPricesData = cityPricesData.slice(-comparisonPeriodInDays);
-
+    // Dates are shared by all cities, so they are parsed once
+    const timestamps = comparison.dates.map(date => moment(date).valueOf());
+    const datasets = comparison.cities.map((city, index) => {
+        // Map to {x: timestamp, y: price}, skipping days without a price (null)
+        const cityPricesData = [];
+        comparison.prices[city].forEach((price, i) => {
+            if (price !== null) cityPricesData.push({ x: timestamps[i], y: price });
+        });
 
         return {
-            label: data.city,
-            data: recentCityPricesData, // Use the potentially sliced data
-            borderColor: comparisonColors[index % comparisonColors.length],
+            label: city,
+            data: cityPricesData, // Already limited to the last year by fetchAllDataForComparison
+            borderColor: comparisonColor(index),
             fill: false,
             tension: 0.1,
             pointRadius: 0 // Don't show points for dense daily data
@@ -1502,7 +1492,7 @@ function renderComparisonPredictionChart(cityPredictionData) {
         return {
             label: data.city_name_used_for_prediction || data.name || `City ${index + 1}`, // Use effective city name if available
             data: predictionDataForChart,
-            borderColor: comparisonColors[index % comparisonColors.length],
+            borderColor: comparisonColor(index),
             fill: false,
             tension: 0.1,
              pointRadius: 3 // Show points for monthly data